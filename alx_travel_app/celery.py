@@ -18,6 +18,19 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+# Email and payment work get their own queues so an email backlog never
+# delays payments; run a worker per queue, e.g.
+#   celery -A alx_travel_app worker -Q payments,celery
+#   celery -A alx_travel_app worker -Q email
+# Tasks not listed here go to the default `celery` queue.
+app.conf.task_routes = {
+    'alx_travel_app.listings.tasks.send_booking_confirmation_email': {'queue': 'email'},
+    'alx_travel_app.listings.tasks.send_payment_confirmation_email': {'queue': 'email'},
+    'alx_travel_app.listings.tasks.flush_email_outbox': {'queue': 'email'},
+    'alx_travel_app.listings.tasks.initiate_payment': {'queue': 'payments'},
+    'alx_travel_app.listings.tasks.reconcile_pending_payments': {'queue': 'payments'},
+}
+
 
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import Listing, Booking, Review, Payment
+from .models import Listing, Booking, Review, Payment, OutboundEmail, RateRule
+
+
+class RateRuleInline(admin.TabularInline):
+    model = RateRule
+    extra = 0
+    fields = ['name', 'start_date', 'end_date', 'weekdays', 'price_per_night', 'priority']
 
 
 @admin.register(Listing)
@@ -8,10 +14,21 @@ class ListingAdmin(admin.ModelAdmin):
     list_filter = ['property_type', 'is_available', 'city', 'country']
     search_fields = ['title', 'description', 'address', 'city']
     readonly_fields = ['created_at', 'updated_at']
+    inlines = [RateRuleInline]
+
+
+@admin.register(RateRule)
+class RateRuleAdmin(admin.ModelAdmin):
+    list_select_related = ['listing']
+    list_display = ['listing', 'name', 'start_date', 'end_date', 'weekdays', 'price_per_night', 'priority']
+    list_filter = ['start_date']
+    search_fields = ['name', 'listing__title']
+    readonly_fields = ['created_at', 'updated_at']
 
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
+    list_select_related = ['listing']
     list_display = ['guest_name', 'listing', 'check_in', 'check_out', 'total_price', 'status', 'created_at']
     list_filter = ['status', 'check_in', 'check_out']
     search_fields = ['guest_name', 'guest_email', 'listing__title']
@@ -20,6 +37,7 @@ class BookingAdmin(admin.ModelAdmin):
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
+    list_select_related = ['listing']
     list_display = ['reviewer_name', 'listing', 'rating', 'created_at']
     list_filter = ['rating', 'created_at']
     search_fields = ['reviewer_name', 'listing__title', 'comment']
@@ -28,7 +46,16 @@ class ReviewAdmin(admin.ModelAdmin):
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
+    list_select_related = ['booking__listing']
     list_display = ['id', 'booking', 'amount', 'status', 'transaction_id', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['transaction_id', 'chapa_reference', 'booking__guest_name', 'booking__guest_email']
     readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'to', 'status', 'attempts', 'sent_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'to']
+    readonly_fields = ['created_at', 'updated_at', 'sent_at']
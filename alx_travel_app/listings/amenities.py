@@ -0,0 +1,113 @@
+"""
+Canonical amenity vocabulary.
+
+Each amenity owns one bit of ``Listing.amenity_flags``; "has WiFi and
+Parking" becomes ``amenity_flags & mask = mask``, a bitwise test on an
+integer column instead of a ``LIKE`` scan over ``Listing.amenities``.
+
+Bit positions are stored in the database, so new amenities must only ever
+be appended to ``AMENITIES``; never reorder or remove entries.
+"""
+import re
+
+from django.db.models import F
+
+
+# (code, label); the position in this list is the bit number.
+AMENITIES = [
+    ('wifi', 'WiFi'),
+    ('air_conditioning', 'Air Conditioning'),
+    ('parking', 'Parking'),
+    ('beach_access', 'Beach Access'),
+    ('fireplace', 'Fireplace'),
+    ('hot_tub', 'Hot Tub'),
+    ('mountain_view', 'Mountain View'),
+    ('gym_access', 'Gym Access'),
+    ('rooftop_terrace', 'Rooftop Terrace'),
+    ('hiking_trails', 'Hiking Trails'),
+    ('pet_friendly', 'Pet Friendly'),
+    ('garden', 'Garden'),
+    ('bbq_area', 'BBQ Area'),
+    ('kitchen', 'Kitchen'),
+    ('pool', 'Pool'),
+    ('washer', 'Washer'),
+    ('tv', 'TV'),
+    ('heating', 'Heating'),
+    ('workspace', 'Workspace'),
+    ('breakfast', 'Breakfast'),
+]
+
+AMENITY_BITS = {code: 1 << bit for bit, (code, _) in enumerate(AMENITIES)}
+
+# Spellings found in free-text amenities, keyed by their normalized form.
+_ALIASES = {
+    'wifi': 'wifi', 'wireless': 'wifi', 'internet': 'wifi',
+    'ac': 'air_conditioning', 'aircon': 'air_conditioning',
+    'freeparking': 'parking',
+    'gym': 'gym_access', 'fitnesscenter': 'gym_access',
+    'hottub': 'hot_tub', 'jacuzzi': 'hot_tub',
+    'bbq': 'bbq_area', 'barbecue': 'bbq_area', 'grill': 'bbq_area',
+    'petsallowed': 'pet_friendly', 'petfriendly': 'pet_friendly',
+    'swimmingpool': 'pool',
+    'washingmachine': 'washer', 'laundry': 'washer',
+    'television': 'tv', 'cabletv': 'tv',
+    'dedicatedworkspace': 'workspace',
+}
+for _code, _label in AMENITIES:
+    _ALIASES.setdefault(re.sub(r'[^a-z0-9]', '', _code), _code)
+    _ALIASES.setdefault(re.sub(r'[^a-z0-9]', '', _label.lower()), _code)
+
+
+def normalize(name):
+    """Return the canonical code for an amenity name, or None if unknown."""
+    return _ALIASES.get(re.sub(r'[^a-z0-9]', '', name.lower()))
+
+
+def parse_amenities(text):
+    """
+    Convert a comma-separated amenities string to a bitmask.
+
+    Unrecognized entries are ignored; they stay in the text field.
+
+    Args:
+        text: e.g. "WiFi, Air Conditioning, Parking"
+
+    Returns:
+        int: Bitmask of the recognized amenities
+    """
+    mask = 0
+    for name in (text or '').split(','):
+        code = normalize(name)
+        if code:
+            mask |= AMENITY_BITS[code]
+    return mask
+
+
+def mask_for(names):
+    """
+    Build the bitmask for a list of amenity names or codes.
+
+    Raises:
+        ValueError: If a name is not in the vocabulary
+    """
+    mask = 0
+    for name in names:
+        code = normalize(name)
+        if code is None:
+            raise ValueError(f"Unknown amenity: {name.strip()}")
+        mask |= AMENITY_BITS[code]
+    return mask
+
+
+def amenity_codes(mask):
+    """Return the canonical codes set in a bitmask."""
+    return [code for code, bit in AMENITY_BITS.items() if mask & bit]
+
+
+def with_amenities(queryset, mask):
+    """Restrict a Listing queryset to listings having every amenity in ``mask``."""
+    if not mask:
+        return queryset
+    return queryset.alias(
+        amenity_match=F('amenity_flags').bitand(mask)
+    ).filter(amenity_match=mask)
@@ -3,4 +3,9 @@ from django.apps import AppConfig
 
 class ListingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'listings'
+    name = 'alx_travel_app.listings'
+    label = 'listings'
+
+    def ready(self):
+        # Connect signal handlers.
+        from . import signals  # noqa: F401
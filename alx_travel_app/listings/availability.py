@@ -0,0 +1,322 @@
+"""
+Date-range availability for listings.
+
+A booking occupies the nights from ``check_in`` up to (but not including)
+``check_out``. Two bookings conflict when their night ranges intersect, i.e.
+``a.check_in < b.check_out and b.check_in < a.check_out``.
+
+The database is the source of truth: ``overlapping_bookings`` expresses the
+conflict test as a single range query served by the composite
+``(listing, check_in, check_out, status)`` index on ``Booking``. On top of it,
+each listing keeps a compact occupied-nights bitmap in the cache (one bit per
+night from a fixed origin date), so validating a booking against free dates
+does not query the bookings table. The bitmap is built lazily from the
+database and dropped by the ``Booking`` signal handlers after every committed
+change that affects it; it is never patched in place, since a
+read-modify-write of the cached value loses one of two concurrent changes.
+
+The bitmap only answers the validation-time check. Saving a booking always
+re-checks its dates against the database while the listing row is locked
+(see ``BookingSerializer``), because a change committed by another request
+may not have dropped the cached bitmap yet.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Booking
+
+
+# Bookings in these states hold their nights; cancelled bookings free them.
+BLOCKING_STATUSES = ('pending', 'confirmed', 'completed')
+
+OCCUPANCY_CACHE_KEY = 'listings:occupancy:{listing_id}'
+
+
+class OccupancyBitmap:
+    """
+    Occupied nights of a single listing, one bit per night.
+
+    Bit ``n`` represents the night starting on ``date.fromordinal(origin + n)``.
+    Nights before ``origin`` are not tracked; callers must fall back to the
+    database for them (see ``covers``).
+    """
+
+    __slots__ = ('origin', 'bits')
+
+    def __init__(self, origin, bits=None):
+        self.origin = origin
+        self.bits = bytearray(bits or b'')
+
+    @classmethod
+    def from_cache(cls, value):
+        origin, bits = value
+        return cls(origin, bits)
+
+    def to_cache(self):
+        return (self.origin, bytes(self.bits))
+
+    def covers(self, check_in):
+        """Return True if nights from ``check_in`` onwards are tracked."""
+        return check_in.toordinal() >= self.origin
+
+    def _offsets(self, check_in, check_out):
+        start = max(check_in.toordinal(), self.origin) - self.origin
+        end = check_out.toordinal() - self.origin
+        return start, end
+
+    def mark(self, check_in, check_out):
+        """Set the nights in ``[check_in, check_out)``."""
+        start, end = self._offsets(check_in, check_out)
+        if end <= start:
+            return
+        needed = (end + 7) // 8
+        if needed > len(self.bits):
+            self.bits.extend(bytes(needed - len(self.bits)))
+        for offset in range(start, end):
+            byte, bit = divmod(offset, 8)
+            self.bits[byte] |= 1 << bit
+
+    def is_free(self, check_in, check_out):
+        """Return True if no night in ``[check_in, check_out)`` is occupied."""
+        start, end = self._offsets(check_in, check_out)
+        end = min(end, len(self.bits) * 8)
+        offset = start
+        while offset < end:
+            byte, bit = divmod(offset, 8)
+            value = self.bits[byte]
+            if bit == 0 and end - offset >= 8:
+                # Whole byte inside the range: test all eight nights at once.
+                if value:
+                    return False
+                offset += 8
+                continue
+            if value & (1 << bit):
+                return False
+            offset += 1
+        return True
+
+    def occupied_nights(self, start, end):
+        """Yield every occupied night in ``[start, end)`` as a ``date``."""
+        first, last = self._offsets(start, end)
+        last = min(last, len(self.bits) * 8)
+        for offset in range(first, last):
+            byte, bit = divmod(offset, 8)
+            if self.bits[byte] & (1 << bit):
+                yield date.fromordinal(self.origin + offset)
+
+
+def overlapping_bookings(listing, check_in, check_out, exclude=None):
+    """
+    Return the blocking bookings of ``listing`` that overlap a date range.
+
+    Args:
+        listing: Listing instance or primary key
+        check_in: First night of the range
+        check_out: Departure date (the night before it is the last one)
+        exclude: Booking instance or primary key to ignore (e.g. when the
+            booking itself is being updated)
+
+    Returns:
+        QuerySet: Conflicting bookings
+    """
+    queryset = Booking.objects.filter(
+        listing=listing,
+        check_in__lt=check_out,
+        check_out__gt=check_in,
+        status__in=BLOCKING_STATUSES,
+    )
+    if exclude is not None:
+        queryset = queryset.exclude(pk=getattr(exclude, 'pk', exclude))
+    return queryset
+
+
+def free_listings(queryset, check_in, check_out):
+    """
+    Restrict a Listing queryset to listings free for a whole date range.
+
+    Implemented as a correlated ``NOT EXISTS`` anti-join so each candidate
+    listing costs one probe of the booking index instead of a scan.
+
+    Args:
+        queryset: Listing queryset to filter
+        check_in: First night of the range
+        check_out: Departure date
+
+    Returns:
+        QuerySet: Listings with no blocking booking in the range
+    """
+    conflicts = Booking.objects.filter(
+        listing=OuterRef('pk'),
+        check_in__lt=check_out,
+        check_out__gt=check_in,
+        status__in=BLOCKING_STATUSES,
+    )
+    return queryset.filter(~Exists(conflicts))
+
+
+def _by_listing(ranges):
+    grouped = defaultdict(list)
+    for index, (listing_id, check_in, check_out) in ranges.items():
+        grouped[listing_id].append((check_in, check_out, index))
+    for spans in grouped.values():
+        spans.sort()
+    return grouped
+
+
+def overlaps_within(ranges):
+    """
+    Find the requested ranges that overlap another range of the same request.
+
+    Args:
+        ranges: Dict of ``index -> (listing_id, check_in, check_out)``
+
+    Returns:
+        dict: ``index -> index of the earlier range it overlaps``
+    """
+    conflicts = {}
+    for spans in _by_listing(ranges).values():
+        latest_out, latest_index = None, None
+        for check_in, check_out, index in spans:
+            if latest_out is not None and check_in < latest_out:
+                conflicts[index] = latest_index
+            if latest_out is None or check_out > latest_out:
+                latest_out, latest_index = check_out, index
+    return conflicts
+
+
+def overlaps_existing(ranges, exclude=()):
+    """
+    Find the requested ranges that conflict with stored bookings.
+
+    All candidate bookings are loaded with a single query (one index range
+    per listing, spanning that listing's requested dates) and matched in
+    memory with a binary search, so the cost does not grow with one query
+    per range.
+
+    Args:
+        ranges: Dict of ``index -> (listing_id, check_in, check_out)``
+        exclude: Booking primary keys to ignore (bookings being rewritten)
+
+    Returns:
+        set: Indexes of the conflicting ranges
+    """
+    grouped = _by_listing(ranges)
+    if not grouped:
+        return set()
+    envelope = Q()
+    for listing_id, spans in grouped.items():
+        envelope |= Q(
+            listing_id=listing_id,
+            check_in__lt=max(check_out for _, check_out, _ in spans),
+            check_out__gt=spans[0][0],
+        )
+    existing = defaultdict(list)
+    rows = Booking.objects.filter(envelope, status__in=BLOCKING_STATUSES)
+    if exclude:
+        rows = rows.exclude(pk__in=exclude)
+    for listing_id, check_in, check_out in rows.values_list('listing_id', 'check_in', 'check_out'):
+        existing[listing_id].append((check_in, check_out))
+
+    conflicts = set()
+    for listing_id, booked in existing.items():
+        booked.sort()
+        starts = [check_in for check_in, _ in booked]
+        # Latest departure among the bookings that start at or before each one.
+        reach = list(accumulate((check_out for _, check_out in booked), max))
+        for check_in, check_out, index in grouped[listing_id]:
+            # Bookings starting before our departure; one of them conflicts
+            # if any still runs past our arrival.
+            position = bisect_left(starts, check_out)
+            if position and reach[position - 1] > check_in:
+                conflicts.add(index)
+    return conflicts
+
+
+def _cache_key(listing_id):
+    return OCCUPANCY_CACHE_KEY.format(listing_id=listing_id)
+
+
+def build_occupancy(listing_id):
+    """
+    Build a listing's bitmap from the database and store it in the cache.
+
+    Only bookings that end on or after today are loaded, so the cost depends
+    on upcoming bookings rather than on the listing's full history.
+    """
+    today = timezone.localdate()
+    bitmap = OccupancyBitmap(today.toordinal())
+    ranges = Booking.objects.filter(
+        listing_id=listing_id,
+        check_out__gt=today,
+        status__in=BLOCKING_STATUSES,
+    ).values_list('check_in', 'check_out')
+    for check_in, check_out in ranges.iterator():
+        bitmap.mark(check_in, check_out)
+    cache.set(_cache_key(listing_id), bitmap.to_cache(), settings.AVAILABILITY_CACHE_TIMEOUT)
+    return bitmap
+
+
+def get_occupancy(listing_id):
+    """Return the cached bitmap for a listing, building it if missing."""
+    cached = cache.get(_cache_key(listing_id))
+    if cached is not None:
+        return OccupancyBitmap.from_cache(cached)
+    return build_occupancy(listing_id)
+
+
+def is_available(listing, check_in, check_out, exclude=None):
+    """
+    Check whether ``listing`` is free for every night in a date range.
+
+    The bitmap answers the common case without querying bookings. The
+    database is consulted when the range starts before the bitmap origin,
+    when an existing booking must be excluded (its own nights are in the
+    bitmap), and to confirm a conflict before reporting it.
+
+    Args:
+        listing: Listing instance or primary key
+        check_in: First night of the range
+        check_out: Departure date
+        exclude: Booking instance or primary key to ignore
+
+    Returns:
+        bool: True if the dates can be booked
+    """
+    listing_id = getattr(listing, 'pk', listing)
+    if exclude is None:
+        bitmap = get_occupancy(listing_id)
+        if bitmap.covers(check_in) and bitmap.is_free(check_in, check_out):
+            return True
+    return not overlapping_bookings(listing_id, check_in, check_out, exclude).exists()
+
+
+def invalidate_occupancy(listing_id):
+    """Drop a listing's cached bitmap so the next read rebuilds it."""
+    cache.delete(_cache_key(listing_id))
+
+
+def invalidate_occupancy_many(listing_ids):
+    """Drop the cached bitmaps of several listings (after bulk writes)."""
+    cache.delete_many([_cache_key(listing_id) for listing_id in listing_ids])
+
+
+def record_booking_change(listing_id, previous, current):
+    """
+    Drop a listing's cached bitmap after a committed booking change.
+
+    Args:
+        listing_id: Listing the booking belongs to
+        previous: ``(check_in, check_out, status)`` before the change, or None
+            for a new booking
+        current: ``(check_in, check_out, status)`` after the change, or None
+            for a deleted booking
+    """
+    if any(span and span[2] in BLOCKING_STATUSES for span in (previous, current)):
+        invalidate_occupancy(listing_id)
@@ -0,0 +1,152 @@
+"""
+Per-listing availability calendars, one precomputed block per month.
+
+A block is a string with one character per day of the month describing the
+night that starts on that day:
+
+- ``0``: available
+- ``1``: held by a pending booking
+- ``2``: booked (confirmed or completed)
+
+Blocks live in the cache, keyed by a per-listing version. A month that is
+not cached is built from the bookings table, together with every other
+missing month of the same request, in one query, so repeated calendar
+views never query bookings. Any committed booking change that affects the
+calendar bumps the listing's version, which makes all of its blocks
+unreachable at once; the next view rebuilds them from the database.
+
+Blocks are never patched in place, like the occupancy bitmap: a
+read-modify-write of cached blocks loses one of two concurrent changes,
+and the loss would be served until the blocks expire.
+"""
+from calendar import monthrange
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .availability import BLOCKING_STATUSES
+from .models import Booking
+
+
+AVAILABLE, PENDING, BOOKED = '0', '1', '2'
+LEGEND = {AVAILABLE: 'available', PENDING: 'pending', BOOKED: 'booked'}
+
+VERSION_KEY = 'listings:calendar:version:{listing_id}'
+BLOCK_KEY = 'listings:calendar:{listing_id}:{version}:{month:%Y-%m}'
+
+
+def _day_code(status):
+    return PENDING if status == 'pending' else BOOKED
+
+
+def add_months(month, count):
+    """Return the first day of the month ``count`` months after ``month``."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_end(month):
+    return add_months(month, 1)
+
+
+def _version(listing_id):
+    return cache.get(VERSION_KEY.format(listing_id=listing_id), 0)
+
+
+def _block_keys(listing_id, version, months):
+    return {
+        month: BLOCK_KEY.format(listing_id=listing_id, version=version, month=month)
+        for month in months
+    }
+
+
+def _paint(block, month, check_in, check_out, code):
+    """Return ``block`` with the nights of ``[check_in, check_out)`` inside ``month`` set to ``code``."""
+    start = max(check_in, month)
+    end = min(check_out, _month_end(month))
+    if start >= end:
+        return block
+    first, last = start.day - 1, (end - month).days
+    return block[:first] + code * (last - first) + block[last:]
+
+
+def build_blocks(listing_id, months):
+    """
+    Build month blocks from the bookings table with one query.
+
+    Reads from the primary database, so a lagging replica can never leave
+    outdated blocks in the cache.
+
+    Args:
+        listing_id: Listing to build
+        months: First days of the months to build, in ascending order
+
+    Returns:
+        dict: ``month -> block``
+    """
+    blocks = {month: AVAILABLE * monthrange(month.year, month.month)[1] for month in months}
+    bookings = Booking.objects.using(DEFAULT_DB_ALIAS).filter(
+        listing_id=listing_id,
+        check_in__lt=_month_end(months[-1]),
+        check_out__gt=months[0],
+        status__in=BLOCKING_STATUSES,
+    ).values_list('check_in', 'check_out', 'status')
+    for check_in, check_out, status in bookings:
+        for month in months:
+            blocks[month] = _paint(blocks[month], month, check_in, check_out, _day_code(status))
+    return blocks
+
+
+def get_blocks(listing_id, first_month, count):
+    """
+    Return ``count`` consecutive month blocks of a listing, building missing ones.
+
+    Args:
+        listing_id: Listing to read
+        first_month: First day of the first month
+        count: Number of months
+
+    Returns:
+        list: ``(month, block)`` pairs in month order
+    """
+    months = [add_months(first_month, offset) for offset in range(count)]
+    keys = _block_keys(listing_id, _version(listing_id), months)
+    cached = cache.get_many(list(keys.values()))
+    blocks = {month: cached[key] for month, key in keys.items() if key in cached}
+    missing = [month for month in months if month not in blocks]
+    if missing:
+        built = build_blocks(listing_id, missing)
+        cache.set_many(
+            {keys[month]: block for month, block in built.items()},
+            settings.AVAILABILITY_CACHE_TIMEOUT,
+        )
+        blocks.update(built)
+    return [(month, blocks[month]) for month in months]
+
+
+def record_booking_change(listing_id, previous, current):
+    """
+    Invalidate a listing's blocks after a committed booking change.
+
+    Args:
+        listing_id: Listing the booking belongs to
+        previous: ``(check_in, check_out, status)`` before the change, or None
+            for a new booking
+        current: ``(check_in, check_out, status)`` after the change, or None
+            for a deleted booking
+    """
+    if any(span and span[2] in BLOCKING_STATUSES for span in (previous, current)):
+        invalidate_calendars([listing_id])
+
+
+def invalidate_calendars(listing_ids):
+    """Make every cached block of the listings unreachable."""
+    for listing_id in listing_ids:
+        key = VERSION_KEY.format(listing_id=listing_id)
+        if not cache.add(key, 1, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 1, None)
@@ -0,0 +1,157 @@
+"""
+HTTP client for the Chapa payment gateway.
+
+All calls from a process share one ``requests.Session`` whose connection pool
+keeps TCP/TLS connections to Chapa alive between payments. The session is
+created lazily and re-created after a fork, so pre-forking servers
+(gunicorn ``--preload``, Celery prefork) never share sockets between workers.
+
+Endpoints, credentials, timeouts and pool size come from the ``CHAPA_*``
+settings, so pointing ``CHAPA_API_URL``/``CHAPA_VERIFY_URL`` at a local stub
+(``python manage.py chapa_stub``) exercises the real HTTP path. The latency
+and status of every call are recorded in ``listings.metrics``.
+"""
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+
+def _is_transient(outcome):
+    """Return True for failures worth retrying: no response, 429 or 5xx."""
+    return outcome == 'error' or outcome == 429 or outcome >= 500
+
+
+class ChapaClient:
+    """
+    Thread-safe, connection-pooling Chapa client.
+
+    Request errors are returned as ``{'status': 'error', 'message': ...}``
+    so callers handle gateway failures and unsuccessful payments alike;
+    ``'retryable': True`` marks the ones that may succeed if repeated
+    (timeouts, connection errors, 429 and 5xx responses).
+    """
+
+    def __init__(self, secret_key=None, initialize_url=None, verify_url=None,
+                 connect_timeout=None, read_timeout=None, pool_maxsize=None):
+        self.secret_key = settings.CHAPA_SECRET_KEY if secret_key is None else secret_key
+        self.initialize_url = initialize_url or settings.CHAPA_API_URL
+        self.verify_url = verify_url or settings.CHAPA_VERIFY_URL
+        self.connect_timeout = connect_timeout or settings.CHAPA_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or settings.CHAPA_READ_TIMEOUT
+        self.pool_maxsize = pool_maxsize or settings.CHAPA_POOL_MAXSIZE
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    @property
+    def headers(self):
+        return {
+            'Authorization': f'Bearer {self.secret_key}',
+            'Content-Type': 'application/json',
+        }
+
+    @property
+    def session(self):
+        """Return the process-wide session, creating it on first use."""
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._build_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _build_session(self):
+        session = requests.Session()
+        session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _request(self, operation, method, url, **kwargs):
+        if not self.secret_key:
+            raise ValueError("CHAPA_SECRET_KEY is not configured")
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = self.session.request(
+                method,
+                url,
+                timeout=(self.connect_timeout, self.read_timeout),
+                **kwargs
+            )
+            outcome = response.status_code
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'retryable': _is_transient(outcome),
+            }
+        finally:
+            metrics.observe_chapa(operation, outcome, time.perf_counter() - started)
+
+    def initialize(self, payload):
+        """
+        Initialize a transaction.
+
+        Args:
+            payload: Request body for Chapa's initialize endpoint
+
+        Returns:
+            dict: Chapa API response
+        """
+        return self._request('initialize', 'POST', self.initialize_url, json=payload)
+
+    def verify(self, transaction_id):
+        """
+        Verify a transaction.
+
+        Args:
+            transaction_id: Transaction reference (tx_ref)
+
+        Returns:
+            dict: Chapa API response
+        """
+        return self._request('verify', 'GET', f"{self.verify_url}{transaction_id}")
+
+    def close(self):
+        """Close pooled connections."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared ``ChapaClient`` for this process."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ChapaClient()
+    return _client
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    """Drop the shared client when a CHAPA_* setting is overridden."""
+    global _client
+    if setting.startswith('CHAPA_'):
+        with _client_lock:
+            if _client is not None:
+                _client.close()
+            _client = None
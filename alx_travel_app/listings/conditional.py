@@ -0,0 +1,116 @@
+"""
+Conditional GET support (ETag / Last-Modified) for API viewsets.
+
+Validators are computed with a single cheap query before anything is
+serialized: ``MAX(updated_at)`` and ``COUNT(*)`` over the filtered queryset
+for list views, the row's ``updated_at`` for detail views. Related rows
+whose fields appear in the representation (e.g. a booking's listing title)
+contribute their ``updated_at`` as well. A matching ``If-None-Match`` or
+``If-Modified-Since`` is answered with 304 straight away.
+
+Views whose responses are already keyed by version counters can override
+``list_validators``/``detail_validators`` to derive the ETag from those
+instead, which needs no query at all. The hooks return None when the
+response should go out without validators.
+"""
+import hashlib
+from calendar import timegm
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin adding ETag/Last-Modified to ``list`` and ``retrieve``.
+
+    Set ``validator_fields`` to the ``updated_at`` lookups that together
+    determine the serialized representation.
+    """
+    validator_fields = ('updated_at',)
+
+    def _validators(self, request, *parts):
+        """Return ``(etag, last_modified_timestamp)`` for the given parts."""
+        timestamps = [value for value in parts[-1] if value is not None]
+        last_modified = max(timestamps) if timestamps else None
+        raw = '|'.join([
+            type(self).__name__,
+            request.get_full_path(),
+            *(str(part) for part in parts[:-1]),
+            *(value.isoformat() for value in timestamps),
+        ])
+        etag = quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+        if last_modified is not None:
+            last_modified = timegm(last_modified.utctimetuple())
+        return etag, last_modified
+
+    def _conditional(self, request, etag, last_modified, build):
+        not_modified = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        response = not_modified if not_modified is not None else build()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list_validators(self, request):
+        """
+        Return ``(etag, last_modified_timestamp)`` of the list response.
+
+        Returns:
+            tuple: The validators, or None to send the list without them
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        aggregates = queryset.order_by().aggregate(
+            count=Count('pk'),
+            **{f'max_{i}': Max(field) for i, field in enumerate(self.validator_fields)}
+        )
+        count = aggregates.pop('count')
+        return self._validators(request, count, list(aggregates.values()))
+
+    def detail_validators(self, request, lookup_value):
+        """
+        Return ``(etag, last_modified_timestamp)`` of a detail response.
+
+        Returns:
+            tuple: The validators, or None if no object matches
+        """
+        try:
+            row = (
+                self.get_queryset()
+                .filter(**{self.lookup_field: lookup_value})
+                .values_list(*self.validator_fields)
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            # Malformed lookup value, e.g. /api/listings/abc/.
+            raise Http404
+        if row is None:
+            return None
+        return self._validators(request, list(row))
+
+    def list(self, request, *args, **kwargs):
+        validators = self.list_validators(request)
+        if validators is None:
+            return super().list(request, *args, **kwargs)
+        etag, last_modified = validators
+        return self._conditional(
+            request, etag, last_modified,
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        validators = self.detail_validators(request, kwargs[lookup])
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag, last_modified = validators
+        return self._conditional(
+            request, etag, last_modified,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
@@ -0,0 +1,191 @@
+"""
+Batched delivery of transactional emails.
+
+Emails are written to the ``OutboundEmail`` table instead of being sent
+right away. A flush task drains the table in batches of
+``EMAIL_BATCH_SIZE`` over a single SMTP connection, so one TCP+TLS
+handshake and login is paid per batch rather than per message.
+
+A flush runs ``EMAIL_BATCH_WINDOW`` seconds after the first email of a
+window is queued, or immediately once ``EMAIL_BATCH_SIZE`` emails are
+waiting, whichever comes first. The beat schedule also flushes
+periodically in case a scheduled flush is lost.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SCHEDULED_KEY = 'listings:email:flush-scheduled'
+QUEUED_COUNT_KEY = 'listings:email:queued'
+
+
+def queue_email(subject, body, recipient, from_email=None):
+    """
+    Queue an email for the next batch.
+
+    Args:
+        subject: Email subject
+        body: Plain text body
+        recipient: Recipient address
+        from_email: Sender (defaults to DEFAULT_FROM_EMAIL)
+
+    Returns:
+        OutboundEmail: The queued row
+    """
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=recipient,
+    )
+    transaction.on_commit(_schedule_flush)
+    return email
+
+
+def _schedule_flush():
+    from .tasks import flush_email_outbox
+
+    if cache.add(FLUSH_SCHEDULED_KEY, True, settings.EMAIL_BATCH_WINDOW):
+        # First email of a window: restart the count, since the emails
+        # counted before were covered by the previous flush.
+        queued = 1
+        cache.set(QUEUED_COUNT_KEY, queued, settings.EMAIL_BATCH_WINDOW * 10)
+        flush_email_outbox.apply_async(countdown=settings.EMAIL_BATCH_WINDOW)
+    else:
+        cache.add(QUEUED_COUNT_KEY, 0, settings.EMAIL_BATCH_WINDOW * 10)
+        try:
+            queued = cache.incr(QUEUED_COUNT_KEY)
+        except ValueError:
+            queued = 1
+    if queued >= settings.EMAIL_BATCH_SIZE:
+        cache.delete(QUEUED_COUNT_KEY)
+        flush_email_outbox.delay()
+
+
+def _claim_batch():
+    """
+    Claim up to ``EMAIL_BATCH_SIZE`` emails by moving them to ``sending``.
+
+    The rows are selected with ``SELECT ... FOR UPDATE SKIP LOCKED`` and
+    claimed in one short transaction, so concurrent flushes never pick the
+    same email and no lock is held while talking to the mail server.
+    Emails left in ``sending`` for ``EMAIL_SENDING_TIMEOUT`` seconds are
+    claimed again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_SENDING_TIMEOUT)
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending') | Q(status='sending', updated_at__lt=stale))
+            .order_by('id')[:settings.EMAIL_BATCH_SIZE]
+        )
+        for email in batch:
+            email.status = 'sending'
+            email.updated_at = now
+        OutboundEmail.objects.bulk_update(batch, ['status', 'updated_at'])
+    return batch
+
+
+def send_batch(connection=None):
+    """
+    Send up to ``EMAIL_BATCH_SIZE`` pending emails over one connection.
+
+    The batch is claimed first (see ``_claim_batch``), then sent outside
+    any transaction, and the outcomes are stored with one ``bulk_update``.
+    A message that fails goes back to ``pending`` and is retried by later
+    batches until ``EMAIL_MAX_ATTEMPTS`` is reached, then marked failed.
+
+    Returns:
+        dict: Batch size, sent and failed counts and duration in ms
+    """
+    started = time.perf_counter()
+    stats = {'size': 0, 'sent': 0, 'failed': 0, 'duration_ms': 0.0}
+    batch = _claim_batch()
+    if not batch:
+        return stats
+    stats['size'] = len(batch)
+
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for email in batch:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=[email.to],
+                connection=connection,
+            )
+            email.attempts += 1
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                email.last_error = str(e)
+                if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                    email.status = 'failed'
+                    stats['failed'] += 1
+                else:
+                    email.status = 'pending'
+            else:
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+                stats['sent'] += 1
+    except Exception:
+        # The connection failed: release the unsent emails for the next flush.
+        for email in batch:
+            if email.status == 'sending':
+                email.status = 'pending'
+        raise
+    finally:
+        connection.close()
+        now = timezone.now()
+        for email in batch:
+            email.updated_at = now
+        OutboundEmail.objects.bulk_update(
+            batch, ['status', 'attempts', 'last_error', 'sent_at', 'updated_at']
+        )
+
+    stats['duration_ms'] = (time.perf_counter() - started) * 1000
+    logger.info(
+        "email batch size=%d sent=%d failed=%d duration_ms=%.1f",
+        stats['size'], stats['sent'], stats['failed'], stats['duration_ms'],
+    )
+    return stats
+
+
+def flush_outbox():
+    """
+    Send pending emails until the queue is drained.
+
+    Stops after a batch in which nothing was sent, so an unreachable mail
+    server does not keep the flush spinning; the remaining emails are
+    picked up by the next flush.
+
+    Returns:
+        dict: Totals over all batches
+    """
+    cache.delete(FLUSH_SCHEDULED_KEY)
+    totals = {'batches': 0, 'sent': 0, 'failed': 0}
+    while True:
+        stats = send_batch()
+        if not stats['size']:
+            break
+        totals['batches'] += 1
+        totals['sent'] += stats['sent']
+        totals['failed'] += stats['failed']
+        if not stats['sent'] or stats['size'] < settings.EMAIL_BATCH_SIZE:
+            break
+    return totals
@@ -0,0 +1,125 @@
+"""
+Streaming NDJSON/CSV exports.
+
+Rows are read in primary-key keyset batches (``id > last_id LIMIT n``)
+with ``select_related`` and written to a ``StreamingHttpResponse`` as they
+are produced, so memory stays bounded by one batch however many rows are
+exported. Batching by key rather than relying on ``QuerySet.iterator()``
+alone keeps memory flat on MySQL too, where the driver would otherwise
+buffer the whole result set.
+"""
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+BOOKING_COLUMNS = [
+    ('id', lambda b: b.id),
+    ('listing_id', lambda b: b.listing_id),
+    ('listing_title', lambda b: b.listing.title),
+    ('guest_name', lambda b: b.guest_name),
+    ('guest_email', lambda b: b.guest_email),
+    ('guest_phone', lambda b: b.guest_phone),
+    ('check_in', lambda b: b.check_in),
+    ('check_out', lambda b: b.check_out),
+    ('number_of_guests', lambda b: b.number_of_guests),
+    ('total_price', lambda b: b.total_price),
+    ('status', lambda b: b.status),
+    ('created_at', lambda b: b.created_at),
+    ('updated_at', lambda b: b.updated_at),
+]
+
+PAYMENT_COLUMNS = [
+    ('id', lambda p: p.id),
+    ('booking_id', lambda p: p.booking_id),
+    ('guest_name', lambda p: p.booking.guest_name),
+    ('guest_email', lambda p: p.booking.guest_email),
+    ('listing_title', lambda p: p.booking.listing.title),
+    ('transaction_id', lambda p: p.transaction_id),
+    ('amount', lambda p: p.amount),
+    ('status', lambda p: p.status),
+    ('chapa_reference', lambda p: p.chapa_reference),
+    ('created_at', lambda p: p.created_at),
+    ('updated_at', lambda p: p.updated_at),
+]
+
+
+def _plain(value):
+    """Convert a model value to its export form (strings for dates/decimals)."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def iter_rows(queryset, columns, chunk_size):
+    """Yield each row of ``queryset`` as a list of plain values, by keyset batches."""
+    last_id = None
+    queryset = queryset.order_by('pk')
+    while True:
+        batch = queryset if last_id is None else queryset.filter(pk__gt=last_id)
+        batch = list(batch[:chunk_size].iterator(chunk_size=chunk_size))
+        if not batch:
+            return
+        last_id = batch[-1].pk
+        for obj in batch:
+            yield [_plain(getter(obj)) for _, getter in columns]
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the value (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def _ndjson_lines(rows, names):
+    if orjson is not None:
+        for row in rows:
+            yield orjson.dumps(dict(zip(names, row))) + b'\n'
+    else:
+        for row in rows:
+            yield (json.dumps(dict(zip(names, row))) + '\n').encode()
+
+
+def _csv_lines(rows, names):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_response(queryset, columns, output, filename):
+    """
+    Build a streaming export response.
+
+    Args:
+        queryset: Rows to export, with filters and select_related applied
+        columns: List of ``(name, getter)`` pairs
+        output: ``'ndjson'`` or ``'csv'``
+        filename: Download name without extension
+
+    Returns:
+        StreamingHttpResponse
+    """
+    names = [name for name, _ in columns]
+    rows = iter_rows(queryset, columns, settings.EXPORT_CHUNK_SIZE)
+    lines = _csv_lines(rows, names) if output == 'csv' else _ndjson_lines(rows, names)
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
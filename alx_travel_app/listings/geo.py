@@ -0,0 +1,172 @@
+"""
+Radius search over ``Listing.latitude``/``longitude`` without a spatial
+database.
+
+Each located listing stores ``geo_cell``: its position on a 2^26 x 2^26
+latitude/longitude grid as a Z-order (Morton) code, i.e. the grid column
+and row with their bits interleaved. This is an integer geohash: the
+listings of any coarser grid cell, down to the whole world, share a code
+prefix and so occupy one contiguous range of codes. A radius search
+
+1. computes the bounding box of the search circle (split in two when it
+   crosses the antimeridian, widened to every longitude near a pole);
+2. covers the box with at most ``MAX_CELLS`` cells of the finest level
+   that allows it, merging neighbouring codes into ranges;
+3. filters ``geo_cell`` by those ranges, which the ``geo_cell`` index
+   serves as a handful of range scans, then by the box itself;
+4. computes the exact haversine distance in SQL for the rows left, keeps
+   those within the radius and annotates it as ``distance`` (km) so results
+   can be sorted nearest first.
+
+Everything is plain integer and float arithmetic, so it runs the same on
+MySQL and SQLite (Django registers the trigonometric functions there).
+"""
+from math import asin, cos, degrees, radians, sin
+
+from django.db.models import ExpressionWrapper, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+
+EARTH_RADIUS_KM = 6371.0088
+GRID_BITS = 26
+GRID_SIZE = 1 << GRID_BITS
+# Most cells covering one search; each becomes (at most) one range scan.
+MAX_CELLS = 16
+
+
+def _spread(value):
+    """Insert a zero bit above each of the low 32 bits of ``value``."""
+    value &= 0xFFFFFFFF
+    value = (value | value << 16) & 0x0000FFFF0000FFFF
+    value = (value | value << 8) & 0x00FF00FF00FF00FF
+    value = (value | value << 4) & 0x0F0F0F0F0F0F0F0F
+    value = (value | value << 2) & 0x3333333333333333
+    value = (value | value << 1) & 0x5555555555555555
+    return value
+
+
+def _interleave(column, row):
+    return _spread(column) | _spread(row) << 1
+
+
+def _column(longitude):
+    return min(int((longitude + 180) / 360 * GRID_SIZE), GRID_SIZE - 1)
+
+
+def _row(latitude):
+    return min(int((latitude + 90) / 180 * GRID_SIZE), GRID_SIZE - 1)
+
+
+def encode(latitude, longitude):
+    """
+    Return the ``geo_cell`` code of a position.
+
+    Args:
+        latitude: Degrees in [-90, 90], or None
+        longitude: Degrees in [-180, 180], or None
+
+    Returns:
+        int: The Z-order code, or None if either coordinate is missing
+    """
+    if latitude is None or longitude is None:
+        return None
+    return _interleave(_column(longitude), _row(latitude))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Return the latitude/longitude box enclosing a search circle.
+
+    Returns:
+        tuple: ``(south, north, [(west, east), ...])`` with one longitude
+        interval, or two when the box crosses the antimeridian
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    south = latitude - degrees(angle)
+    north = latitude + degrees(angle)
+    if south <= -90 or north >= 90:
+        # The circle contains a pole: every longitude is within reach.
+        return max(south, -90), min(north, 90), [(-180, 180)]
+    spread = sin(angle) / cos(radians(latitude))
+    if spread >= 1:
+        return south, north, [(-180, 180)]
+    delta = degrees(asin(spread))
+    west, east = longitude - delta, longitude + delta
+    if west < -180:
+        return south, north, [(west + 360, 180), (-180, east)]
+    if east > 180:
+        return south, north, [(west, 180), (-180, east - 360)]
+    return south, north, [(west, east)]
+
+
+def cell_ranges(south, north, intervals):
+    """
+    Cover a box with at most ``MAX_CELLS`` grid cells.
+
+    Args:
+        south, north: Latitude bounds
+        intervals: ``(west, east)`` longitude intervals
+
+    Returns:
+        list: Inclusive ``(first, last)`` ``geo_cell`` ranges, sorted and
+        disjoint
+    """
+    rows = (_row(south), _row(north))
+    columns = [(_column(west), _column(east)) for west, east in intervals]
+    # Coarsen the grid one level at a time until few enough cells cover the box.
+    for shift in range(GRID_BITS + 1):
+        first_row, last_row = rows[0] >> shift, rows[1] >> shift
+        spans = [(first >> shift, last >> shift) for first, last in columns]
+        count = (last_row - first_row + 1) * sum(last - first + 1 for first, last in spans)
+        if count <= MAX_CELLS:
+            break
+    codes = sorted({
+        _interleave(column, row)
+        for first, last in spans
+        for column in range(first, last + 1)
+        for row in range(first_row, last_row + 1)
+    })
+    size = 1 << (2 * shift)
+    ranges = []
+    for code in codes:
+        start = code * size
+        if ranges and ranges[-1][1] == start - 1:
+            ranges[-1][1] = start + size - 1
+        else:
+            ranges.append([start, start + size - 1])
+    return [tuple(bounds) for bounds in ranges]
+
+
+def distance_km(latitude, longitude):
+    """Haversine distance in km from a point to each row's coordinates."""
+    latitude, longitude = radians(latitude), radians(longitude)
+    half_chord = (
+        Power(Sin((Radians('latitude') - Value(latitude)) / 2), 2)
+        + Value(cos(latitude)) * Cos(Radians('latitude'))
+        * Power(Sin((Radians('longitude') - Value(longitude)) / 2), 2)
+    )
+    return ExpressionWrapper(
+        Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(half_chord)),
+        output_field=FloatField(),
+    )
+
+
+def within(queryset, latitude, longitude, radius_km):
+    """
+    Restrict a Listing queryset to listings within ``radius_km`` of a point.
+
+    Rows get a ``distance`` annotation in km. Listings without coordinates
+    never match.
+    """
+    south, north, intervals = bounding_box(latitude, longitude, radius_km)
+    in_cells = Q()
+    for first, last in cell_ranges(south, north, intervals):
+        in_cells |= Q(geo_cell__range=(first, last))
+    in_box = Q()
+    for west, east in intervals:
+        in_box |= Q(longitude__range=(west, east))
+    return queryset.filter(
+        in_cells, in_box, latitude__range=(south, north)
+    ).annotate(
+        distance=distance_km(latitude, longitude)
+    ).filter(distance__lte=radius_km)
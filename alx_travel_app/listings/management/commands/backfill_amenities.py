@@ -0,0 +1,60 @@
+"""
+Management command to derive amenity bitmasks from the amenities text.
+Usage: python manage.py backfill_amenities [--batch-size 5000]
+
+Run once after upgrading, and again whenever amenities.AMENITIES or its
+aliases gain entries so existing listings pick them up.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from alx_travel_app.listings import response_cache
+from alx_travel_app.listings.amenities import parse_amenities
+from alx_travel_app.listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Parses Listing.amenities into Listing.amenity_flags for all listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Listings read and written per batch',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        scanned = updated = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Listing.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .only('pk', 'amenities', 'amenity_flags')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].pk
+            scanned += len(batch)
+
+            changed = []
+            for listing in batch:
+                flags = parse_amenities(listing.amenities)
+                if flags != listing.amenity_flags:
+                    listing.amenity_flags = flags
+                    changed.append(listing)
+            Listing.objects.bulk_update(changed, ['amenity_flags'])
+            updated += len(changed)
+
+        if updated:
+            response_cache.bump_all()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Scanned {scanned} listings, updated {updated} in {elapsed:.2f}s'
+            )
+        )
@@ -0,0 +1,79 @@
+"""
+Management command comparing JSON render time of the API renderers.
+Usage: python manage.py bench_renderers [--rows 10000] [--repeat 5]
+
+Serializes in-memory bookings once (no database access), then renders the
+same data with DRF's JSONRenderer and FastJSONRenderer and reports the
+best time of each.
+"""
+import json
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from alx_travel_app.listings.models import Booking, Listing
+from alx_travel_app.listings.renderers import FastJSONRenderer, orjson
+from alx_travel_app.listings.serializers import BookingSerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks JSONRenderer against FastJSONRenderer on serialized bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _bookings(self, rows):
+        listing = Listing(
+            pk=1,
+            title='Cozy Beachfront Apartment',
+            price_per_night=Decimal('150.00'),
+            max_guests=4,
+        )
+        now = timezone.now()
+        start = date(2026, 1, 1)
+        for i in range(rows):
+            booking = Booking(
+                pk=i + 1,
+                listing=listing,
+                guest_name=f'Guest {i}',
+                guest_email=f'guest{i}@example.com',
+                guest_phone='+251900000000',
+                check_in=start + timedelta(days=i),
+                check_out=start + timedelta(days=i + 3),
+                number_of_guests=2,
+                total_price=Decimal('450.00'),
+                status='confirmed',
+                special_requests='Late check-in – “quiet room” please',
+            )
+            booking.created_at = booking.updated_at = now
+            yield booking
+
+    def _best(self, renderer, data, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = renderer.render(data, 'application/json', {})
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        data = BookingSerializer(list(self._bookings(rows)), many=True).data
+
+        stock_time, stock_output = self._best(JSONRenderer(), data, repeat)
+        fast_time, fast_output = self._best(FastJSONRenderer(), data, repeat)
+
+        if json.loads(stock_output) != json.loads(fast_output):
+            self.stderr.write(self.style.ERROR('Renderer outputs differ!'))
+
+        backend = 'orjson' if orjson is not None else 'stdlib json (orjson not installed)'
+        self.stdout.write(f'{rows} bookings, {len(stock_output) / 1024:.0f} KiB, best of {repeat}')
+        self.stdout.write(f'JSONRenderer:     {stock_time * 1000:8.1f} ms')
+        self.stdout.write(f'FastJSONRenderer: {fast_time * 1000:8.1f} ms ({backend})')
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {stock_time / fast_time:.1f}x'))
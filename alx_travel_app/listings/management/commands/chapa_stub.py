@@ -0,0 +1,125 @@
+"""
+Management command running a local stand-in for the Chapa API.
+Usage: python manage.py chapa_stub [--port 8765] [--latency 0.05] [--fail-rate 0.0]
+
+Point the app at it with:
+    CHAPA_API_URL=http://127.0.0.1:8765/v1/transaction/initialize
+    CHAPA_VERIFY_URL=http://127.0.0.1:8765/v1/transaction/verify/
+"""
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+INITIALIZE_PATH = '/v1/transaction/initialize'
+VERIFY_PREFIX = '/v1/transaction/verify/'
+
+
+class ChapaStubHandler(BaseHTTPRequestHandler):
+    """Answers initialize and verify calls with Chapa-shaped responses."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+    latency = 0.0
+    fail_rate = 0.0
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        if self.headers.get('Authorization', '').startswith('Bearer '):
+            return True
+        self._send(401, {'status': 'failed', 'message': 'Invalid API Key'})
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if not self._authorized():
+            return
+        if self.path != INITIALIZE_PATH:
+            return self._send(404, {'status': 'failed', 'message': 'Not found'})
+        time.sleep(self.latency)
+        if not payload.get('tx_ref'):
+            return self._send(400, {'status': 'failed', 'message': 'tx_ref is required'})
+        # Like Chapa, only the checkout URL comes back; the caller keeps its tx_ref.
+        self._send(200, {
+            'status': 'success',
+            'message': 'Hosted Link',
+            'data': {
+                'checkout_url': f'http://{self.headers.get("Host")}/checkout/{uuid.uuid4().hex}',
+            },
+        })
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if not self.path.startswith(VERIFY_PREFIX):
+            return self._send(404, {'status': 'failed', 'message': 'Not found'})
+        time.sleep(self.latency)
+        tx_ref = self.path[len(VERIFY_PREFIX):]
+        paid = random.random() >= self.fail_rate
+        self._send(200, {
+            'status': 'success',
+            'message': 'Payment details',
+            'data': {
+                'tx_ref': tx_ref,
+                'reference': f'stub-{tx_ref}',
+                'status': 'success' if paid else 'failed',
+            },
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_stub_server(host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0):
+    """Return a ready-to-serve stub server; port 0 picks a free port."""
+    handler = type('ConfiguredChapaStubHandler', (ChapaStubHandler,), {
+        'latency': latency,
+        'fail_rate': fail_rate,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class Command(BaseCommand):
+    help = 'Runs a local HTTP server that mimics the Chapa initialize/verify API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Seconds to wait before answering each call',
+        )
+        parser.add_argument(
+            '--fail-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of verify calls that report a failed payment',
+        )
+
+    def handle(self, *args, **options):
+        server = make_stub_server(
+            options['host'], options['port'], options['latency'], options['fail_rate']
+        )
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(f'Chapa stub listening on http://{host}:{port}'))
+        self.stdout.write(f'CHAPA_API_URL=http://{host}:{port}{INITIALIZE_PATH}')
+        self.stdout.write(f'CHAPA_VERIFY_URL=http://{host}:{port}{VERIFY_PREFIX}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,27 @@
+"""
+Management command to report the listing response cache hit ratio.
+Usage: python manage.py listing_cache_stats [--reset]
+"""
+from django.core.management.base import BaseCommand
+from alx_travel_app.listings import response_cache
+
+
+class Command(BaseCommand):
+    help = 'Shows hits, misses and hit ratio of the listing response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after reporting',
+        )
+
+    def handle(self, *args, **options):
+        stats = response_cache.stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} "
+            f"hit_ratio={stats['hit_ratio']:.2%}"
+        )
+        if options['reset']:
+            response_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
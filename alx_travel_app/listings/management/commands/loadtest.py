@@ -0,0 +1,349 @@
+"""
+Management command load-testing the main API endpoints.
+Usage: python manage.py loadtest [--listings 2000] [--clients 8] [--requests 500]
+                                 [--scenarios listing_list,listing_detail,booking_create,payment_verify]
+                                 [--output loadtest.json] [--compare previous.json]
+
+Boots the project in a threaded WSGI server with the Chapa API replaced by
+the local stub (``chapa_stub``), optionally seeds a synthetic dataset, then
+drives each scenario with concurrent keep-alive clients and reports
+throughput and p50/p95/p99 latency. Results are saved as JSON, tagged with
+the current git commit, so runs can be compared across commits.
+
+The database is the configured one; use ``DATABASE_URL`` to run against
+SQLite, e.g. ``DATABASE_URL=sqlite:////tmp/bench.sqlite3``. Seeding clears
+the existing data, so never point it at a database you care about.
+
+SQLite starts transactions deferred, and a transaction that reads and then
+locks rows (``select_for_update``) fails with "database is locked" when
+another writer got there first. On SQLite, write scenarios therefore run
+with a single client unless the database sets
+``OPTIONS={'transaction_mode': 'IMMEDIATE'}``.
+
+Latency percentiles cover successful responses only; failures are counted
+separately (``errors`` and ``statuses``) so they cannot pass for fast
+requests.
+
+With ``--url`` an already running server (e.g. gunicorn) is measured
+instead; it must be configured with the stub Chapa URLs itself.
+"""
+import json
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from collections import Counter
+from itertools import count
+
+import requests
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from alx_travel_app.celery import app as celery_app
+from alx_travel_app.listings.models import Listing, Payment
+from .chapa_stub import INITIALIZE_PATH, VERIFY_PREFIX, make_stub_server
+
+
+# Scenario -> status code of a successful request
+SCENARIOS = {
+    'listing_list': 200,
+    'listing_detail': 200,
+    'booking_create': 201,
+    'payment_verify': 200,
+}
+# Scenarios writing to the database
+WRITE_SCENARIOS = {'booking_create', 'payment_verify'}
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler that does not log every request."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, statuses, elapsed):
+    """
+    Throughput and latency statistics (milliseconds) of one scenario.
+
+    Args:
+        latencies: Durations of the successful requests
+        statuses: Counter of outcomes (status codes or exception names) of
+            every request
+        elapsed: Wall time of the scenario
+
+    Returns:
+        dict: ``throughput`` counts successful requests per second
+    """
+    latencies = sorted(latencies)
+    total = sum(statuses.values())
+    succeeded = len(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 2)
+    return {
+        'requests': total,
+        'errors': total - succeeded,
+        'statuses': dict(sorted(statuses.items())),
+        'seconds': round(elapsed, 3),
+        'throughput': round(succeeded / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / succeeded) if succeeded else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Load-tests listing, booking and payment endpoints and reports latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--listings',
+            type=int,
+            help='Clear the database and seed this many synthetic listings first',
+        )
+        parser.add_argument('--bookings-per-listing', type=int, default=10)
+        parser.add_argument('--reviews', type=int, default=3)
+        parser.add_argument(
+            '--scenarios',
+            default=','.join(SCENARIOS),
+            help=f'Comma-separated subset of: {", ".join(SCENARIOS)}',
+        )
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario')
+        parser.add_argument(
+            '--chapa-latency',
+            type=float,
+            default=0.05,
+            help='Seconds the Chapa stub waits before answering',
+        )
+        parser.add_argument('--url', help='Measure an already running server instead of booting one')
+        parser.add_argument(
+            '--use-broker',
+            action='store_true',
+            help='Send Celery tasks to the configured broker instead of running them inline',
+        )
+        parser.add_argument('--output', default='loadtest.json', help='Where to save the results')
+        parser.add_argument('--compare', help='Earlier results file to compare against')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        if options['clients'] < 1 or options['requests'] < 1:
+            raise CommandError('--clients and --requests must be at least 1')
+
+        if options['listings'] is not None:
+            self.stdout.write(f'Seeding {options["listings"]} listings...')
+            call_command('migrate', run_syncdb=True, verbosity=0)
+            if Listing._meta.db_table not in connection.introspection.table_names():
+                raise CommandError(
+                    'The listings tables do not exist; run '
+                    '`python manage.py makemigrations listings` and try again'
+                )
+            call_command(
+                'seed',
+                clear=True,
+                listings=options['listings'],
+                bookings_per_listing=options['bookings_per_listing'],
+                reviews=options['reviews'],
+                verbosity=0,
+            )
+
+        self.listings = list(Listing.objects.order_by('pk').values_list('pk', 'price_per_night'))
+        self.transactions = list(
+            Payment.objects.exclude(transaction_id=None)
+            .order_by('pk')
+            .values_list('transaction_id', flat=True)[:10000]
+        )
+        if not self.listings:
+            raise CommandError('No listings to test against; pass --listings to seed some')
+        if 'payment_verify' in scenarios and not self.transactions:
+            raise CommandError('No payments with a transaction_id for payment_verify')
+
+        stub = make_stub_server(latency=options['chapa_latency'])
+        stub_host, stub_port = stub.server_address[:2]
+        stub_url = f'http://{stub_host}:{stub_port}'
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+        overrides = override_settings(
+            CHAPA_SECRET_KEY=settings.CHAPA_SECRET_KEY or 'loadtest-key',
+            CHAPA_API_URL=stub_url + INITIALIZE_PATH,
+            CHAPA_VERIFY_URL=stub_url + VERIFY_PREFIX,
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        )
+        server = None
+        eager = celery_app.conf.task_always_eager
+        overrides.enable()
+        try:
+            if not options['use_broker']:
+                celery_app.conf.task_always_eager = True
+            base_url = options['url']
+            if base_url is None:
+                server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+                server.set_app(get_internal_wsgi_application())
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+            base_url = base_url.rstrip('/')
+
+            self.stdout.write(
+                f'Target {base_url} ({connection.vendor}), {len(self.listings)} listings, '
+                f'{options["clients"]} clients, {options["requests"]} requests per scenario'
+            )
+            results = {}
+            for name in scenarios:
+                clients = self.scenario_clients(name, options)
+                results[name] = self.run_scenario(name, base_url, dict(options, clients=clients))
+                results[name]['clients'] = clients
+                self.report_line(name, results[name])
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            stub.shutdown()
+            stub.server_close()
+            celery_app.conf.task_always_eager = eager
+            overrides.disable()
+
+        report = {
+            'commit': git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'target': options['url'] or 'in-process',
+            'listings': len(self.listings),
+            'clients': options['clients'],
+            'requests': options['requests'],
+            'chapa_latency': options['chapa_latency'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results saved to {options["output"]}'))
+
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def scenario_clients(self, name, options):
+        """Number of clients for a scenario; one for writes on deferred-transaction SQLite."""
+        clients = options['clients']
+        immediate = connection.settings_dict.get('OPTIONS', {}).get('transaction_mode') == 'IMMEDIATE'
+        if name in WRITE_SCENARIOS and connection.vendor == 'sqlite' and not immediate and clients > 1:
+            self.stdout.write(self.style.WARNING(
+                f'{name}: running with 1 client instead of {clients}; concurrent SQLite '
+                "writers fail with \"database is locked\" unless OPTIONS sets "
+                "'transaction_mode': 'IMMEDIATE'"
+            ))
+            return 1
+        return clients
+
+    def make_request(self, name, session, base_url, number):
+        """Issue request ``number`` of a scenario and return the response."""
+        listing_id, price = self.listings[number % len(self.listings)]
+        if name == 'listing_list':
+            return session.get(f'{base_url}/api/listings/')
+        if name == 'listing_detail':
+            return session.get(f'{base_url}/api/listings/{listing_id}/')
+        if name == 'booking_create':
+            # Every listing gets consecutive two-night stays two years out,
+            # after any seeded booking, so requests never conflict.
+            check_in = self.booking_start + timedelta(days=3 * (number // len(self.listings)))
+            return session.post(f'{base_url}/api/bookings/', json={
+                'listing_id': listing_id,
+                'guest_name': f'Load Test {number}',
+                'guest_email': f'loadtest{number}@example.com',
+                'check_in': check_in.isoformat(),
+                'check_out': (check_in + timedelta(days=2)).isoformat(),
+                'number_of_guests': 1,
+                'total_price': str(price * 2),
+            })
+        return session.post(f'{base_url}/api/payments/verify/', json={
+            'transaction_id': self.transactions[number % len(self.transactions)],
+        })
+
+    def run_scenario(self, name, base_url, options):
+        """Drive one scenario with ``--clients`` threads sharing a request counter."""
+        self.booking_start = timezone.localdate() + timedelta(days=730 + 3 * (int(time.time()) % 1000))
+        warmup, total = options['warmup'], options['requests']
+        expected = str(SCENARIOS[name])
+        numbers = count()
+        lock = threading.Lock()
+        latencies, statuses = [], Counter()
+
+        def client():
+            session = requests.Session()
+            while True:
+                with lock:
+                    number = next(numbers)
+                if number >= warmup + total:
+                    break
+                started = time.perf_counter()
+                try:
+                    outcome = str(self.make_request(name, session, base_url, number).status_code)
+                except requests.RequestException as e:
+                    outcome = type(e).__name__
+                elapsed = time.perf_counter() - started
+                if number >= warmup:
+                    with lock:
+                        if outcome == expected:
+                            latencies.append(elapsed)
+                        statuses[outcome] += 1
+            session.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['clients']) as pool:
+            for _ in range(options['clients']):
+                pool.submit(client)
+        return summarize(latencies, statuses, time.perf_counter() - started)
+
+    def report_line(self, name, result):
+        # Percentiles are None when no request succeeded.
+        p50, p95, p99 = (str(result[key]) for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+        self.stdout.write(
+            f'{name:<16} {result["throughput"]:>8} req/s  '
+            f'p50 {p50:>8} ms  p95 {p95:>8} ms  '
+            f'p99 {p99:>8} ms  errors {result["errors"]}/{result["requests"]}'
+        )
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(f'{"":<16} responses: {result["statuses"]}'))
+
+    def compare(self, path, report):
+        """Print the change of each metric against an earlier results file."""
+        with open(path) as f:
+            previous = json.load(f)
+        self.stdout.write(f'\nCompared with {previous.get("commit") or path}:')
+        for name, result in report['results'].items():
+            before = previous.get('results', {}).get(name)
+            if not before:
+                continue
+            changes = []
+            for metric in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms'):
+                if before.get(metric) and result.get(metric) is not None:
+                    change = (result[metric] - before[metric]) / before[metric] * 100
+                    changes.append(f'{metric} {change:+.1f}%')
+            self.stdout.write(f'{name:<16} ' + '  '.join(changes))
@@ -0,0 +1,42 @@
+"""
+Management command to recompute the denormalized rating aggregates.
+Usage: python manage.py rebuild_ratings [--batch-size 10000]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from alx_travel_app.listings.models import Listing
+from alx_travel_app.listings.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recomputes rating_count, rating_sum and rating_average for all listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Listings updated per statement (by primary key range)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Listing.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            total += rebuild_ratings(Listing.objects.filter(pk__gte=ids[0], pk__lte=ids[-1]))
+            last_id = ids[-1]
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt ratings for {total} listings in {elapsed:.2f}s')
+        )
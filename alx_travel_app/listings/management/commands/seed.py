@@ -1,12 +1,224 @@
 """
 Management command to seed the database with sample listings data.
 Usage: python manage.py seed
+       python manage.py seed --listings 100000 --bookings-per-listing 20 --reviews 5 --workers 4
+
+Without ``--listings`` a handful of hand-written sample rows are created.
+With it, synthetic listings are generated together with non-overlapping
+bookings, a payment per booking whose status matches the booking, and
+reviews. Generation is deterministic: the same ``--seed``, ``--chunk-size``
+and start date produce the same rows whatever the number of workers.
+
+Rows are written with ``bulk_create`` using primary keys assigned up front,
+so chunks are independent and can be inserted by several processes at
+once. Derived columns that ``Listing.save()`` and the review signals would
+normally maintain (``amenity_flags``, ``geo_cell``, rating aggregates) are
+computed while generating.
 """
-from django.core.management.base import BaseCommand
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, ROUND_HALF_UP
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
 from django.utils import timezone
 from datetime import timedelta
-from decimal import Decimal
-from alx_travel_app.listings.models import Listing, Booking, Review
+from alx_travel_app.listings import amenities, geo, response_cache
+from alx_travel_app.listings.models import Listing, Booking, Review, Payment, RateRule, OutboundEmail
+
+
+CITIES = [
+    # (city, state, country, latitude, longitude); earlier cities get more listings.
+    ('New York', 'New York', 'United States', 40.7128, -74.0060),
+    ('Paris', 'Ile-de-France', 'France', 48.8566, 2.3522),
+    ('London', 'England', 'United Kingdom', 51.5074, -0.1278),
+    ('Miami', 'Florida', 'United States', 25.7617, -80.1918),
+    ('Barcelona', 'Catalonia', 'Spain', 41.3874, 2.1686),
+    ('Lisbon', 'Lisbon', 'Portugal', 38.7223, -9.1393),
+    ('Cape Town', 'Western Cape', 'South Africa', -33.9249, 18.4241),
+    ('Nairobi', 'Nairobi County', 'Kenya', -1.2921, 36.8219),
+    ('Addis Ababa', 'Addis Ababa', 'Ethiopia', 9.0192, 38.7525),
+    ('Marrakesh', 'Marrakesh-Safi', 'Morocco', 31.6295, -7.9811),
+    ('Dubai', 'Dubai', 'United Arab Emirates', 25.2048, 55.2708),
+    ('Kyoto', 'Kyoto', 'Japan', 35.0116, 135.7681),
+    ('Bali', 'Bali', 'Indonesia', -8.3405, 115.0920),
+    ('Sydney', 'New South Wales', 'Australia', -33.8688, 151.2093),
+    ('Aspen', 'Colorado', 'United States', 39.1911, -106.8175),
+    ('Portland', 'Oregon', 'United States', 45.5152, -122.6784),
+]
+CITY_WEIGHTS = [1 / (rank + 1) for rank in range(len(CITIES))]
+
+# property_type -> (typical nightly price, fewest bedrooms, most bedrooms)
+PROPERTY_PROFILES = {
+    'apartment': (90, 1, 3),
+    'house': (160, 2, 5),
+    'villa': (320, 3, 7),
+    'condo': (120, 1, 3),
+    'cabin': (110, 1, 4),
+    'hotel': (140, 1, 2),
+}
+PROPERTY_WEIGHTS = [30, 20, 8, 20, 7, 15]
+
+ADJECTIVES = ['Cozy', 'Sunny', 'Modern', 'Quiet', 'Spacious', 'Charming', 'Elegant', 'Rustic', 'Bright', 'Luxury']
+STREETS = ['Main Street', 'Ocean Drive', 'Garden Street', 'Forest Lane', 'Hill Road', 'Market Square', 'River Walk']
+FIRST_NAMES = ['Abebe', 'Alice', 'Amina', 'Bob', 'Carlos', 'Chen', 'Diana', 'Fatima', 'Hana', 'John', 'Kofi', 'Lena', 'Maria', 'Omar', 'Priya', 'Yuki']
+LAST_NAMES = ['Bekele', 'Brown', 'Garcia', 'Haile', 'Ito', 'Johnson', 'Kim', 'Mensah', 'Novak', 'Okafor', 'Patel', 'Rossi', 'Smith', 'Silva']
+COMMENTS = [
+    'Great location and a very comfortable stay.',
+    'Clean, quiet and exactly as described.',
+    'The host was very responsive. Would stay again!',
+    'Nice place, but the WiFi was slow.',
+    'Beautiful views and well equipped kitchen.',
+    'Not as clean as expected.',
+]
+RATING_WEIGHTS = [3, 5, 12, 35, 45]
+AMENITY_LABELS = [label for _, label in amenities.AMENITIES]
+
+
+def _guest(rng, number):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return f'{first} {last}', f'{first}.{last}{number}@example.com'.lower()
+
+
+def _booking_status(rng, check_in, check_out, today):
+    if check_out <= today:
+        return 'completed' if rng.random() < 0.85 else 'cancelled'
+    if check_in <= today:
+        return 'confirmed'
+    return rng.choices(['confirmed', 'pending', 'cancelled'], [65, 25, 10])[0]
+
+
+PAYMENT_STATUS = {
+    'pending': 'pending',
+    'confirmed': 'completed',
+    'completed': 'completed',
+    'cancelled': 'cancelled',
+}
+
+
+def seed_chunk(plan):
+    """
+    Generate and insert one chunk of listings with their related rows.
+
+    Runs in worker processes, so it only takes plain values.
+
+    Args:
+        plan: Dict with ``seed``, ``chunk``, ``first``/``count`` (listing
+            numbers), ``bookings``/``reviews`` (per listing), ``batch_size``,
+            ``start_ids`` (first primary key per model) and ``today``
+
+    Returns:
+        dict: Rows inserted per model
+    """
+    rng = random.Random(plan['seed'] * 1_000_003 + plan['chunk'])
+    today = plan['today']
+    start_ids = plan['start_ids']
+    per_listing_bookings = plan['bookings']
+    per_listing_reviews = plan['reviews']
+    listings, bookings, payments, reviews = [], [], [], []
+
+    for number in range(plan['first'], plan['first'] + plan['count']):
+        city, state, country, city_latitude, city_longitude = rng.choices(CITIES, CITY_WEIGHTS)[0]
+        # Spread listings around the city centre (about 5 km standard deviation).
+        latitude = round(city_latitude + rng.gauss(0, 0.045), 6)
+        longitude = round(city_longitude + rng.gauss(0, 0.045 / math.cos(math.radians(city_latitude))), 6)
+        property_type = rng.choices(list(PROPERTY_PROFILES), PROPERTY_WEIGHTS)[0]
+        base_price, min_bedrooms, max_bedrooms = PROPERTY_PROFILES[property_type]
+        bedrooms = rng.randint(min_bedrooms, max_bedrooms)
+        price = Decimal(base_price * rng.lognormvariate(0, 0.35)).quantize(Decimal('0.01'))
+        amenity_list = ', '.join(rng.sample(AMENITY_LABELS, rng.randint(2, 8)))
+        listing = Listing(
+            pk=start_ids['listing'] + number,
+            title=f'{rng.choice(ADJECTIVES)} {property_type.title()} in {city}',
+            description=f'A {bedrooms}-bedroom {property_type} in {city}, {country}.',
+            address=f'{rng.randint(1, 999)} {rng.choice(STREETS)}',
+            city=city,
+            state=state,
+            country=country,
+            latitude=latitude,
+            longitude=longitude,
+            geo_cell=geo.encode(latitude, longitude),
+            price_per_night=price,
+            property_type=property_type,
+            max_guests=bedrooms * 2 + rng.randint(0, 1),
+            bedrooms=bedrooms,
+            bathrooms=max(1, bedrooms - rng.randint(0, 2)),
+            amenities=amenity_list,
+            amenity_flags=amenities.parse_amenities(amenity_list),
+            is_available=rng.random() < 0.95,
+        )
+        listings.append(listing)
+
+        # Consecutive stays separated by random gaps never overlap.
+        cursor = today - timedelta(days=rng.randint(60, 365))
+        for index in range(per_listing_bookings):
+            booking_id = start_ids['booking'] + number * per_listing_bookings + index
+            check_in = cursor + timedelta(days=rng.randint(0, 14))
+            nights = rng.randint(1, 10)
+            check_out = check_in + timedelta(days=nights)
+            cursor = check_out
+            status = _booking_status(rng, check_in, check_out, today)
+            total_price = price * nights
+            guest_name, guest_email = _guest(rng, booking_id)
+            bookings.append(Booking(
+                pk=booking_id,
+                listing_id=listing.pk,
+                guest_name=guest_name,
+                guest_email=guest_email,
+                guest_phone=f'+1-555-{rng.randint(0, 9999):04d}',
+                check_in=check_in,
+                check_out=check_out,
+                number_of_guests=rng.randint(1, listing.max_guests),
+                total_price=total_price,
+                status=status,
+            ))
+            payment_status = PAYMENT_STATUS[status]
+            payments.append(Payment(
+                pk=start_ids['payment'] + number * per_listing_bookings + index,
+                booking_id=booking_id,
+                transaction_id=f'seed-{booking_id}',
+                amount=total_price,
+                status=payment_status,
+                chapa_reference=f'CH-SEED-{booking_id}' if payment_status == 'completed' else None,
+            ))
+
+        ratings = rng.choices(range(1, 6), RATING_WEIGHTS, k=per_listing_reviews)
+        for index, rating in enumerate(ratings):
+            review_id = start_ids['review'] + number * per_listing_reviews + index
+            reviewer_name, reviewer_email = _guest(rng, review_id)
+            reviews.append(Review(
+                pk=review_id,
+                listing_id=listing.pk,
+                reviewer_name=reviewer_name,
+                reviewer_email=reviewer_email,
+                rating=rating,
+                comment=rng.choice(COMMENTS),
+            ))
+        if ratings:
+            listing.rating_count = len(ratings)
+            listing.rating_sum = sum(ratings)
+            listing.rating_average = (Decimal(listing.rating_sum) / listing.rating_count).quantize(
+                Decimal('0.01'), rounding=ROUND_HALF_UP
+            )
+
+    batch_size = plan['batch_size']
+    with transaction.atomic():
+        Listing.objects.bulk_create(listings, batch_size=batch_size)
+        Booking.objects.bulk_create(bookings, batch_size=batch_size)
+        Payment.objects.bulk_create(payments, batch_size=batch_size)
+        Review.objects.bulk_create(reviews, batch_size=batch_size)
+    return {
+        'listings': len(listings),
+        'bookings': len(bookings),
+        'payments': len(payments),
+        'reviews': len(reviews),
+    }
 
 
 class Command(BaseCommand):
@@ -18,15 +230,66 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing data before seeding',
         )
+        parser.add_argument(
+            '--listings',
+            type=int,
+            help='Generate this many synthetic listings instead of the samples',
+        )
+        parser.add_argument(
+            '--bookings-per-listing',
+            type=int,
+            default=10,
+            help='Bookings (each with a payment) per synthetic listing',
+        )
+        parser.add_argument(
+            '--reviews',
+            type=int,
+            default=3,
+            help='Reviews per synthetic listing',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for synthetic data',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Listings generated and inserted per transaction',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Rows per INSERT statement',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes inserting chunks in parallel (MySQL/PostgreSQL; '
+                 'SQLite allows a single writer)',
+        )
 
     def handle(self, *args, **options):
         if options['clear']:
             self.stdout.write(self.style.WARNING('Clearing existing data...'))
-            Review.objects.all().delete()
-            Booking.objects.all().delete()
-            Listing.objects.all().delete()
+            # Plain DELETEs: going through the ORM would run the review and
+            # booking signals once per row.
+            with connection.cursor() as cursor:
+                # Children before parents, so foreign keys never dangle.
+                for model in (OutboundEmail, Review, Payment, Booking, RateRule, Listing):
+                    cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+            # Cached bitmaps, histograms and responses refer to deleted rows.
+            cache.clear()
             self.stdout.write(self.style.SUCCESS('Existing data cleared.'))
 
+        if options['listings'] is not None:
+            self.seed_synthetic(options)
+            return
+
         self.stdout.write(self.style.SUCCESS('Starting database seeding...'))
 
         # Create sample listings
@@ -38,6 +301,8 @@ class Command(BaseCommand):
                 'city': 'Miami',
                 'state': 'Florida',
                 'country': 'United States',
+                'latitude': 25.790654,
+                'longitude': -80.130045,
                 'price_per_night': Decimal('150.00'),
                 'property_type': 'apartment',
                 'max_guests': 4,
@@ -53,6 +318,8 @@ class Command(BaseCommand):
                 'city': 'Aspen',
                 'state': 'Colorado',
                 'country': 'United States',
+                'latitude': 39.186214,
+                'longitude': -106.818871,
                 'price_per_night': Decimal('350.00'),
                 'property_type': 'villa',
                 'max_guests': 8,
@@ -68,6 +335,8 @@ class Command(BaseCommand):
                 'city': 'New York',
                 'state': 'New York',
                 'country': 'United States',
+                'latitude': 40.758896,
+                'longitude': -73.985130,
                 'price_per_night': Decimal('200.00'),
                 'property_type': 'condo',
                 'max_guests': 2,
@@ -83,6 +352,8 @@ class Command(BaseCommand):
                 'city': 'Portland',
                 'state': 'Oregon',
                 'country': 'United States',
+                'latitude': 45.528142,
+                'longitude': -122.705419,
                 'price_per_night': Decimal('120.00'),
                 'property_type': 'cabin',
                 'max_guests': 6,
@@ -98,6 +369,8 @@ class Command(BaseCommand):
                 'city': 'Los Angeles',
                 'state': 'California',
                 'country': 'United States',
+                'latitude': 34.052235,
+                'longitude': -118.243683,
                 'price_per_night': Decimal('280.00'),
                 'property_type': 'house',
                 'max_guests': 10,
@@ -224,3 +497,74 @@ class Command(BaseCommand):
             )
         )
 
+    def seed_synthetic(self, options):
+        """Generate synthetic data in chunks, optionally across processes."""
+        total = options['listings']
+        chunk_size = options['chunk_size']
+        for name in ('listings', 'chunk_size', 'batch_size', 'workers'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+        for name in ('bookings_per_listing', 'reviews'):
+            if options[name] < 0:
+                raise CommandError(f'--{name.replace("_", "-")} cannot be negative')
+
+        start_ids = {
+            name: (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+            for name, model in (
+                ('listing', Listing), ('booking', Booking), ('payment', Payment), ('review', Review)
+            )
+        }
+        plans = [
+            {
+                'seed': options['seed'],
+                'chunk': chunk,
+                'first': first,
+                'count': min(chunk_size, total - first),
+                'bookings': options['bookings_per_listing'],
+                'reviews': options['reviews'],
+                'batch_size': options['batch_size'],
+                'start_ids': start_ids,
+                'today': timezone.localdate(),
+            }
+            for chunk, first in enumerate(range(0, total, chunk_size))
+        ]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generating {total} listings in {len(plans)} chunks '
+            f'with {options["workers"]} worker(s)...'
+        ))
+        started = time.perf_counter()
+        totals = dict.fromkeys(('listings', 'bookings', 'payments', 'reviews'), 0)
+        if options['workers'] > 1:
+            # Children must not inherit the parent's open connections.
+            connections.close_all()
+            with ProcessPoolExecutor(options['workers'], initializer=django.setup) as pool:
+                self._collect(pool.map(seed_chunk, plans), totals, started, options)
+        else:
+            self._collect(map(seed_chunk, plans), totals, started, options)
+
+        # Explicit primary keys leave PostgreSQL sequences behind.
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Listing, Booking, Payment, Review]):
+                cursor.execute(sql)
+        response_cache.bump_all()
+
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'\nDatabase seeding completed in {elapsed:.1f}s!\n'
+            f'Created: {totals["listings"]} listings, {totals["bookings"]} bookings, '
+            f'{totals["payments"]} payments, {totals["reviews"]} reviews\n'
+            f'Throughput: {rows / elapsed:,.0f} rows/s'
+        ))
+
+    def _collect(self, results, totals, started, options):
+        for counts in results:
+            for name, count in counts.items():
+                totals[name] += count
+            if options['verbosity'] >= 2:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'  {totals["listings"]}/{options["listings"]} listings, '
+                    f'{sum(totals.values()) / elapsed:,.0f} rows/s'
+                )
@@ -0,0 +1,349 @@
+"""
+Request, database and Chapa metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and labels it with the matched
+URL name (``booking-list``, ``listing-detail``...) rather than the path, so
+the number of series stays bounded. While a request runs, an
+execute wrapper on every database connection counts its queries and
+their time (for streamed responses, until the stream is closed, so
+queries run while the body is generated are included), and the Chapa
+client reports its calls through
+``observe_chapa``. Splitting a slow route's latency into database time,
+Chapa time and the rest (serialization, Python) is then a matter of
+dividing the per-route counters.
+
+Celery tasks are measured too (see ``signals``): how long each waited in
+its queue and how long it ran, per task and outcome. Worker processes do
+not serve ``/metrics``, so every finished task is also logged on the
+``alx_travel_app.listings.metrics`` logger.
+
+Metrics are kept in process memory behind one lock per metric, so
+recording costs a few microseconds per request. Each process exposes its
+own numbers on ``/metrics``: with several workers, scrape each of them.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}'
+
+
+class Histogram:
+    """Cumulative histogram with a fixed set of label names and buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count.
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, f'le="{_format_number(bound)}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_number(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Time to produce a response (first byte for streamed responses)',
+    ('route', 'method', 'status'),
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'Response body size',
+    ('route', 'method'),
+    SIZE_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'db_queries_per_request',
+    'SQL queries run while handling a request',
+    ('route', 'method'),
+    QUERY_BUCKETS,
+)
+DB_SECONDS = Counter(
+    'db_query_seconds_total',
+    'Time spent executing SQL queries',
+    ('route', 'method'),
+)
+CHAPA_SECONDS = Counter(
+    'chapa_request_seconds_total',
+    'Time spent waiting on the Chapa API while handling requests',
+    ('route', 'method'),
+)
+CHAPA_DURATION = Histogram(
+    'chapa_request_duration_seconds',
+    'Latency of Chapa API calls (from requests and tasks)',
+    ('operation', 'status'),
+)
+
+TASK_QUEUE_WAIT = Histogram(
+    'celery_task_queue_wait_seconds',
+    'Time between publishing a task (or its ETA) and a worker starting it',
+    ('task', 'queue'),
+    TASK_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds',
+    'Run time of Celery tasks by final state (SUCCESS, FAILURE, RETRY)',
+    ('task', 'outcome'),
+    TASK_BUCKETS,
+)
+
+METRICS = [
+    REQUEST_DURATION, RESPONSE_SIZE, DB_QUERIES, DB_SECONDS, CHAPA_SECONDS, CHAPA_DURATION,
+    TASK_QUEUE_WAIT, TASK_DURATION,
+]
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    """Database and Chapa time of the request being handled."""
+
+    __slots__ = ('queries', 'query_seconds', 'chapa_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.chapa_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+_current_stats = ContextVar('request_stats', default=None)
+
+
+def observe_chapa(operation, status, seconds):
+    """
+    Record one Chapa API call.
+
+    Args:
+        operation: ``'initialize'`` or ``'verify'``
+        status: HTTP status code, or ``'error'`` if no response arrived
+        seconds: Call duration
+    """
+    CHAPA_DURATION.observe((operation, str(status)), seconds)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.chapa_seconds += seconds
+
+
+def observe_task(task, queue, outcome, wait, runtime):
+    """
+    Record one finished Celery task.
+
+    Args:
+        task: Task name
+        queue: Queue the task was delivered from
+        outcome: Final task state, e.g. ``'SUCCESS'`` or ``'RETRY'``
+        wait: Seconds spent in the queue, or None if unknown (eager tasks)
+        runtime: Seconds the task body ran
+    """
+    if wait is not None:
+        TASK_QUEUE_WAIT.observe((task, queue), wait)
+    TASK_DURATION.observe((task, outcome), runtime)
+    logger.info(
+        'task=%s outcome=%s queue=%s wait_ms=%s runtime_ms=%.1f',
+        task, outcome, queue, 'n/a' if wait is None else f'{wait * 1000:.1f}', runtime * 1000,
+    )
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+def _install(stats):
+    """Add ``stats`` as an execute wrapper to this thread's connections."""
+    installed = list(connections.all())
+    for connection in installed:
+        connection.execute_wrappers.append(stats)
+    return installed
+
+
+def _uninstall(installed, stats):
+    # Removed by identity rather than popped: another request's wrapper
+    # may have been added after ours on the same connection.
+    for connection in installed:
+        try:
+            connection.execute_wrappers.remove(stats)
+        except ValueError:
+            pass
+
+
+def _observe_queries(labels, stats):
+    DB_QUERIES.observe(labels, stats.queries)
+    DB_SECONDS.inc(labels, stats.query_seconds)
+    if stats.chapa_seconds:
+        CHAPA_SECONDS.inc(labels, stats.chapa_seconds)
+
+
+class _CountedStream:
+    """
+    Streaming content that records size and SQL once the stream is closed.
+
+    The response handler calls ``close`` after the last chunk, or when the
+    client goes away, even if iteration never started.
+    """
+
+    def __init__(self, chunks, labels, stats, installed):
+        self.chunks = chunks
+        self.labels = labels
+        self.stats = stats
+        self.installed = installed
+        self.size = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        _uninstall(self.installed, self.stats)
+        RESPONSE_SIZE.observe(self.labels, self.size)
+        _observe_queries(self.labels, self.stats)
+
+
+class MetricsMiddleware:
+    """Records latency, SQL, Chapa time and response size per route."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        installed = _install(stats)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+            if response is None or not response.streaming:
+                _uninstall(installed, stats)
+        elapsed = time.perf_counter() - started
+
+        labels = (_route(request), request.method)
+        REQUEST_DURATION.observe(labels + (str(response.status_code),), elapsed)
+        if response.streaming:
+            # Keep counting while the body is generated; see _CountedStream.
+            response.streaming_content = _CountedStream(
+                response.streaming_content, labels, stats, installed
+            )
+        else:
+            _observe_queries(labels, stats)
+            RESPONSE_SIZE.observe(labels, len(response.content))
+        return response
+
+
+def metrics_view(request):
+    """
+    Serve the metrics of this process.
+    GET /metrics
+
+    When ``METRICS_TOKEN`` is set, requests must send
+    ``Authorization: Bearer <token>``.
+    """
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=403)
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,5 +1,7 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from . import geo
+from .amenities import parse_amenities
 
 
 class Listing(models.Model):
@@ -20,6 +22,18 @@ class Listing(models.Model):
     city = models.CharField(max_length=100)
     state = models.CharField(max_length=100, blank=True)
     country = models.CharField(max_length=100)
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    # Z-order grid cell of (latitude, longitude), derived on save; see listings.geo.
+    geo_cell = models.BigIntegerField(null=True, editable=False)
     price_per_night = models.DecimalField(
         max_digits=10, 
         decimal_places=2,
@@ -30,7 +44,18 @@ class Listing(models.Model):
     bedrooms = models.PositiveIntegerField()
     bathrooms = models.PositiveIntegerField()
     amenities = models.TextField(blank=True, help_text="Comma-separated list of amenities")
+    # Bitmask over amenities.AMENITIES, derived from `amenities` on save.
+    amenity_flags = models.PositiveBigIntegerField(default=0, editable=False)
     is_available = models.BooleanField(default=True)
+    # Review aggregates, maintained by listings.ratings on review writes.
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        default=0,
+        editable=False
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -38,6 +63,53 @@ class Listing(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Listing'
         verbose_name_plural = 'Listings'
+        indexes = [
+            # Equality filters lead, the price range comes last so the
+            # search endpoint can seek and scan a single index range.
+            models.Index(
+                fields=['city', 'is_available', 'price_per_night'],
+                name='listing_city_price_idx',
+            ),
+            models.Index(
+                fields=['country', 'is_available', 'price_per_night'],
+                name='listing_country_price_idx',
+            ),
+            models.Index(
+                fields=['property_type', 'is_available', 'price_per_night'],
+                name='listing_type_price_idx',
+            ),
+            models.Index(
+                fields=['is_available', 'max_guests', 'bedrooms'],
+                name='listing_capacity_idx',
+            ),
+            models.Index(fields=['-created_at', '-id'], name='listing_created_idx'),
+            # MAX(updated_at) for conditional GET validators.
+            models.Index(fields=['updated_at'], name='listing_updated_idx'),
+            # Sorting and min_rating filtering by rating.
+            models.Index(fields=['-rating_average', '-id'], name='listing_rating_idx'),
+            models.Index(
+                fields=['is_available', 'rating_average'],
+                name='listing_available_rating_idx',
+            ),
+            # Radius search: one range scan per grid cell covering the circle.
+            # geo_cell alone, so SQLite combines the OR-ed ranges without
+            # needing ANALYZE statistics.
+            models.Index(fields=['geo_cell'], name='listing_geo_cell_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.amenity_flags = parse_amenities(self.amenities)
+        self.geo_cell = geo.encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            derived = set()
+            if 'amenities' in update_fields:
+                derived.add('amenity_flags')
+            if {'latitude', 'longitude'} & set(update_fields):
+                derived.add('geo_cell')
+            if derived:
+                kwargs['update_fields'] = {*update_fields, *derived}
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return self.title
@@ -82,6 +154,24 @@ class Booking(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Booking'
         verbose_name_plural = 'Bookings'
+        indexes = [
+            # Serves the overlap query in availability.overlapping_bookings.
+            models.Index(
+                fields=['listing', 'check_in', 'check_out', 'status'],
+                name='booking_listing_dates_idx',
+            ),
+            # Keyset pagination, overall and per listing.
+            models.Index(fields=['-created_at', '-id'], name='booking_created_idx'),
+            models.Index(fields=['listing', '-created_at', '-id'], name='booking_listing_created_idx'),
+            models.Index(fields=['updated_at'], name='booking_updated_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded dates and status so changes can be detected."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
     
     def __str__(self):
         return f"{self.guest_name} - {self.listing.title} ({self.check_in} to {self.check_out})"
@@ -108,11 +198,84 @@ class Review(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Review'
         verbose_name_plural = 'Reviews'
+        indexes = [
+            # Per-listing review pages and the rating histogram.
+            models.Index(fields=['listing', '-created_at', '-id'], name='review_listing_created_idx'),
+            models.Index(fields=['listing', 'rating'], name='review_listing_rating_idx'),
+            models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded listing and rating so changes can be detected."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
     
     def __str__(self):
         return f"{self.reviewer_name} - {self.listing.title} ({self.rating}/5)"
 
 
+class RateRule(models.Model):
+    """
+    Nightly price override in a listing's rate calendar.
+    
+    A rule prices the nights from ``start_date`` through ``end_date`` (an
+    empty bound leaves that side open) that fall on one of its
+    ``weekdays``. Where rules overlap, the highest ``priority`` wins; nights
+    no rule covers cost ``Listing.price_per_night``.
+    """
+    
+    # Bit n of ``weekdays`` stands for ``date.weekday() == n``.
+    WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    ALL_WEEKDAYS = 0b1111111
+    WEEKEND = 0b1100000
+    
+    listing = models.ForeignKey(
+        Listing,
+        on_delete=models.CASCADE,
+        related_name='rate_rules'
+    )
+    name = models.CharField(max_length=100, blank=True, help_text="e.g. High season, Weekend")
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True, help_text="Last night the rule applies to")
+    weekdays = models.PositiveSmallIntegerField(
+        default=ALL_WEEKDAYS,
+        validators=[MinValueValidator(1), MaxValueValidator(ALL_WEEKDAYS)],
+        help_text="Bitmask of the nights the rule applies to; 1 is Monday, 64 is Sunday"
+    )
+    price_per_night = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0)]
+    )
+    priority = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['listing', 'priority', 'id']
+        verbose_name = 'Rate rule'
+        verbose_name_plural = 'Rate rules'
+        indexes = [
+            # Rules overlapping a quoted date span (pricing.load_calendars).
+            models.Index(fields=['listing', 'start_date', 'end_date'], name='raterule_listing_dates_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(start_date__isnull=True)
+                    | models.Q(end_date__isnull=True)
+                    | models.Q(end_date__gte=models.F('start_date'))
+                ),
+                name='raterule_dates_ordered',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name or 'Rate'} - {self.listing.title} ({self.price_per_night}/night)"
+
+
 class Payment(models.Model):
     """Model representing a payment transaction for a booking."""
     
@@ -148,6 +311,50 @@ class Payment(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='payment_created_idx'),
+            models.Index(fields=['updated_at'], name='payment_updated_idx'),
+            # Keyset scan of pending payments by reconcile_pending_payments.
+            models.Index(fields=['status', 'id'], name='payment_status_idx'),
+        ]
     
     def __str__(self):
         return f"Payment for {self.booking.guest_name} - {self.booking.listing.title} ({self.status})"
+
+
+class OutboundEmail(models.Model):
+    """Model representing an email waiting to be sent in a batch."""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.EmailField()
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Outbound email'
+        verbose_name_plural = 'Outbound emails'
+        indexes = [
+            # Oldest-first scan of the pending queue by the flush task.
+            models.Index(fields=['status', 'id'], name='outboundemail_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
@@ -0,0 +1,19 @@
+"""
+Pagination classes for the listings API.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset pagination over ``(-created_at, -id)``.
+
+    Each page is fetched with ``WHERE created_at < <cursor>`` on an indexed
+    column instead of an OFFSET, so deep pages cost the same as the first.
+    ``id`` breaks ties between rows created in the same instant; it runs in
+    the same direction as ``created_at`` so the ``created_at`` index (which
+    carries the primary key) can be scanned backwards without a sort.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,230 @@
+"""
+Payment state transitions driven by Chapa events.
+"""
+import hashlib
+import hmac
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import availability, calendars
+from .models import Booking, Payment
+
+
+logger = logging.getLogger(__name__)
+
+
+# Chapa transaction status -> Payment.status
+CHAPA_STATUS_MAP = {
+    'success': 'completed',
+    'failed': 'failed',
+    'cancelled': 'cancelled',
+}
+
+
+def verify_signature(body, signature, secret):
+    """
+    Check a webhook signature.
+
+    Chapa signs the raw request body with HMAC-SHA256 using the webhook
+    secret and sends the hex digest in the ``x-chapa-signature`` header.
+
+    Args:
+        body: Raw request body (bytes)
+        signature: Hex digest sent by Chapa
+        secret: Webhook secret configured on the Chapa dashboard
+
+    Returns:
+        bool: True if the signature matches
+    """
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+def apply_payment_status(transaction_id, chapa_status):
+    """
+    Move a pending payment to the state reported by Chapa.
+
+    The payment row is locked for the duration of the transition, so
+    duplicate or concurrent deliveries of the same event are applied
+    exactly once. Payments that already left ``pending`` are left as is.
+    A completed payment confirms its booking; a failed or cancelled one
+    cancels it if it is still pending, so its nights become free again.
+
+    Args:
+        transaction_id: Transaction reference (tx_ref)
+        chapa_status: Transaction status reported by Chapa
+
+    Returns:
+        tuple: ``(payment, changed)``; ``changed`` is False for a repeated
+        or unknown-status event
+
+    Raises:
+        Payment.DoesNotExist: No payment has this transaction reference
+    """
+    new_status = CHAPA_STATUS_MAP.get((chapa_status or '').lower())
+    with transaction.atomic():
+        payment = (
+            Payment.objects.select_for_update()
+            .select_related('booking__listing')
+            .get(transaction_id=transaction_id)
+        )
+        if new_status is None or payment.status != 'pending':
+            return payment, False
+
+        payment.status = new_status
+        payment.save(update_fields=['status', 'updated_at'])
+        if new_status == 'completed':
+            payment.booking.status = 'confirmed'
+            payment.booking.save(update_fields=['status', 'updated_at'])
+
+            from .tasks import send_payment_confirmation_email
+            transaction.on_commit(lambda: send_payment_confirmation_email.delay(payment.id))
+        elif payment.booking.status == 'pending':
+            # The checkout was abandoned: release the nights the booking held.
+            payment.booking.status = 'cancelled'
+            payment.booking.save(update_fields=['status', 'updated_at'])
+    return payment, True
+
+
+def _verify_status(transaction_id):
+    """Return Chapa's status for a transaction, or None if it is unknown."""
+    from .views import verify_chapa_payment
+
+    try:
+        chapa_response = verify_chapa_payment(transaction_id)
+    except Exception:
+        logger.exception("Verifying %s failed", transaction_id)
+        return None
+    if chapa_response.get('status') != 'success':
+        return None
+    return chapa_response.get('data', {}).get('status', '')
+
+
+def reconcile_batch(batch, concurrency):
+    """
+    Verify one batch of pending payments and store the outcomes.
+
+    Chapa is queried concurrently; the resulting statuses are written with
+    two ``bulk_update`` calls: payments, then their bookings, confirmed for
+    completed payments and cancelled (if still pending) for failed or
+    cancelled ones. Rows that another process moved out of ``pending``
+    while the batch was being verified are skipped.
+
+    Args:
+        batch: List of ``(payment_id, booking_id, transaction_id)`` tuples
+        concurrency: Maximum number of simultaneous verify calls
+
+    Returns:
+        dict: Counts of completed, failed, cancelled and unchanged payments
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        statuses = list(executor.map(_verify_status, [row[2] for row in batch]))
+
+    outcomes = {}
+    for (payment_id, booking_id, _), chapa_status in zip(batch, statuses):
+        new_status = CHAPA_STATUS_MAP.get((chapa_status or '').lower())
+        if new_status is not None:
+            outcomes[payment_id] = (booking_id, new_status)
+
+    counts = {'completed': 0, 'failed': 0, 'cancelled': 0, 'unchanged': len(batch)}
+    if not outcomes:
+        return counts
+
+    now = timezone.now()
+    with transaction.atomic():
+        still_pending = Payment.objects.select_for_update().filter(
+            pk__in=outcomes, status='pending'
+        ).values_list('pk', flat=True)
+        payment_rows = []
+        booking_statuses = {}
+        for payment_id in still_pending:
+            booking_id, new_status = outcomes[payment_id]
+            payment_rows.append(Payment(pk=payment_id, status=new_status, updated_at=now))
+            booking_statuses[booking_id] = 'confirmed' if new_status == 'completed' else 'cancelled'
+            counts[new_status] += 1
+            counts['unchanged'] -= 1
+
+        bookings = Booking.objects.select_for_update().filter(
+            pk__in=booking_statuses
+        ).values_list('pk', 'listing_id', 'status')
+        booking_rows = []
+        listing_ids = set()
+        for booking_id, listing_id, current in bookings:
+            new_status = booking_statuses[booking_id]
+            # Only pending bookings are cancelled; a confirmed one keeps its dates.
+            if new_status == 'confirmed' or current == 'pending':
+                booking_rows.append(Booking(pk=booking_id, status=new_status, updated_at=now))
+                listing_ids.add(listing_id)
+
+        Payment.objects.bulk_update(payment_rows, ['status', 'updated_at'])
+        Booking.objects.bulk_update(booking_rows, ['status', 'updated_at'])
+        if listing_ids:
+            # bulk_update skips the Booking signals that keep the occupancy
+            # bitmaps and calendars current.
+            transaction.on_commit(lambda: availability.invalidate_occupancy_many(listing_ids))
+            transaction.on_commit(lambda: calendars.invalidate_calendars(listing_ids))
+
+        completed_ids = [row.pk for row in payment_rows if row.status == 'completed']
+        if completed_ids:
+            from .tasks import send_payment_confirmation_email
+            transaction.on_commit(
+                lambda: [send_payment_confirmation_email.delay(pk) for pk in completed_ids]
+            )
+    return counts
+
+
+def reconcile_pending_payments(batch_size, concurrency, min_age):
+    """
+    Verify every pending payment that has been waiting at least ``min_age``.
+
+    Pending rows are walked in primary-key order with keyset pagination
+    (``id > last_id LIMIT batch_size``), so memory stays bounded by one
+    batch however many payments are pending.
+
+    Args:
+        batch_size: Payments verified per batch
+        concurrency: Maximum number of simultaneous verify calls
+        min_age: ``timedelta``; younger payments are left for the checkout
+            and webhook to settle
+
+    Returns:
+        dict: Totals over all batches
+    """
+    cutoff = timezone.now() - min_age
+    pending = Payment.objects.filter(
+        status='pending',
+        transaction_id__isnull=False,
+        created_at__lt=cutoff,
+    ).exclude(transaction_id='').order_by('pk')
+
+    totals = {'batches': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'unchanged': 0}
+    last_id = 0
+    while True:
+        batch = list(
+            pending.filter(pk__gt=last_id)
+            .values_list('pk', 'booking_id', 'transaction_id')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        started = time.perf_counter()
+        counts = reconcile_batch(batch, concurrency)
+        elapsed = time.perf_counter() - started
+
+        totals['batches'] += 1
+        for key, value in counts.items():
+            totals[key] += value
+        logger.info(
+            "payment reconciliation batch=%d size=%d completed=%d failed=%d "
+            "cancelled=%d unchanged=%d duration_ms=%.1f",
+            totals['batches'], len(batch), counts['completed'], counts['failed'],
+            counts['cancelled'], counts['unchanged'], elapsed * 1000,
+        )
+    return totals
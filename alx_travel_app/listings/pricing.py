@@ -0,0 +1,166 @@
+"""
+Server-side price quotes.
+
+A night costs ``Listing.price_per_night`` unless a ``RateRule`` of the
+listing covers it. To price stays, the rules overlapping the requested
+dates are loaded with one query and painted, lowest priority first, onto a
+list of nightly prices in cents: a rule for every weekday is one slice
+assignment, a weekday rule one strided slice (``prices[first::7]``) per
+weekday. Prefix sums over that list then price any stay inside it with a
+single subtraction, so quoting many stays costs one query and one pass
+over the nights involved instead of a Python loop per stay and night.
+
+Amounts are kept as integer cents while computing; quotes are returned as
+two-place ``Decimal`` values like ``Booking.total_price``.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db.models import Q
+
+from .models import RateRule
+
+
+CURRENCY = 'ETB'
+CENT = Decimal('0.01')
+
+
+def _cents(amount):
+    return int(Decimal(amount).scaleb(2))
+
+
+def _amount(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _merge(ranges):
+    """Merge ``(start, end)`` ranges into sorted, disjoint ``[start, end]`` segments."""
+    segments = []
+    for start, end in sorted(ranges):
+        if segments and start <= segments[-1][1]:
+            segments[-1][1] = max(segments[-1][1], end)
+        else:
+            segments.append([start, end])
+    return segments
+
+
+class RateCalendar:
+    """
+    Nightly prices of one listing over the date segments being quoted.
+
+    Only the nights of the requested stays are materialized, so stays years
+    apart do not cost the nights in between.
+    """
+
+    __slots__ = ('starts', 'segments')
+
+    def __init__(self, base_price, rules, ranges):
+        """
+        Args:
+            base_price: The listing's ``price_per_night``
+            rules: The listing's ``RateRule`` objects in ascending priority
+            ranges: ``(check_in, check_out)`` pairs the calendar must cover
+        """
+        base = _cents(base_price)
+        rules = [
+            (
+                rule.start_date.toordinal() if rule.start_date else None,
+                rule.end_date.toordinal() + 1 if rule.end_date else None,
+                rule.weekdays,
+                _cents(rule.price_per_night),
+            )
+            for rule in rules
+        ]
+        self.starts = []
+        self.segments = []
+        for start, end in _merge((check_in.toordinal(), check_out.toordinal()) for check_in, check_out in ranges):
+            prices = [base] * (end - start)
+            for rule in rules:
+                self._paint(prices, start, *rule)
+            self.starts.append(start)
+            self.segments.append(list(accumulate(prices, initial=0)))
+
+    @staticmethod
+    def _paint(prices, origin, rule_start, rule_end, weekdays, cents):
+        first = 0 if rule_start is None else max(rule_start - origin, 0)
+        last = len(prices) if rule_end is None else min(rule_end - origin, len(prices))
+        if first >= last:
+            return
+        if weekdays & RateRule.ALL_WEEKDAYS == RateRule.ALL_WEEKDAYS:
+            prices[first:last] = [cents] * (last - first)
+            return
+        first_weekday = date.fromordinal(origin + first).weekday()
+        for weekday in range(7):
+            if weekdays & (1 << weekday):
+                offset = first + (weekday - first_weekday) % 7
+                nights = len(range(offset, last, 7))
+                if nights:
+                    prices[offset:last:7] = [cents] * nights
+
+    def total_cents(self, check_in, check_out):
+        """Price of the nights in ``[check_in, check_out)`` in cents."""
+        start, end = check_in.toordinal(), check_out.toordinal()
+        index = bisect_right(self.starts, start) - 1
+        origin, prefix = self.starts[index], self.segments[index]
+        return prefix[end - origin] - prefix[start - origin]
+
+
+def load_calendars(spans):
+    """
+    Build the rate calendars of several listings with one query.
+
+    Args:
+        spans: Dict of ``listing -> list of (check_in, check_out)``; the
+            listings must have ``price_per_night`` loaded
+
+    Returns:
+        dict: ``listing_id -> RateCalendar``
+    """
+    if not spans:
+        return {}
+    overlapping = Q()
+    for listing, ranges in spans.items():
+        first = min(check_in for check_in, _ in ranges)
+        last = max(check_out for _, check_out in ranges)
+        overlapping |= (
+            Q(listing_id=listing.pk)
+            & (Q(start_date__isnull=True) | Q(start_date__lt=last))
+            & (Q(end_date__isnull=True) | Q(end_date__gte=first))
+        )
+    rules = defaultdict(list)
+    for rule in RateRule.objects.filter(overlapping).order_by('priority', 'id'):
+        rules[rule.listing_id].append(rule)
+    return {
+        listing.pk: RateCalendar(listing.price_per_night, rules[listing.pk], ranges)
+        for listing, ranges in spans.items()
+    }
+
+
+def quote_totals(ranges):
+    """
+    Price many stays, possibly at different listings, at once.
+
+    Args:
+        ranges: Dict of ``index -> (listing, check_in, check_out)``
+
+    Returns:
+        dict: ``index -> total price`` as a two-place ``Decimal``
+    """
+    spans = defaultdict(list)
+    listings = {}
+    for listing, check_in, check_out in ranges.values():
+        listing = listings.setdefault(listing.pk, listing)
+        spans[listing].append((check_in, check_out))
+    calendars = load_calendars(spans)
+    return {
+        index: _amount(calendars[listing.pk].total_cents(check_in, check_out))
+        for index, (listing, check_in, check_out) in ranges.items()
+    }
+
+
+def quote(listing, check_in, check_out):
+    """Return the total price of one stay at ``listing``."""
+    return quote_totals({0: (listing, check_in, check_out)})[0]
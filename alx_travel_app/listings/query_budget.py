@@ -0,0 +1,63 @@
+"""
+Query budgets for API views.
+
+A view declares how many SQL queries each action may run. When
+``settings.QUERY_BUDGET_ENFORCED`` is on (DEBUG and test runs by default)
+every query is counted and an action that exceeds its budget raises
+``QueryBudgetExceeded``. Budgets are constants, so a list endpoint that
+starts issuing one query per row fails as soon as a page holds more rows
+than the budget allows.
+"""
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a view action runs more queries than its budget."""
+
+
+class QueryCounter:
+    """``execute_wrapper`` callable that records the SQL it sees."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+
+class QueryBudgetMixin:
+    """
+    ViewSet mixin enforcing per-action query budgets.
+
+    Set ``query_budgets`` to a mapping of action name to the maximum
+    number of queries that action may run, e.g. ``{'list': 3}``.
+    Actions not in the mapping are not checked.
+    """
+    query_budgets = {'list': 3}
+
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.QUERY_BUDGET_ENFORCED:
+            return super().dispatch(request, *args, **kwargs)
+
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=True):
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = super().dispatch(request, *args, **kwargs)
+
+        action = getattr(self, 'action', None)
+        budget = self.query_budgets.get(action)
+        if budget is not None and response.status_code < 400 and counter.count > budget:
+            raise QueryBudgetExceeded(
+                f"{type(self).__name__}.{action} ran {counter.count} queries "
+                f"(budget {budget}):\n" + "\n".join(counter.queries)
+            )
+        return response
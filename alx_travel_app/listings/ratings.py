@@ -0,0 +1,125 @@
+"""
+Denormalized review aggregates on ``Listing``.
+
+Each listing stores ``rating_count``, ``rating_sum`` and ``rating_average``
+so rating display, sorting and filtering never aggregate over ``reviews``.
+Review writes apply a delta with ``F()`` expressions, which the database
+executes atomically, so concurrent reviews cannot lose updates.
+``rebuild_ratings`` recomputes the columns from scratch in bulk.
+
+The per-star histogram shown with a listing's reviews is cached and
+dropped whenever one of the listing's reviews is written.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, FloatField, IntegerField, OuterRef,
+    Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, Now
+
+from . import response_cache
+from .models import Listing, Review
+
+
+def _average_expression():
+    """SQL expression computing the average from the stored count and sum."""
+    return Case(
+        When(rating_count=0, then=Value(0)),
+        default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def apply_rating_change(listing_id, count_delta, sum_delta):
+    """
+    Adjust a listing's aggregates by a delta.
+
+    Args:
+        listing_id: Listing to update
+        count_delta: Change in the number of reviews (-1, 0 or 1)
+        sum_delta: Change in the sum of ratings
+    """
+    with transaction.atomic():
+        Listing.objects.filter(pk=listing_id).update(
+            rating_count=F('rating_count') + count_delta,
+            rating_sum=F('rating_sum') + sum_delta,
+            updated_at=Now(),
+        )
+        # Separate statement: MySQL evaluates SET clauses left to right with
+        # already-updated values, other backends use the old row.
+        Listing.objects.filter(pk=listing_id).update(rating_average=_average_expression())
+        transaction.on_commit(lambda: response_cache.bump_listing(listing_id))
+
+
+def rebuild_ratings(queryset=None):
+    """
+    Recompute the aggregates of every listing in ``queryset`` from reviews.
+
+    Runs as two set-based ``UPDATE`` statements with correlated subqueries,
+    whatever the number of listings.
+
+    Args:
+        queryset: Listings to rebuild (defaults to all listings)
+
+    Returns:
+        int: Number of listings updated
+    """
+    if queryset is None:
+        queryset = Listing.objects.all()
+    reviews = Review.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    with transaction.atomic():
+        updated = queryset.update(
+            rating_count=Coalesce(
+                Subquery(reviews.annotate(n=Count('pk')).values('n')),
+                Value(0),
+                output_field=IntegerField(),
+            ),
+            rating_sum=Coalesce(
+                Subquery(reviews.annotate(total=Sum('rating')).values('total')),
+                Value(0),
+                output_field=IntegerField(),
+            ),
+            # Moves detail ETags (see listings.conditional) along with the ratings.
+            updated_at=Now(),
+        )
+        queryset.update(rating_average=_average_expression())
+        transaction.on_commit(response_cache.bump_all)
+    return updated
+
+
+RATING_HISTOGRAM_CACHE_KEY = 'listings:rating-histogram:{listing_id}'
+
+
+def rating_histogram(listing_id):
+    """
+    Return the number of reviews per star for a listing.
+
+    Served from the cache; on a miss it is computed with one grouped query
+    on the ``(listing, rating)`` index. That query reads from the primary
+    database, so a lagging replica can never leave an outdated histogram in
+    the cache.
+
+    Returns:
+        dict: ``{'1': n, ..., '5': n}``
+    """
+    key = RATING_HISTOGRAM_CACHE_KEY.format(listing_id=listing_id)
+    histogram = cache.get(key)
+    if histogram is None:
+        histogram = {str(star): 0 for star in range(1, 6)}
+        counts = (
+            Review.objects.using(DEFAULT_DB_ALIAS).filter(listing_id=listing_id)
+            .order_by()
+            .values_list('rating')
+            .annotate(n=Count('pk'))
+        )
+        for rating, n in counts:
+            histogram[str(rating)] = n
+        cache.set(key, histogram, settings.RATING_HISTOGRAM_CACHE_TIMEOUT)
+    return histogram
+
+
+def invalidate_rating_histogram(listing_id):
+    """Drop a listing's cached histogram after one of its reviews changed."""
+    cache.delete(RATING_HISTOGRAM_CACHE_KEY.format(listing_id=listing_id))
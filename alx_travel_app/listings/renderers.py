@@ -0,0 +1,45 @@
+"""
+Renderers for the listings API.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by ``orjson`` when it is installed.
+
+    Output matches DRF's ``JSONRenderer``: values orjson does not handle
+    natively (``Decimal``, lazy translations, ...) and datetimes are passed
+    to DRF's ``JSONEncoder.default``, so a raw ``Decimal`` or aware
+    ``datetime`` renders exactly as it would with the stock renderer.
+    Serializer output is already strings for ``DecimalField`` and
+    ``DateTimeField`` values (e.g. ``"150.00"``), which are emitted as is.
+
+    Falls back to the stock renderer when orjson is missing or indented
+    output is requested.
+    """
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self._encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # Same escaping as JSONRenderer: these are valid JSON but not
+        # valid JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,194 @@
+"""
+Read replicas for the listing and booking API.
+
+When ``DATABASE_REPLICA_URLS`` configures replicas (``replica1``,
+``replica2``... in ``settings.DATABASES``), safe requests (GET, HEAD,
+OPTIONS) to views using ``ReplicaReadMixin`` read from one of them. Every
+other read and every write goes to ``default``, so Celery tasks, the admin
+and management commands are unaffected.
+
+Reads follow the request's own writes (read-your-writes):
+
+- once a request writes (or locks rows), its remaining queries use the
+  primary;
+- a request that wrote sets a short-lived cookie, and requests carrying it
+  read from the primary for ``REPLICA_PIN_SECONDS``, which should exceed
+  the usual replication lag.
+
+A replica is probed with ``SELECT 1`` at most every
+``REPLICA_HEALTH_CHECK_INTERVAL`` seconds per process. One that fails the
+probe, or fails a query while serving a request, is skipped for that long
+and the request is answered from the primary instead.
+"""
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'db_pin'
+
+
+class ReadState:
+    """Routing state of the request being handled."""
+
+    __slots__ = ('pinned', 'wrote', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_state = ContextVar('replica_read_state', default=None)
+
+# Per-process replica health: alias -> monotonic time of the last probe,
+# and alias -> monotonic time until which the replica is skipped.
+_checked_at = {}
+_down_until = {}
+_health_lock = threading.Lock()
+
+
+def mark_unhealthy(alias):
+    """Stop reading from a replica for ``REPLICA_HEALTH_CHECK_INTERVAL`` seconds."""
+    with _health_lock:
+        _down_until[alias] = time.monotonic() + settings.REPLICA_HEALTH_CHECK_INTERVAL
+    try:
+        connections[alias].close()
+    except DatabaseError:
+        pass
+
+
+def _is_healthy(alias, now):
+    with _health_lock:
+        if _down_until.get(alias, 0) > now:
+            return False
+        due = now - _checked_at.get(alias, float('-inf')) >= settings.REPLICA_HEALTH_CHECK_INTERVAL
+        if due:
+            _checked_at[alias] = now
+    if not due:
+        return True
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError as e:
+        logger.warning('Replica %s failed its health check: %s', alias, e)
+        mark_unhealthy(alias)
+        return False
+    return True
+
+
+def choose_replica():
+    """Return the alias of a healthy replica at random, or None."""
+    now = time.monotonic()
+    aliases = list(settings.REPLICA_DATABASES)
+    random.shuffle(aliases)
+    for alias in aliases:
+        if _is_healthy(alias, now):
+            # Create this thread's connection now, so execute_wrappers that
+            # outer code installs on initialized connections cover it.
+            connections[alias]
+            return alias
+    return None
+
+
+def current_replica():
+    """Return the replica the current request reads from, or None."""
+    state = _state.get()
+    if state is None or state.wrote:
+        return None
+    return state.replica
+
+
+def using_current(queryset):
+    """
+    Bind a queryset to the current request's read database.
+
+    Needed for querysets evaluated after the view returns, such as those
+    behind a streaming response.
+    """
+    replica = current_replica()
+    return queryset.using(replica) if replica else queryset
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads of opted-in requests to a replica.
+
+    Enabled through ``DATABASE_ROUTERS`` when replicas are configured.
+    """
+
+    def db_for_read(self, model, **hints):
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Tracks writes per request and pins the client to the primary after one."""
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = ReadState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    ViewSet mixin serving safe requests from a read replica.
+
+    Must come before ``QueryBudgetMixin`` so replica queries are counted.
+    A safe request whose replica fails is answered again from the primary.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        state = _state.get()
+        if state is None or state.pinned or request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+
+        state.replica = choose_replica()
+        if state.replica is None:
+            return super().dispatch(request, *args, **kwargs)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except DatabaseError as e:
+            logger.warning('Read from replica %s failed, retrying on primary: %s', state.replica, e)
+            mark_unhealthy(state.replica)
+            state.replica = None
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            state.replica = None
@@ -0,0 +1,171 @@
+"""
+Versioned response cache for the listing list and detail endpoints.
+
+Cached entries are keyed by version counters kept in the cache itself:
+
+- the *list* version, bumped by any listing write, keys list pages;
+- a *per-listing* version, bumped when that listing changes, keys its
+  detail response;
+- a *generation*, bumped by bulk rewrites that bypass model signals
+  (``rebuild_ratings``, ``backfill_amenities``), is part of every key.
+
+A write makes stale entries unreachable the moment the counter moves, so
+invalidation is exact; the TTL only bounds how long orphaned entries occupy
+memory. Responses read from a replica within ``REPLICA_PIN_SECONDS`` of the
+last write are not stored, since the replica may not have that write yet.
+Counters live in the configured cache, so the local-memory cache works for
+tests and a shared cache (``CACHE_URL``) for production.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from . import replicas
+
+
+GENERATION_KEY = 'listings:cache:generation'
+LIST_VERSION_KEY = 'listings:cache:version:list'
+LISTING_VERSION_KEY = 'listings:cache:version:{listing_id}'
+HITS_KEY = 'listings:cache:hits'
+MISSES_KEY = 'listings:cache:misses'
+WRITTEN_AT_KEY = 'listings:cache:written-at'
+
+
+def _bump(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr(); any new value invalidates.
+            cache.add(key, 1, None)
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def bump_listing(listing_id):
+    """Invalidate a listing's detail response and every list page."""
+    _bump(LISTING_VERSION_KEY.format(listing_id=listing_id))
+    _bump(LIST_VERSION_KEY)
+    cache.set(WRITTEN_AT_KEY, time.time(), None)
+
+
+def bump_all():
+    """Invalidate every cached listing response (after bulk updates)."""
+    _bump(GENERATION_KEY)
+    cache.set(WRITTEN_AT_KEY, time.time(), None)
+
+
+def may_lag():
+    """Return True if the current request reads from a replica that may miss the last write."""
+    if replicas.current_replica() is None:
+        return False
+    written_at = cache.get(WRITTEN_AT_KEY)
+    return written_at is not None and time.time() - written_at < settings.REPLICA_PIN_SECONDS
+
+
+def _params_digest(request):
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    )
+    raw = f"{request.get_host()}|{request.path}|{params}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def list_key(request):
+    """Cache key of a list response for the current list version."""
+    versions = cache.get_many([GENERATION_KEY, LIST_VERSION_KEY])
+    return 'listings:cache:list:{}:{}:{}'.format(
+        versions.get(GENERATION_KEY, 0),
+        versions.get(LIST_VERSION_KEY, 0),
+        _params_digest(request),
+    )
+
+
+def detail_key(request, listing_id):
+    """Cache key of a detail response for the listing's current version."""
+    version_key = LISTING_VERSION_KEY.format(listing_id=listing_id)
+    versions = cache.get_many([GENERATION_KEY, version_key])
+    return 'listings:cache:detail:{}:{}:{}:{}'.format(
+        listing_id,
+        versions.get(GENERATION_KEY, 0),
+        versions.get(version_key, 0),
+        _params_digest(request),
+    )
+
+
+def cached_response(key, build):
+    """
+    Return the cached response data for ``key`` or build and store it.
+
+    Only the serialized data is cached; rendering still follows the
+    request's content negotiation. Responses other than 200 are not cached.
+
+    Args:
+        key: Cache key from ``list_key``/``detail_key``
+        build: Callable returning a ``Response`` on a miss
+
+    Returns:
+        Response: With an ``X-Cache: HIT`` or ``MISS`` header
+    """
+    data = cache.get(key)
+    if data is not None:
+        _count(HITS_KEY)
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    _count(MISSES_KEY)
+    response = build()
+    if response.status_code == 200 and not may_lag():
+        cache.set(key, response.data, settings.LISTING_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def stats():
+    """Return hits, misses and hit ratio since the counters were reset."""
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    """Reset the hit/miss counters."""
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+class CachedListingResponseMixin:
+    """Serves ``list`` and ``retrieve`` through the versioned cache."""
+
+    def list(self, request, *args, **kwargs):
+        if not settings.LISTING_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+        return cached_response(
+            list_key(request),
+            lambda: super(CachedListingResponseMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.LISTING_CACHE_ENABLED:
+            return super().retrieve(request, *args, **kwargs)
+        listing_id = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return cached_response(
+            detail_key(request, listing_id),
+            lambda: super(CachedListingResponseMixin, self).retrieve(request, *args, **kwargs),
+        )
@@ -1,5 +1,157 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Listing, Booking, Payment
+from rest_framework.settings import api_settings
+from . import amenities, availability, calendars, geo, pricing, response_cache
+from .models import Listing, Booking, Review, Payment
+
+
+# Changing any of these re-prices a booking.
+PRICED_FIELDS = {'listing', 'check_in', 'check_out', 'total_price'}
+
+
+def _as_pk(value):
+    """Return ``value`` as an integer primary key, or None if it is not one."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _item_pks(data, key):
+    """Collect the primary keys found under ``key`` in a list of items."""
+    if not isinstance(data, list):
+        return set()
+    return {_as_pk(item.get(key)) for item in data if isinstance(item, dict)} - {None}
+
+
+def _item_error(message):
+    return {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+
+
+def _price_error(quoted):
+    return {'total_price': [f"The price for these dates is {quoted}."]}
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    ``many=True`` serializer behind the ``bulk`` endpoints.
+    
+    For updates, ``instance`` is the queryset to update from and every item
+    must carry the ``id`` of the object it changes; the objects are loaded
+    with one ``in_bulk`` query and each item is validated against its own
+    object. Subclasses write with ``bulk_create``/``bulk_update``, which
+    skip ``Model.save()`` and signals, so they maintain derived fields and
+    caches themselves.
+    """
+    # Fields that, with ``created_at``, tell the rows of one insert apart.
+    natural_key = ()
+    
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('allow_empty', False)
+        kwargs.setdefault('max_length', settings.BULK_MAX_ITEMS)
+        super().__init__(*args, **kwargs)
+    
+    def to_internal_value(self, data):
+        self._targets = []
+        self._seen = set()
+        if self.instance is not None:
+            self._instances = self.instance.in_bulk(_item_pks(data, 'id'))
+        return super().to_internal_value(data)
+    
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            pk = _as_pk(data.get('id')) if isinstance(data, dict) else None
+            if pk is None or pk not in self._instances:
+                raise serializers.ValidationError({'id': ["No object with this id."]})
+            if pk in self._seen:
+                raise serializers.ValidationError({'id': ["Duplicate id in this request."]})
+            self._seen.add(pk)
+            self.child.instance = self._instances[pk]
+            self.child.initial_data = data
+            self._targets.append(self._instances[pk])
+        return super().run_child_validation(data)
+    
+    def apply_changes(self, validated_data):
+        """
+        Copy validated changes onto the objects being updated.
+        
+        Returns:
+            tuple: (objects, names of the fields to pass to ``bulk_update``)
+        """
+        now = timezone.now()
+        fields = {'updated_at'}
+        for instance, attrs in zip(self._targets, validated_data):
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+            instance.updated_at = now
+            fields.update(attrs)
+        return self._targets, fields
+    
+    def bulk_create(self, objects):
+        """
+        ``bulk_create`` that leaves every object with its primary key.
+        
+        Backends that cannot return rows from a multi-row INSERT (MySQL)
+        leave ``pk`` unset. The new rows are then read back with one query
+        on ``created_at`` and matched to the objects by ``created_at`` and
+        ``natural_key``, so responses can still report each item's ``id``.
+        """
+        model = self.child.Meta.model
+        model.objects.bulk_create(objects, batch_size=settings.BULK_BATCH_SIZE)
+        missing = [obj for obj in objects if obj.pk is None]
+        if not missing:
+            return objects
+        fields = ('created_at', *self.natural_key)
+        pks = defaultdict(list)
+        rows = model.objects.filter(
+            created_at__range=(
+                min(obj.created_at for obj in missing),
+                max(obj.created_at for obj in missing),
+            )
+        ).order_by('pk').values_list('pk', *fields)
+        for pk, *values in rows:
+            pks[tuple(values)].append(pk)
+        for obj in missing:
+            # Identical keys are assigned in insertion (primary key) order.
+            matches = pks[tuple(getattr(obj, field) for field in fields)]
+            if matches:
+                obj.pk = matches.pop(0)
+        return objects
+
+
+class ListingBulkSerializer(BulkListSerializer):
+    """Creates or updates many listings in one transaction."""
+    
+    natural_key = ('title', 'address')
+    
+    def create(self, validated_data):
+        listings = [Listing(**attrs) for attrs in validated_data]
+        for listing in listings:
+            listing.amenity_flags = amenities.parse_amenities(listing.amenities)
+            listing.geo_cell = geo.encode(listing.latitude, listing.longitude)
+        with transaction.atomic():
+            self.bulk_create(listings)
+            transaction.on_commit(response_cache.bump_all)
+        return listings
+    
+    def update(self, instances, validated_data):
+        listings, fields = self.apply_changes(validated_data)
+        if 'amenities' in fields:
+            for listing in listings:
+                listing.amenity_flags = amenities.parse_amenities(listing.amenities)
+            fields.add('amenity_flags')
+        if {'latitude', 'longitude'} & fields:
+            for listing in listings:
+                listing.geo_cell = geo.encode(listing.latitude, listing.longitude)
+            fields.add('geo_cell')
+        with transaction.atomic():
+            Listing.objects.bulk_update(listings, sorted(fields), batch_size=settings.BULK_BATCH_SIZE)
+            transaction.on_commit(response_cache.bump_all)
+        return listings
 
 
 class ListingSerializer(serializers.ModelSerializer):
@@ -15,6 +167,8 @@ class ListingSerializer(serializers.ModelSerializer):
             'city',
             'state',
             'country',
+            'latitude',
+            'longitude',
             'price_per_night',
             'property_type',
             'max_guests',
@@ -22,17 +176,215 @@ class ListingSerializer(serializers.ModelSerializer):
             'bathrooms',
             'amenities',
             'is_available',
+            'rating_count',
+            'rating_average',
             'created_at',
             'updated_at',
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'rating_count', 'rating_average', 'created_at', 'updated_at']
+        list_serializer_class = ListingBulkSerializer
+    
+    def validate(self, data):
+        """Require latitude and longitude to be set (or cleared) together."""
+        latitude = data.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = data.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError(
+                "latitude and longitude must be provided together."
+            )
+        return data
+
+
+class ListingDistanceSerializer(ListingSerializer):
+    """Listing with its distance from the point of a radius search."""
+    
+    distance_km = serializers.SerializerMethodField()
+    
+    class Meta(ListingSerializer.Meta):
+        fields = ListingSerializer.Meta.fields + ['distance_km']
+    
+    def get_distance_km(self, listing):
+        return round(listing.distance, 3)
+
+
+class AmenitiesFilterField(serializers.CharField):
+    """Comma-separated amenity names, validated into an amenity bitmask."""
+    
+    def to_internal_value(self, data):
+        names = [name for name in super().to_internal_value(data).split(',') if name.strip()]
+        try:
+            return amenities.mask_for(names)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class ListingSearchSerializer(serializers.Serializer):
+    """Validates the query parameters of the listing search endpoint."""
+    
+    city = serializers.CharField(required=False)
+    country = serializers.CharField(required=False)
+    property_type = serializers.ChoiceField(choices=Listing.PROPERTY_TYPES, required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    guests = serializers.IntegerField(min_value=1, required=False)
+    bedrooms = serializers.IntegerField(min_value=0, required=False)
+    min_rating = serializers.DecimalField(
+        max_digits=3, decimal_places=2, min_value=0, max_value=5, required=False
+    )
+    amenities = AmenitiesFilterField(required=False)
+    check_in = serializers.DateField(required=False)
+    check_out = serializers.DateField(required=False)
+    lat = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    lng = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    radius_km = serializers.FloatField(
+        min_value=0, max_value=settings.GEO_MAX_RADIUS_KM, required=False
+    )
+    
+    def validate(self, data):
+        """Validate price and date ranges and the search circle."""
+        min_price = data.get('min_price')
+        max_price = data.get('max_price')
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise serializers.ValidationError("min_price cannot be greater than max_price.")
+        
+        check_in = data.get('check_in')
+        check_out = data.get('check_out')
+        if bool(check_in) != bool(check_out):
+            raise serializers.ValidationError(
+                "check_in and check_out must be provided together."
+            )
+        if check_in and check_out <= check_in:
+            raise serializers.ValidationError(
+                "Check-out date must be after check-in date."
+            )
+        
+        circle = [name for name in ('lat', 'lng', 'radius_km') if name in data]
+        if circle and len(circle) < 3:
+            raise serializers.ValidationError(
+                "lat, lng and radius_km must be provided together."
+            )
+        return data
+
+
+class ListingIdField(serializers.PrimaryKeyRelatedField):
+    """
+    Listing primary key; uses the listings prefetched by a bulk serializer
+    instead of one query per item when there is one.
+    """
+    
+    def to_internal_value(self, data):
+        listings = getattr(self.root, 'listings', None)
+        if listings is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool) or _as_pk(data) is None:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if _as_pk(data) not in listings:
+            self.fail('does_not_exist', pk_value=data)
+        return listings[_as_pk(data)]
+
+
+class BookingBulkSerializer(BulkListSerializer):
+    """
+    Creates or updates many bookings in one transaction.
+    
+    Date conflicts are checked for the whole set: between items of the
+    request in ``validate``, and against stored bookings with a single
+    query while the affected listings are locked. Bulk writes do not
+    create payments or send confirmation emails; they are meant for
+    bookings already settled on an external channel.
+    """
+    
+    natural_key = ('listing_id', 'check_in', 'check_out', 'guest_email')
+    
+    def to_internal_value(self, data):
+        self.listings = Listing.objects.in_bulk(_item_pks(data, 'listing_id'))
+        return super().to_internal_value(data)
+    
+    def _ranges(self, validated_data):
+        """Return ``index -> (listing_id, check_in, check_out)`` of the items holding dates."""
+        ranges = {}
+        for index, attrs in enumerate(validated_data):
+            instance = self._targets[index] if self.instance is not None else None
+            listing, check_in, check_out, status = (
+                attrs.get(field, getattr(instance, field, None))
+                for field in ('listing', 'check_in', 'check_out', 'status')
+            )
+            if (status or 'pending') in availability.BLOCKING_STATUSES:
+                ranges[index] = (listing.pk, check_in, check_out)
+        return ranges
+    
+    def validate(self, attrs):
+        conflicts = availability.overlaps_within(self._ranges(attrs))
+        if conflicts:
+            raise serializers.ValidationError({
+                index: _item_error(f"Dates overlap item {other} of this request.")
+                for index, other in sorted(conflicts.items())
+            })
+        self._price(attrs)
+        return attrs
+    
+    def _price(self, validated_data):
+        """Quote every new or re-dated item at once and set its ``total_price``."""
+        ranges = {}
+        for index, attrs in enumerate(validated_data):
+            instance = self._targets[index] if self.instance is not None else None
+            if instance is not None and not PRICED_FIELDS & attrs.keys():
+                continue
+            listing, check_in, check_out = (
+                attrs.get(field, getattr(instance, field, None))
+                for field in ('listing', 'check_in', 'check_out')
+            )
+            if listing and check_in and check_out:
+                ranges[index] = (listing, check_in, check_out)
+        errors = {}
+        for index, quoted in pricing.quote_totals(ranges).items():
+            sent = validated_data[index].get('total_price')
+            if sent is not None and sent != quoted:
+                errors[index] = _price_error(quoted)
+            validated_data[index]['total_price'] = quoted
+        if errors:
+            raise serializers.ValidationError(errors)
+    
+    def _lock_dates(self, validated_data, exclude=()):
+        """Lock the affected listings and check the items against stored bookings."""
+        ranges = self._ranges(validated_data)
+        listing_ids = sorted({listing_id for listing_id, _, _ in ranges.values()})
+        # Lock in primary-key order so concurrent batches cannot deadlock.
+        list(Listing.objects.select_for_update().filter(pk__in=listing_ids).order_by('pk').values_list('pk'))
+        conflicts = availability.overlaps_existing(ranges, exclude)
+        if conflicts:
+            raise serializers.ValidationError({
+                index: _item_error("The listing is not available for the selected dates.")
+                for index in sorted(conflicts)
+            })
+    
+    def create(self, validated_data):
+        bookings = [Booking(**attrs) for attrs in validated_data]
+        listing_ids = {booking.listing_id for booking in bookings}
+        with transaction.atomic():
+            self._lock_dates(validated_data)
+            self.bulk_create(bookings)
+            transaction.on_commit(lambda: availability.invalidate_occupancy_many(listing_ids))
+            transaction.on_commit(lambda: calendars.invalidate_calendars(listing_ids))
+        return bookings
+    
+    def update(self, instances, validated_data):
+        listing_ids = {booking.listing_id for booking in self._targets}
+        with transaction.atomic():
+            self._lock_dates(validated_data, exclude=[booking.pk for booking in self._targets])
+            bookings, fields = self.apply_changes(validated_data)
+            Booking.objects.bulk_update(bookings, sorted(fields), batch_size=settings.BULK_BATCH_SIZE)
+            listing_ids |= {booking.listing_id for booking in bookings}
+            transaction.on_commit(lambda: availability.invalidate_occupancy_many(listing_ids))
+            transaction.on_commit(lambda: calendars.invalidate_calendars(listing_ids))
+        return bookings
 
 
 class BookingSerializer(serializers.ModelSerializer):
     """Serializer for Booking model."""
     
     listing_title = serializers.CharField(source='listing.title', read_only=True)
-    listing_id = serializers.PrimaryKeyRelatedField(
+    listing_id = ListingIdField(
         source='listing',
         queryset=Listing.objects.all(),
         write_only=True
@@ -57,7 +409,10 @@ class BookingSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'listing', 'created_at', 'updated_at']
+        # Computed from the listing's rates when omitted (see pricing).
+        extra_kwargs = {'total_price': {'required': False}}
+        list_serializer_class = BookingBulkSerializer
     
     def validate(self, data):
         """Validate booking data."""
@@ -80,9 +435,158 @@ class BookingSerializer(serializers.ModelSerializer):
                     f"guests allowed ({listing.max_guests}) for this listing."
                 )
         
+        # Bulk writes check the dates of all items at once (BookingBulkSerializer).
+        if self._holds_dates(data) and not isinstance(self.parent, BookingBulkSerializer):
+            listing, check_in, check_out = self._booking_range(data)
+            if not availability.is_available(listing, check_in, check_out, exclude=self.instance):
+                raise serializers.ValidationError(
+                    "The listing is not available for the selected dates."
+                )
+        
+        # Bulk writes price all items at once as well.
+        if self._reprices(data) and not isinstance(self.parent, BookingBulkSerializer):
+            data['total_price'] = self._check_price(data, pricing.quote(*self._booking_range(data)))
+        
+        return data
+    
+    def _reprices(self, data):
+        """Return True if the booking must be quoted: it is new, or its dates or price change."""
+        if self.instance is not None and not PRICED_FIELDS & data.keys():
+            return False
+        return all(self._booking_range(data))
+    
+    def _check_price(self, data, quoted):
+        """
+        Return the quoted price of the booking.
+        
+        Clients may omit ``total_price``; one that is sent must match the
+        quote, so a payment is never initiated for a client-chosen amount.
+        """
+        sent = data.get('total_price')
+        if sent is not None and sent != quoted:
+            raise serializers.ValidationError(_price_error(quoted))
+        return quoted
+    
+    def _booking_range(self, data):
+        """Return ``(listing, check_in, check_out)`` merged with the instance."""
+        return tuple(
+            data.get(field, getattr(self.instance, field, None))
+            for field in ('listing', 'check_in', 'check_out')
+        )
+    
+    def _holds_dates(self, data):
+        """Return True if the booking will occupy its dates after saving."""
+        status = data.get('status', getattr(self.instance, 'status', 'pending'))
+        return status in availability.BLOCKING_STATUSES and all(self._booking_range(data))
+    
+    def _lock_dates(self, data):
+        """
+        Re-check availability while holding a row lock on the listing.
+        
+        Serializes concurrent bookings of the same listing so two requests
+        validated against the same free dates cannot both be saved.
+        """
+        if not self._holds_dates(data):
+            return
+        listing, check_in, check_out = self._booking_range(data)
+        Listing.objects.select_for_update().filter(pk=listing.pk).first()
+        if availability.overlapping_bookings(listing, check_in, check_out, exclude=self.instance).exists():
+            raise serializers.ValidationError(
+                "The listing is not available for the selected dates."
+            )
+    
+    def create(self, validated_data):
+        with transaction.atomic():
+            self._lock_dates(validated_data)
+            return super().create(validated_data)
+    
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self._lock_dates(validated_data)
+            return super().update(instance, validated_data)
+
+
+class ExportParamsSerializer(serializers.Serializer):
+    """Validates the query parameters of the export endpoints."""
+    
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.CharField(required=False)
+    
+    def validate(self, data):
+        """Validate the date range."""
+        start = data.get('start')
+        end = data.get('end')
+        if start and end and end < start:
+            raise serializers.ValidationError("end cannot be before start.")
+        return data
+
+
+class QuoteRangeSerializer(serializers.Serializer):
+    """One stay to price."""
+    
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    
+    def validate(self, data):
+        """Validate the date range."""
+        if data['check_out'] <= data['check_in']:
+            raise serializers.ValidationError("Check-out date must be after check-in date.")
         return data
 
 
+class QuoteRequestSerializer(serializers.Serializer):
+    """Validates the body of a quote request for several stays."""
+    
+    ranges = QuoteRangeSerializer(many=True, allow_empty=False, max_length=settings.QUOTE_MAX_RANGES)
+
+
+class CalendarParamsSerializer(serializers.Serializer):
+    """Validates the query parameters of the calendar endpoint."""
+    
+    months = serializers.IntegerField(min_value=1, max_value=settings.CALENDAR_MAX_MONTHS, default=1)
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        # ``from`` is a Python keyword, so it cannot be declared as an attribute.
+        fields['from'] = serializers.DateField(input_formats=['%Y-%m', 'iso-8601'], required=False)
+        return fields
+    
+    def validate(self, data):
+        """Start at the first day of the requested (or current) month."""
+        data['from'] = data.get('from', timezone.localdate()).replace(day=1)
+        return data
+
+
+class ReviewSerializer(serializers.ModelSerializer):
+    """Serializer for Review model."""
+    
+    listing_title = serializers.CharField(source='listing.title', read_only=True)
+    listing_id = ListingIdField(
+        source='listing',
+        queryset=Listing.objects.all(),
+        write_only=True
+    )
+    
+    class Meta:
+        model = Review
+        fields = [
+            'id',
+            'listing',
+            'listing_id',
+            'listing_title',
+            'reviewer_name',
+            'reviewer_email',
+            'rating',
+            'comment',
+            'created_at',
+            'updated_at',
+        ]
+        read_only_fields = ['id', 'listing', 'created_at', 'updated_at']
+        extra_kwargs = {'reviewer_email': {'write_only': True}}
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     """Serializer for Payment model."""
     
@@ -0,0 +1,153 @@
+"""
+Signal handlers for the listings app.
+"""
+import time
+from datetime import datetime
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import availability, calendars, metrics, ratings, response_cache
+from .models import Booking, Listing, Review
+
+
+def _booking_span(booking):
+    """Return ``(check_in, check_out, status)`` for a booking instance."""
+    return (booking.check_in, booking.check_out, booking.status)
+
+
+def _record_booking_change(listing_id, previous, current):
+    """Invalidate the listing's occupancy bitmap and calendar after a booking change."""
+    availability.record_booking_change(listing_id, previous, current)
+    calendars.record_booking_change(listing_id, previous, current)
+
+
+@receiver(post_save, sender=Booking)
+def update_occupancy_on_save(sender, instance, created, **kwargs):
+    """Invalidate the occupancy bitmap and calendar the saved booking affects."""
+    listing_id = instance.listing_id
+    current = _booking_span(instance)
+    loaded = getattr(instance, '_loaded_values', None)
+
+    if created:
+        transaction.on_commit(
+            lambda: _record_booking_change(listing_id, None, current)
+        )
+    elif loaded is None or not {'listing_id', 'check_in', 'check_out', 'status'} <= loaded.keys():
+        # Original values unknown (e.g. deferred fields); rebuild lazily.
+        def invalidate():
+            availability.invalidate_occupancy(listing_id)
+            calendars.invalidate_calendars([listing_id])
+        transaction.on_commit(invalidate)
+    else:
+        previous_listing_id = loaded['listing_id']
+        previous = (loaded['check_in'], loaded['check_out'], loaded['status'])
+        if previous_listing_id != listing_id:
+            transaction.on_commit(
+                lambda: _record_booking_change(previous_listing_id, previous, None)
+            )
+            transaction.on_commit(
+                lambda: _record_booking_change(listing_id, None, current)
+            )
+        elif previous != current:
+            transaction.on_commit(
+                lambda: _record_booking_change(listing_id, previous, current)
+            )
+
+    instance._loaded_values = {
+        'listing_id': listing_id,
+        'check_in': instance.check_in,
+        'check_out': instance.check_out,
+        'status': instance.status,
+    }
+
+
+@receiver(post_delete, sender=Booking)
+def update_occupancy_on_delete(sender, instance, **kwargs):
+    """Free the nights of a deleted booking."""
+    listing_id = instance.listing_id
+    previous = _booking_span(instance)
+    transaction.on_commit(
+        lambda: _record_booking_change(listing_id, previous, None)
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    """Fold a new or edited review into its listing's rating aggregates."""
+    loaded = getattr(instance, '_loaded_values', None)
+    if created:
+        ratings.apply_rating_change(instance.listing_id, 1, instance.rating)
+    elif loaded is None or not {'listing_id', 'rating'} <= loaded.keys():
+        # Original values unknown (e.g. deferred fields); recompute.
+        ratings.rebuild_ratings(Listing.objects.filter(pk=instance.listing_id))
+    elif loaded['listing_id'] != instance.listing_id:
+        ratings.apply_rating_change(loaded['listing_id'], -1, -loaded['rating'])
+        ratings.apply_rating_change(instance.listing_id, 1, instance.rating)
+    elif loaded['rating'] != instance.rating:
+        ratings.apply_rating_change(instance.listing_id, 0, instance.rating - loaded['rating'])
+
+    for listing_id in {instance.listing_id, (loaded or {}).get('listing_id')} - {None}:
+        transaction.on_commit(lambda pk=listing_id: ratings.invalidate_rating_histogram(pk))
+
+    instance._loaded_values = {
+        'listing_id': instance.listing_id,
+        'rating': instance.rating,
+    }
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    """Remove a deleted review from its listing's rating aggregates."""
+    rating = getattr(instance, '_loaded_values', {}).get('rating', instance.rating)
+    ratings.apply_rating_change(instance.listing_id, -1, -rating)
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: ratings.invalidate_rating_histogram(listing_id))
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_listing_responses(sender, instance, **kwargs):
+    """Make cached list and detail responses for the listing unreachable."""
+    listing_id = instance.pk
+    transaction.on_commit(lambda: response_cache.bump_listing(listing_id))
+
+
+# Start time and queue wait of the tasks running in this worker process.
+_running_tasks = {}
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    """Record when a task was sent so the worker can measure its queue wait."""
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    """Note when a worker picks up a task and how long it was queued."""
+    started = time.time()
+    wait = None
+    published_at = task.request.get('published_at')
+    if published_at is not None:
+        ready_at = published_at
+        eta = task.request.eta
+        if eta:
+            # A countdown/ETA task is not late while it waits for its ETA.
+            ready_at = max(ready_at, datetime.fromisoformat(eta).timestamp())
+        wait = max(0.0, started - ready_at)
+    _running_tasks[task_id] = (time.perf_counter(), wait)
+
+
+@task_postrun.connect
+def record_task_metrics(task_id=None, task=None, state=None, **kwargs):
+    """Record the queue wait, run time and outcome of a finished task."""
+    timing = _running_tasks.pop(task_id, None)
+    if timing is None:
+        return
+    started, wait = timing
+    queue = (task.request.delivery_info or {}).get('routing_key') or 'eager'
+    metrics.observe_task(task.name, queue, state or 'UNKNOWN', wait, time.perf_counter() - started)
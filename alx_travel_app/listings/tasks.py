@@ -1,19 +1,54 @@
+"""
+Celery tasks of the listings app.
+
+Tasks are routed to the ``email`` and ``payments`` queues (see
+``alx_travel_app/celery.py``) and nothing reads their results, so all of
+them set ``ignore_result``. Transient failures (database hiccups, an
+unreachable SMTP server, Chapa timeouts and 5xx responses) are retried
+with exponential backoff and full jitter; anything else fails the task
+so it shows up in the worker log and the task metrics.
+"""
+from datetime import timedelta
+
 from celery import shared_task
-from django.core.mail import send_mail
+from celery.utils.time import get_exponential_backoff_interval
 from django.conf import settings
+from django.db import OperationalError
+from .emails import flush_outbox, queue_email
 from .models import Payment, Booking
 
 
-@shared_task
+# Shared by the autoretrying tasks: 1s, 2s, 4s... capped, with full jitter.
+RETRY_POLICY = {
+    'retry_backoff': settings.TASK_RETRY_BACKOFF,
+    'retry_backoff_max': settings.TASK_RETRY_BACKOFF_MAX,
+    'retry_jitter': True,
+    'max_retries': settings.TASK_MAX_RETRIES,
+}
+
+
+def retry_countdown(retries):
+    """Backoff before retry number ``retries + 1``, matching RETRY_POLICY."""
+    return get_exponential_backoff_interval(
+        factor=settings.TASK_RETRY_BACKOFF,
+        retries=retries,
+        maximum=settings.TASK_RETRY_BACKOFF_MAX,
+        full_jitter=True,
+    )
+
+
+@shared_task(ignore_result=True, autoretry_for=(OperationalError,), **RETRY_POLICY)
 def send_booking_confirmation_email(booking_id):
     """
-    Send booking confirmation email to the customer.
+    Queue a booking confirmation email to the customer.
+    
+    The email is delivered by the next flush_email_outbox batch.
     
     Args:
         booking_id: ID of the Booking instance
     """
     try:
-        booking = Booking.objects.get(id=booking_id)
+        booking = Booking.objects.select_related('listing').get(id=booking_id)
         
         subject = f'Booking Confirmation - Booking #{booking.id}'
         
@@ -40,31 +75,25 @@ Best regards,
 ALX Travel App Team
         """
         
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[booking.guest_email],
-            fail_silently=False,
-        )
+        queue_email(subject, message, booking.guest_email)
         
-        return f"Booking confirmation email sent to {booking.guest_email}"
+        return f"Booking confirmation email queued for {booking.guest_email}"
     except Booking.DoesNotExist:
         return f"Booking with ID {booking_id} not found"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
 
 
-@shared_task
+@shared_task(ignore_result=True, autoretry_for=(OperationalError,), **RETRY_POLICY)
 def send_payment_confirmation_email(payment_id):
     """
-    Send payment confirmation email to the customer.
+    Queue a payment confirmation email to the customer.
+    
+    The email is delivered by the next flush_email_outbox batch.
     
     Args:
         payment_id: ID of the Payment instance
     """
     try:
-        payment = Payment.objects.get(id=payment_id)
+        payment = Payment.objects.select_related('booking__listing').get(id=payment_id)
         booking = payment.booking
         
         subject = f'Payment Confirmation - Booking #{booking.id}'
@@ -89,17 +118,80 @@ Best regards,
 ALX Travel App Team
         """
         
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[booking.guest_email],
-            fail_silently=False,
-        )
+        queue_email(subject, message, booking.guest_email)
         
-        return f"Confirmation email sent to {booking.guest_email}"
+        return f"Confirmation email queued for {booking.guest_email}"
     except Payment.DoesNotExist:
         return f"Payment with ID {payment_id} not found"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
 
+
+# SMTPException and socket errors are OSErrors. Failures of single messages
+# are handled by send_batch; only connection-level errors reach here.
+@shared_task(ignore_result=True, autoretry_for=(OSError, OperationalError), **RETRY_POLICY)
+def flush_email_outbox():
+    """
+    Send queued emails in batches over a single SMTP connection.
+    """
+    totals = flush_outbox()
+    return (
+        f"Flushed email outbox in {totals['batches']} batches: "
+        f"{totals['sent']} sent, {totals['failed']} failed"
+    )
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=settings.TASK_MAX_RETRIES)
+def initiate_payment(self, payment_id, base_url=None):
+    """
+    Initiate a pending payment with Chapa outside the request cycle.
+    
+    Transient Chapa failures are retried with backoff; the payment is
+    marked failed only once Chapa rejects it or the retries run out.
+    
+    Args:
+        payment_id: ID of the Payment instance
+        base_url: Site URL used to build Chapa's callback and return URLs
+    """
+    from .views import initiate_chapa_payment, apply_chapa_initiation
+    
+    try:
+        payment = Payment.objects.select_related('booking__listing').get(id=payment_id)
+    except Payment.DoesNotExist:
+        return f"Payment with ID {payment_id} not found"
+    
+    if payment.status != 'pending' or payment.payment_url:
+        return f"Payment {payment_id} already initiated"
+    
+    try:
+        chapa_response = initiate_chapa_payment(payment.booking, payment, base_url=base_url)
+    except Exception:
+        payment.status = 'failed'
+        payment.save()
+        raise
+    
+    if chapa_response.get('retryable') and self.request.retries < self.max_retries:
+        raise self.retry(countdown=retry_countdown(self.request.retries))
+    if apply_chapa_initiation(payment, chapa_response):
+        return f"Payment {payment_id} initiated"
+    return f"Payment {payment_id} rejected: {chapa_response.get('message', 'Unknown error')}"
+
+
+@shared_task(ignore_result=True)
+def reconcile_pending_payments():
+    """
+    Verify pending payments with Chapa and apply their final status.
+    
+    Runs periodically from Celery beat (see CELERY_BEAT_SCHEDULE) to settle
+    abandoned checkouts and payments whose webhook never arrived.
+    """
+    from .payments import reconcile_pending_payments as reconcile
+    
+    totals = reconcile(
+        batch_size=settings.PAYMENT_RECONCILE_BATCH_SIZE,
+        concurrency=settings.PAYMENT_RECONCILE_CONCURRENCY,
+        min_age=timedelta(seconds=settings.PAYMENT_RECONCILE_MIN_AGE),
+    )
+    return (
+        f"Reconciled pending payments in {totals['batches']} batches: "
+        f"{totals['completed']} completed, {totals['failed']} failed, "
+        f"{totals['cancelled']} cancelled, {totals['unchanged']} unchanged"
+    )
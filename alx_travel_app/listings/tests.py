@@ -1,3 +1,2464 @@
-from django.test import TestCase
+import csv
+import hashlib
+import hmac
+import json
+import math
+import os
+import random
+import socket
+import tempfile
+import threading
+import time as time_module
+import uuid
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from alx_travel_app.celery import app as celery_app
+
+from . import (
+    amenities, availability, calendars, chapa, emails, geo, metrics, payments, pricing,
+    ratings, renderers, replicas, response_cache, signals, tasks,
+)
+from .management.commands import loadtest
+from .management.commands.chapa_stub import make_stub_server
+from .models import Booking, Listing, OutboundEmail, Payment, RateRule, Review
+from .pagination import CreatedAtCursorPagination
+from .query_budget import QueryBudgetExceeded
+from .serializers import BookingSerializer
+from .views import BookingViewSet
+
+
+def make_listing(**fields):
+    """Create a listing with sensible defaults for the fields not given."""
+    defaults = {
+        'title': 'Sea View Apartment',
+        'description': 'Two bedrooms by the beach.',
+        'address': '1 Beach Road',
+        'city': 'Mombasa',
+        'country': 'Kenya',
+        'price_per_night': Decimal('100.00'),
+        'property_type': 'apartment',
+        'max_guests': 4,
+        'bedrooms': 2,
+        'bathrooms': 1,
+    }
+    defaults.update(fields)
+    return Listing.objects.create(**defaults)
+
+
+def day(offset):
+    """Return the date ``offset`` days from today."""
+    return timezone.localdate() + timedelta(days=offset)
+
+
+def make_booking(listing, check_in, check_out, **fields):
+    """Create a booking of ``listing`` with defaults for the other fields."""
+    defaults = {
+        'guest_name': 'Amina Otieno',
+        'guest_email': 'amina@example.com',
+        'number_of_guests': 2,
+        'total_price': listing.price_per_night * (check_out - check_in).days,
+    }
+    defaults.update(fields)
+    return Booking.objects.create(listing=listing, check_in=check_in, check_out=check_out, **defaults)
+
+
+class BookingOverlapTests(TestCase):
+    """Overlap rules shared by the availability checks and booking validation."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+
+    def book(self, check_in, check_out, status='confirmed', listing=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                listing=listing or self.listing,
+                guest_name='Amina Otieno',
+                guest_email='amina@example.com',
+                check_in=check_in,
+                check_out=check_out,
+                number_of_guests=2,
+                total_price=Decimal('100.00'),
+                status=status,
+            )
+
+    def validate(self, check_in, check_out):
+        serializer = BookingSerializer(data={
+            'listing_id': self.listing.pk,
+            'guest_name': 'Brian Kamau',
+            'guest_email': 'brian@example.com',
+            'check_in': check_in.isoformat(),
+            'check_out': check_out.isoformat(),
+            'number_of_guests': 2,
+        })
+        return serializer.is_valid(), serializer.errors
+
+    def test_adjacent_ranges_are_allowed(self):
+        self.book(day(10), day(13))
+        # Checking in on the departure day, or out on the arrival day, shares no night.
+        self.assertTrue(availability.is_available(self.listing, day(13), day(15)))
+        self.assertTrue(availability.is_available(self.listing, day(8), day(10)))
+        self.assertFalse(availability.overlapping_bookings(self.listing, day(13), day(15)).exists())
+        self.assertTrue(self.validate(day(13), day(15))[0])
+
+    def test_overlapping_ranges_are_rejected(self):
+        booking = self.book(day(10), day(13))
+        for check_in, check_out in [
+            (day(12), day(14)),  # starts inside
+            (day(8), day(11)),  # ends inside
+            (day(9), day(14)),  # encloses
+            (day(11), day(12)),  # enclosed
+            (day(10), day(13)),  # same dates
+        ]:
+            with self.subTest(check_in=check_in, check_out=check_out):
+                self.assertFalse(availability.is_available(self.listing, check_in, check_out))
+                self.assertEqual(
+                    list(availability.overlapping_bookings(self.listing, check_in, check_out)),
+                    [booking],
+                )
+                valid, errors = self.validate(check_in, check_out)
+                self.assertFalse(valid)
+                self.assertIn('not available', str(errors['non_field_errors'][0]))
+
+    def test_other_listings_do_not_conflict(self):
+        self.book(day(10), day(13), listing=make_listing(title='Garden Cottage'))
+        self.assertTrue(availability.is_available(self.listing, day(10), day(13)))
+
+    def test_cancelled_bookings_are_ignored(self):
+        self.book(day(10), day(13), status='cancelled')
+        self.assertTrue(availability.is_available(self.listing, day(11), day(12)))
+        self.assertFalse(availability.overlapping_bookings(self.listing, day(11), day(12)).exists())
+        self.assertTrue(self.validate(day(11), day(12))[0])
+
+    def test_booking_does_not_conflict_with_itself(self):
+        booking = self.book(day(10), day(13))
+        self.assertTrue(availability.is_available(self.listing, day(11), day(14), exclude=booking))
+
+
+class OccupancyBitmapSyncTests(TestCase):
+    """The cached bitmap is dropped by booking writes and rebuilt from the database."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        # Cache the (empty) bitmap so later writes must drop it.
+        availability.get_occupancy(self.listing.pk)
+
+    def is_cached(self):
+        return cache.get(availability._cache_key(self.listing.pk)) is not None
+
+    def nights(self):
+        bitmap = availability.get_occupancy(self.listing.pk)
+        return list(bitmap.occupied_nights(day(0), day(30)))
+
+    def save(self, booking):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+
+    def create(self, check_in, check_out, status='pending'):
+        booking = Booking(
+            listing=self.listing,
+            guest_name='Amina Otieno',
+            guest_email='amina@example.com',
+            check_in=check_in,
+            check_out=check_out,
+            number_of_guests=2,
+            total_price=Decimal('100.00'),
+            status=status,
+        )
+        self.save(booking)
+        return Booking.objects.get(pk=booking.pk)
+
+    def test_create_drops_bitmap(self):
+        self.create(day(10), day(13))
+        self.assertFalse(self.is_cached())
+        self.assertEqual(self.nights(), [day(10), day(11), day(12)])
+        self.assertFalse(availability.is_available(self.listing, day(12), day(14)))
+
+    def test_cancelled_create_keeps_bitmap(self):
+        self.create(day(10), day(13), status='cancelled')
+        self.assertTrue(self.is_cached())
+        self.assertEqual(self.nights(), [])
+
+    def test_redating_moves_nights(self):
+        booking = self.create(day(10), day(13))
+        self.nights()
+        booking.check_in, booking.check_out = day(20), day(22)
+        self.save(booking)
+        self.assertFalse(self.is_cached())
+        self.assertEqual(self.nights(), [day(20), day(21)])
+        self.assertTrue(availability.is_available(self.listing, day(10), day(13)))
+        self.assertFalse(availability.is_available(self.listing, day(21), day(23)))
+
+    def test_cancelling_frees_nights(self):
+        booking = self.create(day(10), day(13))
+        self.nights()
+        booking.status = 'cancelled'
+        self.save(booking)
+        self.assertEqual(self.nights(), [])
+        self.assertTrue(availability.is_available(self.listing, day(10), day(13)))
+
+    def test_cancelling_keeps_nights_of_overlapping_booking(self):
+        # Two pending bookings can overlap when written without validation
+        # (e.g. by the admin); cancelling one must not free the other's nights.
+        first = self.create(day(10), day(13))
+        self.create(day(11), day(14))
+        self.nights()
+        first.status = 'cancelled'
+        self.save(first)
+        self.assertEqual(self.nights(), [day(11), day(12), day(13)])
+
+    def test_delete_frees_nights(self):
+        booking = self.create(day(10), day(13))
+        self.create(day(13), day(15))
+        self.nights()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertFalse(self.is_cached())
+        self.assertEqual(self.nights(), [day(13), day(14)])
+        self.assertTrue(availability.is_available(self.listing, day(10), day(13)))
+
+    def test_unrelated_save_keeps_bitmap(self):
+        booking = self.create(day(10), day(13))
+        self.nights()
+        booking.special_requests = 'Late arrival'
+        self.save(booking)
+        self.assertTrue(self.is_cached())
+
+
+class BulkOverlapTests(TestCase):
+    """Set-wise conflict checks used by the bulk booking endpoints."""
+
+    def setUp(self):
+        self.listing = make_listing()
+        self.other = make_listing(title='Garden Cottage')
+
+    def test_overlaps_within_reports_the_earlier_item(self):
+        conflicts = availability.overlaps_within({
+            0: (self.listing.pk, day(10), day(13)),
+            1: (self.listing.pk, day(13), day(15)),  # adjacent to 0
+            2: (self.listing.pk, day(14), day(16)),  # overlaps 1
+            3: (self.other.pk, day(10), day(13)),  # same dates, other listing
+            4: (self.listing.pk, day(1), day(20)),  # overlaps all of them
+        })
+        self.assertEqual(conflicts, {0: 4, 1: 4, 2: 4})
+        self.assertEqual(availability.overlaps_within({
+            0: (self.listing.pk, day(10), day(13)),
+            1: (self.listing.pk, day(13), day(15)),
+            2: (self.listing.pk, day(14), day(16)),
+        }), {2: 1})
+
+    def test_overlaps_existing_matches_stored_bookings(self):
+        stored = Booking.objects.create(
+            listing=self.listing, guest_name='Amina Otieno', guest_email='amina@example.com',
+            check_in=day(10), check_out=day(13), number_of_guests=2, total_price=Decimal('300.00'),
+        )
+        Booking.objects.create(
+            listing=self.listing, guest_name='Brian Kamau', guest_email='brian@example.com',
+            check_in=day(20), check_out=day(22), number_of_guests=2, total_price=Decimal('200.00'),
+            status='cancelled',
+        )
+        ranges = {
+            0: (self.listing.pk, day(8), day(10)),  # adjacent before
+            1: (self.listing.pk, day(12), day(14)),  # overlaps
+            2: (self.listing.pk, day(13), day(15)),  # adjacent after
+            3: (self.other.pk, day(10), day(13)),  # other listing
+            4: (self.listing.pk, day(20), day(22)),  # cancelled booking
+            5: (self.listing.pk, day(5), day(30)),  # encloses
+        }
+        self.assertEqual(availability.overlaps_existing(ranges), {1, 5})
+        self.assertEqual(availability.overlaps_existing(ranges, exclude=[stored.pk]), set())
+        self.assertEqual(availability.overlaps_existing({}), set())
+
+
+class BookingBulkEndpointTests(APITestCase):
+    """POST/PATCH /api/bookings/bulk/."""
+
+    url = '/api/bookings/bulk/'
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+
+    def item(self, check_in, check_out, **fields):
+        item = {
+            'listing_id': self.listing.pk,
+            'guest_name': 'Amina Otieno',
+            'guest_email': 'amina@example.com',
+            'check_in': check_in.isoformat(),
+            'check_out': check_out.isoformat(),
+            'number_of_guests': 2,
+            'total_price': str(self.listing.price_per_night * (check_out - check_in).days),
+        }
+        item.update(fields)
+        return item
+
+    def create(self, *items):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, list(items), format='json')
+
+    def update(self, *items):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(self.url, list(items), format='json')
+
+    def test_create_returns_bookings_in_request_order(self):
+        response = self.create(self.item(day(10), day(13)), self.item(day(13), day(15)))
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual([r['check_in'] for r in results], [day(10).isoformat(), day(13).isoformat()])
+        self.assertEqual(
+            [r['id'] for r in results],
+            list(Booking.objects.order_by('pk').values_list('pk', flat=True)),
+        )
+        self.assertFalse(availability.is_available(self.listing, day(12), day(14)))
+
+    def test_create_rejects_overlap_within_request(self):
+        response = self.create(
+            self.item(day(10), day(13)),
+            self.item(day(20), day(22)),
+            self.item(day(12), day(14)),
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(list(errors), ['2'])
+        self.assertIn('overlap item 0', str(errors['2']))
+        self.assertFalse(Booking.objects.exists())
+
+    def test_create_rejects_overlap_with_stored_booking(self):
+        self.create(self.item(day(10), day(13)))
+        response = self.create(self.item(day(1), day(3)), self.item(day(11), day(12)))
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(list(errors), ['1'])
+        self.assertIn('not available', str(errors['1']))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_create_ignores_cancelled_items(self):
+        response = self.create(
+            self.item(day(10), day(13)),
+            self.item(day(10), day(13), status='cancelled'),
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_update_excludes_rows_being_rewritten(self):
+        first, second = (
+            r['id'] for r in self.create(self.item(day(10), day(13)), self.item(day(13), day(15))).json()['results']
+        )
+        # Shifting onto its own nights, and swapping dates, only conflicts
+        # with the old versions of the rows being rewritten.
+        response = self.update(
+            {'id': first, 'check_in': day(13).isoformat(), 'check_out': day(15).isoformat()},
+            {'id': second, 'check_in': day(9).isoformat(), 'check_out': day(13).isoformat()},
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Booking.objects.get(pk=first).check_in, day(13))
+        self.assertEqual(Booking.objects.get(pk=second).check_in, day(9))
+        self.assertFalse(availability.is_available(self.listing, day(9), day(10)))
+
+    def test_update_rejects_overlap_with_other_stored_booking(self):
+        first, _ = (
+            r['id'] for r in self.create(self.item(day(10), day(13)), self.item(day(13), day(15))).json()['results']
+        )
+        response = self.update({'id': first, 'check_out': day(14).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not available', str(response.json()['errors']['0']))
+        self.assertEqual(Booking.objects.get(pk=first).check_out, day(13))
+
+    def test_create_reads_ids_back_without_insert_returning(self):
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', False):
+            response = self.create(
+                self.item(day(10), day(13)),
+                self.item(day(10), day(13), listing_id=make_listing(title='Garden Cottage').pk),
+            )
+        self.assertEqual(response.status_code, 201)
+        for result in response.json()['results']:
+            booking = Booking.objects.get(pk=result['id'])
+            self.assertEqual(booking.check_in.isoformat(), result['check_in'])
+            self.assertEqual(booking.listing.title, result['listing_title'])
+
+
+class ListingSearchTests(APITestCase):
+    """GET /api/listings/search/."""
+
+    url = '/api/listings/search/'
+
+    def setUp(self):
+        cache.clear()
+        self.beach = make_listing(title='Beach House', city='Mombasa', max_guests=6, price_per_night=Decimal('150.00'))
+        self.flat = make_listing(title='City Flat', city='Nairobi', max_guests=2, price_per_night=Decimal('60.00'))
+        self.villa = make_listing(title='Villa', city='mombasa', max_guests=8, price_per_night=Decimal('400.00'))
+        self.hidden = make_listing(title='Closed', city='Mombasa', is_available=False)
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {result['title'] for result in response.json()['results']}
+
+    def test_filters_on_listing_fields(self):
+        self.assertEqual(self.search(city='MOMBASA'), {'Beach House', 'Villa'})
+        self.assertEqual(self.search(guests=3), {'Beach House', 'Villa'})
+        self.assertEqual(self.search(min_price='100', max_price='200'), {'Beach House'})
+        self.assertEqual(self.search(city='Nairobi', guests=3), set())
+
+    def test_unavailable_listings_are_never_returned(self):
+        self.assertNotIn('Closed', self.search())
+
+    def test_excludes_listings_booked_for_the_dates(self):
+        make_booking(self.beach, day(10), day(13))
+        make_booking(self.villa, day(10), day(13), status='cancelled')
+        make_booking(self.flat, day(13), day(15))
+        found = self.search(check_in=day(11).isoformat(), check_out=day(13).isoformat())
+        # Cancelled bookings and adjacent stays do not block a listing.
+        self.assertEqual(found, {'City Flat', 'Villa'})
+        self.assertEqual(
+            self.search(check_in=day(12).isoformat(), check_out=day(14).isoformat()),
+            {'Villa'},
+        )
+
+    def test_rejects_invalid_parameters(self):
+        for params in [
+            {'min_price': '200', 'max_price': '100'},
+            {'check_in': day(1).isoformat()},
+            {'check_in': day(3).isoformat(), 'check_out': day(3).isoformat()},
+            {'guests': '0'},
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class CursorPaginationTests(APITestCase):
+    """Keyset pagination of the list endpoints."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.bookings = [make_booking(self.listing, day(2 * n), day(2 * n + 1)) for n in range(7)]
+        # Rows created in the same instant are ordered by id.
+        same_instant = timezone.now()
+        Booking.objects.filter(pk__in=[b.pk for b in self.bookings[2:5]]).update(created_at=same_instant)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            body = response.json()
+            self.assertLessEqual(len(body['results']), 3)
+            ids.extend(result['id'] for result in body['results'])
+            url = body['next']
+        return ids
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        expected = list(
+            Booking.objects.order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual(self.walk('/api/bookings/?page_size=3'), expected)
+
+    def test_rows_added_while_paging_are_not_repeated(self):
+        first = self.client.get('/api/bookings/?page_size=3').json()
+        make_booking(self.listing, day(40), day(41))
+        rest = self.walk(first['next'])
+        seen = [result['id'] for result in first['results']] + rest
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 7)
+
+    def test_page_size_is_capped(self):
+        Booking.objects.bulk_create([
+            Booking(
+                listing=self.listing, guest_name='Guest', guest_email='guest@example.com',
+                check_in=day(100 + n), check_out=day(101 + n), number_of_guests=1,
+                total_price=Decimal('100.00'),
+            )
+            for n in range(CreatedAtCursorPagination.max_page_size)
+        ])
+        response = self.client.get('/api/bookings/?page_size=1000')
+        self.assertEqual(len(response.json()['results']), CreatedAtCursorPagination.max_page_size)
+
+
+@override_settings(QUERY_BUDGET_ENFORCED=True, LISTING_CACHE_ENABLED=False)
+class QueryBudgetTests(APITestCase):
+    """List endpoints run a constant number of queries."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+
+    def add_rows(self, count):
+        for n in range(count):
+            listing = make_listing(title=f'Listing {n}')
+            booking = make_booking(listing, day(n), day(n + 1))
+            make_booking(self.listing, day(2 * n), day(2 * n + 1))
+            Payment.objects.create(booking=booking, amount=booking.total_price, transaction_id=f'tx-{booking.pk}')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [
+            '/api/listings/',
+            '/api/bookings/',
+            '/api/payments/',
+            f'/api/listings/{self.listing.pk}/bookings/',
+        ]
+        self.add_rows(1)
+        few = [self.count_queries(url) for url in urls]
+        self.add_rows(10)
+        many = [self.count_queries(url) for url in urls]
+        self.assertEqual(few, many)
+
+    def test_exceeding_a_budget_fails_the_request(self):
+        self.add_rows(1)
+        with mock.patch.object(BookingViewSet, 'query_budgets', {'list': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/bookings/')
+
+    def test_budget_is_not_checked_when_disabled(self):
+        self.add_rows(1)
+        with override_settings(QUERY_BUDGET_ENFORCED=False), \
+                mock.patch.object(BookingViewSet, 'query_budgets', {'list': 1}):
+            self.assertEqual(self.client.get('/api/bookings/').status_code, 200)
+
+
+class ChapaClientTests(SimpleTestCase):
+    """The pooled Chapa client against the local stub server."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = make_stub_server()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        host, port = cls.server.server_address[:2]
+        cls.base_url = f'http://{host}:{port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def make_client(self, **kwargs):
+        options = {
+            'secret_key': 'test-key',
+            'initialize_url': f'{self.base_url}/v1/transaction/initialize',
+            'verify_url': f'{self.base_url}/v1/transaction/verify/',
+        }
+        options.update(kwargs)
+        client = chapa.ChapaClient(**options)
+        self.addCleanup(client.close)
+        return client
+
+    def test_initialize_and_verify(self):
+        client = self.make_client()
+        response = client.initialize({'tx_ref': 'tx-1', 'amount': '100.0'})
+        self.assertEqual(response['status'], 'success')
+        self.assertIn('checkout_url', response['data'])
+        # Like Chapa, the reference is not echoed back.
+        self.assertNotIn('tx_ref', response['data'])
+        verified = client.verify('tx-1')
+        self.assertEqual(verified['data']['tx_ref'], 'tx-1')
+        self.assertEqual(verified['data']['status'], 'success')
+
+    def test_calls_share_one_session(self):
+        client = self.make_client()
+        session = client.session
+        client.verify('tx-1')
+        client.verify('tx-2')
+        self.assertIs(client.session, session)
+        self.assertEqual(session.headers['Authorization'], 'Bearer test-key')
+
+    def test_errors_are_returned_with_retryable_flag(self):
+        client = self.make_client(verify_url=f'{self.base_url}/missing/')
+        response = client.verify('tx-1')
+        self.assertEqual(response['status'], 'error')
+        self.assertFalse(response['retryable'])
+
+        with socket.socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            closed_port = unused.getsockname()[1]
+        client = self.make_client(verify_url=f'http://127.0.0.1:{closed_port}/verify/')
+        response = client.verify('tx-1')
+        self.assertEqual(response['status'], 'error')
+        self.assertTrue(response['retryable'])
+
+    def test_missing_secret_key_raises(self):
+        with self.assertRaises(ValueError):
+            self.make_client(secret_key='').verify('tx-1')
+
+    def test_shared_client_follows_setting_changes(self):
+        with override_settings(CHAPA_VERIFY_URL='http://chapa.test/verify/'):
+            self.assertEqual(chapa.get_client().verify_url, 'http://chapa.test/verify/')
+        self.assertEqual(chapa.get_client().verify_url, settings.CHAPA_VERIFY_URL)
+
+
+class EagerTasksMixin:
+    """Run Celery tasks inline while the test runs, as ``delay()`` would on a worker."""
+
+    def setUp(self):
+        super().setUp()
+        conf = celery_app.conf
+        previous = (conf.task_always_eager, conf.task_eager_propagates)
+        conf.task_always_eager = conf.task_eager_propagates = True
+
+        def restore():
+            conf.task_always_eager, conf.task_eager_propagates = previous
+        self.addCleanup(restore)
+
+
+class FakeChapaClient:
+    """Stands in for ``chapa.ChapaClient``; answers from canned responses."""
+
+    def __init__(self, initialize=None, verify_status='success'):
+        self.initialize_responses = list(initialize or [
+            {'status': 'success', 'data': {'checkout_url': 'https://checkout.chapa.test/pay'}},
+        ])
+        self.verify_status = verify_status
+        self.initialized = []
+        self.verified = []
+
+    def initialize(self, payload):
+        self.initialized.append(payload)
+        if len(self.initialize_responses) > 1:
+            return self.initialize_responses.pop(0)
+        return self.initialize_responses[0]
+
+    def verify(self, transaction_id):
+        self.verified.append(transaction_id)
+        return {
+            'status': 'success',
+            'data': {'tx_ref': transaction_id, 'status': self.verify_status},
+        }
+
+
+def use_chapa(testcase, client):
+    """Route the app's Chapa calls to ``client`` for the rest of the test."""
+    patcher = mock.patch.object(chapa, 'get_client', return_value=client)
+    patcher.start()
+    testcase.addCleanup(patcher.stop)
+    return client
+
+
+class PaymentInitiationTests(EagerTasksMixin, APITestCase):
+    """POST /api/bookings/ initiates the payment inline or from a Celery task."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.listing = make_listing()
+        self.chapa = use_chapa(self, FakeChapaClient())
+
+    def create_booking(self, **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/bookings/', {
+                'listing_id': self.listing.pk,
+                'guest_name': 'Amina Otieno',
+                'guest_email': 'amina@example.com',
+                'check_in': day(10).isoformat(),
+                'check_out': day(13).isoformat(),
+                'number_of_guests': 2,
+            }, format='json', **headers)
+
+    def test_sync_initiation_returns_payment_url(self):
+        response = self.create_booking()
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['payment_url'], 'https://checkout.chapa.test/pay')
+        payment = Payment.objects.get()
+        # The reference sent to Chapa is the one stored on the payment.
+        self.assertEqual(self.chapa.initialized[0]['tx_ref'], payment.transaction_id)
+
+    def test_prefer_respond_async_returns_202(self):
+        with mock.patch.object(tasks.initiate_payment, 'delay') as delay:
+            response = self.create_booking(HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202, response.content)
+        body = response.json()
+        self.assertEqual(response['Location'], body['status_url'])
+        self.assertEqual(body['payment']['status'], 'pending')
+        self.assertFalse(body['payment']['payment_url'])
+        self.assertEqual(self.chapa.initialized, [])
+        delay.assert_called_once()
+
+    @override_settings(CHAPA_ASYNC_INITIATION=True)
+    def test_async_setting_initiates_from_task(self):
+        response = self.create_booking()
+        self.assertEqual(response.status_code, 202, response.content)
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['payment_url'], 'https://checkout.chapa.test/pay')
+        self.assertEqual(len(self.chapa.initialized), 1)
+
+    def test_task_retries_transient_failures(self):
+        self.chapa.initialize_responses.insert(
+            0, {'status': 'error', 'message': 'timed out', 'retryable': True}
+        )
+        with mock.patch.object(tasks.initiate_payment, 'delay'):
+            self.create_booking(HTTP_PREFER='respond-async')
+        payment = Payment.objects.get()
+        # apply() runs the retries inline when it does not propagate them.
+        with mock.patch.object(tasks, 'retry_countdown', return_value=0):
+            tasks.initiate_payment.apply(args=[payment.pk], throw=False)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+        self.assertEqual(payment.payment_url, 'https://checkout.chapa.test/pay')
+        # The retry reuses the reference of the first attempt.
+        self.assertEqual(
+            [call['tx_ref'] for call in self.chapa.initialized],
+            [payment.transaction_id] * 2,
+        )
+
+    def test_task_marks_rejected_payment_failed(self):
+        self.chapa.initialize_responses = [{'status': 'failed', 'message': 'Invalid currency'}]
+        self.create_booking(HTTP_PREFER='respond-async')
+        self.assertEqual(Payment.objects.get().status, 'failed')
+
+    def test_task_does_not_initiate_twice(self):
+        self.create_booking(HTTP_PREFER='respond-async')
+        payment = Payment.objects.get()
+        tasks.initiate_payment.delay(payment.pk)
+        self.assertEqual(len(self.chapa.initialized), 1)
+
+
+@override_settings(CHAPA_WEBHOOK_SECRET='webhook-secret')
+class PaymentStatusTests(APITestCase):
+    """The Chapa webhook and verify endpoints apply a payment's outcome once."""
+
+    webhook_url = '/api/payments/webhook/'
+
+    def setUp(self):
+        cache.clear()
+        listing = make_listing()
+        self.booking = make_booking(listing, day(10), day(13))
+        self.payment = Payment.objects.create(
+            booking=self.booking, amount=self.booking.total_price, transaction_id='tx_ref_1_abc'
+        )
+        patcher = mock.patch.object(tasks.send_payment_confirmation_email, 'delay')
+        self.send_confirmation = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def deliver(self, event, secret='webhook-secret', signature=None):
+        body = json.dumps(event).encode()
+        if signature is None:
+            signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                self.webhook_url, body, content_type='application/json',
+                HTTP_X_CHAPA_SIGNATURE=signature,
+            )
+
+    def test_success_event_completes_payment_and_confirms_booking(self):
+        response = self.deliver({'tx_ref': 'tx_ref_1_abc', 'status': 'success'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.payment.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.booking.status, 'confirmed')
+        self.send_confirmation.assert_called_once_with(self.payment.pk)
+
+    def test_repeated_event_is_applied_once(self):
+        self.deliver({'tx_ref': 'tx_ref_1_abc', 'status': 'success'})
+        response = self.deliver({'tx_ref': 'tx_ref_1_abc', 'status': 'success'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['message'], 'Event already processed')
+        # A late, contradicting event does not move a settled payment either.
+        self.deliver({'tx_ref': 'tx_ref_1_abc', 'status': 'failed'})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.send_confirmation.call_count, 1)
+
+    def test_rejects_bad_signatures(self):
+        event = {'tx_ref': 'tx_ref_1_abc', 'status': 'success'}
+        self.assertEqual(self.deliver(event, secret='other-secret').status_code, 401)
+        self.assertEqual(self.deliver(event, signature='').status_code, 401)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+    def test_rejects_malformed_and_unknown_events(self):
+        self.assertEqual(self.deliver({'status': 'success'}).status_code, 400)
+        self.assertEqual(self.deliver({'tx_ref': 'tx_unknown', 'status': 'success'}).status_code, 404)
+
+    @override_settings(CHAPA_WEBHOOK_SECRET='')
+    def test_unconfigured_secret_refuses_events(self):
+        response = self.deliver({'tx_ref': 'tx_ref_1_abc', 'status': 'success'}, secret='')
+        self.assertEqual(response.status_code, 503)
+
+    def test_repeated_verify_is_applied_once(self):
+        client = use_chapa(self, FakeChapaClient())
+        for url, data in [
+            (f'/api/payments/{self.payment.pk}/verify/', None),
+            ('/api/payments/verify/', {'transaction_id': 'tx_ref_1_abc'}),
+        ]:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json()['payment']['status'], 'completed')
+        self.assertEqual(client.verified, ['tx_ref_1_abc', 'tx_ref_1_abc'])
+        self.send_confirmation.assert_called_once_with(self.payment.pk)
+
+    def test_verify_does_not_undo_a_completed_payment(self):
+        self.deliver({'tx_ref': 'tx_ref_1_abc', 'status': 'success'})
+        use_chapa(self, FakeChapaClient(verify_status='failed'))
+        response = self.client.post(f'/api/payments/{self.payment.pk}/verify/')
+        self.assertEqual(response.status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+
+
+class ReconciliationTests(TestCase):
+    """Pending payments are settled from Chapa's verify responses in batches."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.chapa_statuses = {}
+        patcher = mock.patch.object(
+            payments, '_verify_status', side_effect=lambda tx_ref: self.chapa_statuses.get(tx_ref)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(tasks.send_payment_confirmation_email, 'delay')
+        self.send_confirmation = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_payment(self, offset, chapa_status, booking_status='pending'):
+        booking = make_booking(self.listing, day(offset), day(offset + 2), status=booking_status)
+        tx_ref = f'tx_ref_{booking.pk}'
+        self.chapa_statuses[tx_ref] = chapa_status
+        return Payment.objects.create(booking=booking, amount=booking.total_price, transaction_id=tx_ref)
+
+    def reconcile(self, batch_size=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            return payments.reconcile_pending_payments(
+                batch_size=batch_size, concurrency=2, min_age=timedelta(0)
+            )
+
+    def assert_statuses(self, payment, payment_status, booking_status):
+        payment.refresh_from_db()
+        payment.booking.refresh_from_db()
+        self.assertEqual(payment.status, payment_status)
+        self.assertEqual(payment.booking.status, booking_status)
+
+    def test_applies_each_outcome(self):
+        completed = self.add_payment(10, 'success')
+        failed = self.add_payment(20, 'failed')
+        cancelled = self.add_payment(30, 'cancelled')
+        unknown = self.add_payment(40, None)
+        still_pending = self.add_payment(50, 'pending')
+
+        totals = self.reconcile()
+
+        self.assertEqual(totals, {
+            'batches': 3, 'completed': 1, 'failed': 1, 'cancelled': 1, 'unchanged': 2,
+        })
+        self.assert_statuses(completed, 'completed', 'confirmed')
+        self.assert_statuses(failed, 'failed', 'cancelled')
+        self.assert_statuses(cancelled, 'cancelled', 'cancelled')
+        self.assert_statuses(unknown, 'pending', 'pending')
+        self.assert_statuses(still_pending, 'pending', 'pending')
+        self.send_confirmation.assert_called_once_with(completed.pk)
+
+    def test_failed_payment_frees_the_dates(self):
+        self.add_payment(10, 'failed')
+        month = day(10).replace(day=1)
+        self.assertFalse(availability.is_available(self.listing, day(10), day(12)))
+        [(_, block)] = calendars.get_blocks(self.listing.pk, month, 1)
+        self.assertEqual(block[day(10).day - 1], calendars.PENDING)
+
+        self.reconcile()
+
+        self.assertTrue(availability.is_available(self.listing, day(10), day(12)))
+        [(_, block)] = calendars.get_blocks(self.listing.pk, month, 1)
+        self.assertEqual(block[day(10).day - 1], calendars.AVAILABLE)
+
+    def test_failed_payment_keeps_a_confirmed_booking(self):
+        payment = self.add_payment(10, 'failed', booking_status='confirmed')
+        self.reconcile()
+        self.assert_statuses(payment, 'failed', 'confirmed')
+        self.assertFalse(availability.is_available(self.listing, day(10), day(12)))
+
+    def test_skips_payments_settled_meanwhile(self):
+        payment = self.add_payment(10, 'failed')
+        batch = [(payment.pk, payment.booking_id, payment.transaction_id)]
+        Payment.objects.filter(pk=payment.pk).update(status='completed')
+
+        counts = payments.reconcile_batch(batch, concurrency=1)
+
+        self.assertEqual(counts['failed'], 0)
+        self.assertEqual(counts['unchanged'], 1)
+        self.assert_statuses(payment, 'completed', 'pending')
+
+    def test_leaves_young_payments(self):
+        payment = self.add_payment(10, 'success')
+        with self.captureOnCommitCallbacks(execute=True):
+            totals = payments.reconcile_pending_payments(
+                batch_size=10, concurrency=1, min_age=timedelta(hours=1)
+            )
+        self.assertEqual(totals['batches'], 0)
+        self.assert_statuses(payment, 'pending', 'pending')
+
+
+class PaymentFailureTests(TestCase):
+    """A failed or cancelled payment releases the booking it was holding."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+
+    def test_failed_status_cancels_pending_booking(self):
+        booking = make_booking(self.listing, day(10), day(12))
+        Payment.objects.create(booking=booking, amount=booking.total_price, transaction_id='tx_a')
+        availability.get_occupancy(self.listing.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payments.apply_payment_status('tx_a', 'cancelled')
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'cancelled')
+        self.assertTrue(availability.is_available(self.listing, day(10), day(12)))
+
+    def test_failed_status_keeps_confirmed_booking(self):
+        booking = make_booking(self.listing, day(10), day(12), status='confirmed')
+        Payment.objects.create(booking=booking, amount=booking.total_price, transaction_id='tx_b')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payments.apply_payment_status('tx_b', 'failed')
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'confirmed')
+
+
+class BouncingBackend(EmailBackend):
+    """Locmem backend that rejects messages to ``bounce@`` addresses."""
+
+    def send_messages(self, messages):
+        if any(to.startswith('bounce@') for message in messages for to in message.to):
+            raise OSError('550 mailbox unavailable')
+        return super().send_messages(messages)
+
+
+class UnreachableBackend(EmailBackend):
+    """Backend whose server cannot be reached."""
+
+    def open(self):
+        raise OSError('connection refused')
+
+
+@override_settings(EMAIL_BATCH_SIZE=3, EMAIL_BATCH_WINDOW=5, EMAIL_MAX_ATTEMPTS=2)
+class EmailOutboxTests(TestCase):
+    """Emails are queued in the outbox and sent in batches over one connection."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(tasks.flush_email_outbox, 'apply_async')
+        self.scheduled_flush = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(tasks.flush_email_outbox, 'delay')
+        self.immediate_flush = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue(self, count, recipient='guest@example.com'):
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(count):
+                emails.queue_email(f'Booking {n}', 'Thank you.', recipient)
+
+    def test_queue_schedules_one_flush_per_window(self):
+        self.queue(2)
+        self.assertEqual(OutboundEmail.objects.filter(status='pending').count(), 2)
+        self.scheduled_flush.assert_called_once_with(countdown=5)
+        self.immediate_flush.assert_not_called()
+        self.assertEqual(mail.outbox, [])
+
+    def test_full_batch_flushes_immediately(self):
+        self.queue(3)
+        self.scheduled_flush.assert_called_once_with(countdown=5)
+        self.immediate_flush.assert_called_once_with()
+        # The count restarts after the immediate flush.
+        self.queue(2)
+        self.immediate_flush.assert_called_once_with()
+
+    def test_new_window_restarts_the_count(self):
+        self.queue(2)
+        emails.flush_outbox()
+        self.queue(2)
+        self.assertEqual(self.scheduled_flush.call_count, 2)
+        self.immediate_flush.assert_not_called()
+
+    def test_send_batch_sends_one_batch(self):
+        self.queue(4)
+        stats = emails.send_batch()
+        self.assertEqual((stats['size'], stats['sent'], stats['failed']), (3, 3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status='pending').count(), 1)
+
+    def test_failed_message_is_retried_then_marked_failed(self):
+        self.queue(1, recipient='bounce@example.com')
+        self.queue(1)
+        connection = BouncingBackend()
+
+        stats = emails.send_batch(connection)
+        self.assertEqual((stats['sent'], stats['failed']), (1, 0))
+        bounced = OutboundEmail.objects.get(to='bounce@example.com')
+        self.assertEqual((bounced.status, bounced.attempts), ('pending', 1))
+        self.assertIn('550', bounced.last_error)
+
+        stats = emails.send_batch(connection)
+        self.assertEqual((stats['size'], stats['sent'], stats['failed']), (1, 0, 1))
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), ('failed', 2))
+        self.assertEqual(emails.send_batch(connection)['size'], 0)
+
+    def test_connection_failure_releases_the_batch(self):
+        self.queue(2)
+        with self.assertRaises(OSError):
+            emails.send_batch(UnreachableBackend())
+        self.assertEqual(OutboundEmail.objects.filter(status='pending', attempts=0).count(), 2)
+
+    @override_settings(EMAIL_SENDING_TIMEOUT=60)
+    def test_stale_claims_are_reclaimed(self):
+        self.queue(2)
+        stale, fresh = OutboundEmail.objects.order_by('id')
+        OutboundEmail.objects.filter(pk=stale.pk).update(
+            status='sending', updated_at=timezone.now() - timedelta(seconds=120)
+        )
+        OutboundEmail.objects.filter(pk=fresh.pk).update(status='sending', updated_at=timezone.now())
+
+        stats = emails.send_batch()
+
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(mail.outbox[0].subject, stale.subject)
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, 'sending')
+
+    def test_flush_outbox_drains_every_batch(self):
+        self.queue(7)
+        totals = emails.flush_outbox()
+        self.assertEqual(totals, {'batches': 3, 'sent': 7, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+
+
+class RatingAggregateTests(APITestCase):
+    """Review writes keep the listing's denormalized rating columns current."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.other = make_listing(title='Garden Cottage')
+
+    def review(self, rating, listing=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Review.objects.create(
+                listing=listing or self.listing,
+                reviewer_name='Amina Otieno',
+                rating=rating,
+                comment='Lovely stay.',
+            )
+
+    def save(self, review):
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()
+
+    def assert_rating(self, listing, count, total, average):
+        listing.refresh_from_db()
+        self.assertEqual(
+            (listing.rating_count, listing.rating_sum, listing.rating_average),
+            (count, total, Decimal(average)),
+        )
+
+    def test_create_adds_rating(self):
+        self.review(5)
+        self.review(2)
+        self.assert_rating(self.listing, 2, 7, '3.50')
+
+    def test_edit_applies_the_difference(self):
+        self.review(5)
+        review = Review.objects.get(pk=self.review(2).pk)
+        review.rating = 4
+        self.save(review)
+        self.assert_rating(self.listing, 2, 9, '4.50')
+
+    def test_moving_a_review_updates_both_listings(self):
+        self.review(5)
+        review = Review.objects.get(pk=self.review(3).pk)
+        review.listing = self.other
+        self.save(review)
+        self.assert_rating(self.listing, 1, 5, '5.00')
+        self.assert_rating(self.other, 1, 3, '3.00')
+
+    def test_delete_removes_rating(self):
+        self.review(5)
+        review = Review.objects.get(pk=self.review(2).pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assert_rating(self.listing, 1, 5, '5.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.all().delete()
+        self.assert_rating(self.listing, 0, 0, '0.00')
+
+    def test_rebuild_repairs_drifted_columns(self):
+        self.review(4)
+        self.review(3)
+        Listing.objects.update(rating_count=9, rating_sum=1, rating_average=Decimal('0.11'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            updated = ratings.rebuild_ratings()
+
+        self.assertEqual(updated, 2)
+        self.assert_rating(self.listing, 2, 7, '3.50')
+        self.assert_rating(self.other, 0, 0, '0.00')
+
+    def test_search_filters_and_sorts_on_the_stored_average(self):
+        self.review(4)
+        self.review(5, listing=self.other)
+        third = make_listing(title='Hill Lodge')
+        self.review(2, listing=third)
+
+        response = self.client.get('/api/listings/search/', {'min_rating': 3, 'ordering': '-rating_average'})
+
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.json()['results']]
+        self.assertEqual(ids, [self.other.pk, self.listing.pk])
+
+    def test_nested_pages_ignore_listing_ordering(self):
+        self.review(4)
+        make_booking(self.listing, day(10), day(12))
+        for action in ('reviews', 'bookings'):
+            response = self.client.get(
+                f'/api/listings/{self.listing.pk}/{action}/', {'ordering': 'price_per_night'}
+            )
+            self.assertEqual(response.status_code, 200, action)
+            self.assertEqual(len(response.json()['results']), 1)
+
+
+class ReviewApiTests(APITestCase):
+    """The reviews endpoints and the cached per-star histogram."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.other = make_listing(title='Garden Cottage')
+
+    def post_review(self, rating, listing=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/reviews/', {
+                'listing_id': (listing or self.listing).pk,
+                'reviewer_name': 'Amina Otieno',
+                'reviewer_email': 'amina@example.com',
+                'rating': rating,
+                'comment': 'Lovely stay.',
+            }, format='json')
+
+    def listing_reviews(self):
+        return self.client.get(f'/api/listings/{self.listing.pk}/reviews/').json()
+
+    def test_create_and_filter_reviews(self):
+        response = self.post_review(4)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertNotIn('reviewer_email', response.json())
+        self.assertEqual(response.json()['listing_title'], self.listing.title)
+        self.post_review(5, listing=self.other)
+
+        response = self.client.get('/api/reviews/', {'listing_id': self.other.pk})
+
+        self.assertEqual([item['rating'] for item in response.json()['results']], [5])
+
+    def test_rejects_out_of_range_rating(self):
+        self.assertEqual(self.post_review(6).status_code, 400)
+        self.assertEqual(self.post_review(0).status_code, 400)
+
+    def test_listing_reviews_include_histogram(self):
+        for rating in (5, 5, 3):
+            self.post_review(rating)
+        self.post_review(1, listing=self.other)
+
+        data = self.listing_reviews()
+
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(data['rating_count'], 3)
+        self.assertEqual(Decimal(str(data['rating_average'])), Decimal('4.33'))
+        self.assertEqual(data['rating_histogram'], {'1': 0, '2': 0, '3': 1, '4': 0, '5': 2})
+
+    def test_histogram_is_cached_until_a_review_changes(self):
+        self.post_review(5)
+        self.listing_reviews()
+        with self.assertNumQueries(0):
+            ratings.rating_histogram(self.listing.pk)
+
+        review_id = self.post_review(2).json()['id']
+        self.assertEqual(self.listing_reviews()['rating_histogram']['2'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/reviews/{review_id}/', {'rating': 3}, format='json')
+        histogram = self.listing_reviews()['rating_histogram']
+        self.assertEqual((histogram['2'], histogram['3']), (0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/reviews/{review_id}/')
+        self.assertEqual(self.listing_reviews()['rating_histogram']['3'], 0)
+
+
+class AmenityFilterTests(APITestCase):
+    """Amenity filters match on the bitmask derived from the amenities text."""
+
+    def setUp(self):
+        cache.clear()
+        self.wifi_parking = make_listing(title='Sea View', amenities='Wireless, Free Parking, Pool')
+        self.wifi = make_listing(title='City Loft', amenities='WiFi, Air Conditioning')
+        self.none = make_listing(title='Bush Camp', amenities='Campfire')
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['id'] for item in response.json()['results']}
+
+    def test_parse_recognizes_aliases_and_ignores_unknown_names(self):
+        mask = amenities.parse_amenities(' wifi , A/C,hot tub, Jacuzzi, sauna,')
+        self.assertEqual(sorted(amenities.amenity_codes(mask)), ['air_conditioning', 'hot_tub', 'wifi'])
+        self.assertEqual(amenities.parse_amenities(''), 0)
+
+    def test_mask_for_rejects_unknown_names(self):
+        self.assertEqual(
+            amenities.mask_for(['WiFi', 'parking']),
+            amenities.AMENITY_BITS['wifi'] | amenities.AMENITY_BITS['parking'],
+        )
+        with self.assertRaisesMessage(ValueError, 'Unknown amenity: sauna'):
+            amenities.mask_for(['wifi', ' sauna'])
+
+    def test_save_derives_flags(self):
+        self.assertEqual(
+            sorted(amenities.amenity_codes(self.wifi_parking.amenity_flags)),
+            ['parking', 'pool', 'wifi'],
+        )
+        self.wifi.amenities = 'Kitchen'
+        self.wifi.save(update_fields=['amenities'])
+        self.wifi.refresh_from_db()
+        self.assertEqual(amenities.amenity_codes(self.wifi.amenity_flags), ['kitchen'])
+
+    def test_list_and_search_require_every_amenity(self):
+        for url in ('/api/listings/', '/api/listings/search/'):
+            self.assertEqual(
+                self.ids(self.client.get(url, {'amenities': 'wifi'})),
+                {self.wifi_parking.pk, self.wifi.pk},
+            )
+            self.assertEqual(
+                self.ids(self.client.get(url, {'amenities': 'Internet,parking'})),
+                {self.wifi_parking.pk},
+            )
+
+    def test_unknown_amenity_is_rejected(self):
+        for url in ('/api/listings/', '/api/listings/search/'):
+            response = self.client.get(url, {'amenities': 'wifi,sauna'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('amenities', response.json())
+
+    def test_backfill_repairs_flags(self):
+        Listing.objects.update(amenity_flags=0)
+        out = StringIO()
+        call_command('backfill_amenities', batch_size=2, stdout=out)
+        self.assertIn('Scanned 3 listings, updated 2', out.getvalue())
+        self.wifi.refresh_from_db()
+        self.assertEqual(sorted(amenities.amenity_codes(self.wifi.amenity_flags)), ['air_conditioning', 'wifi'])
+
+
+@override_settings(LISTING_CACHE_ENABLED=True)
+class ResponseCacheTests(APITestCase):
+    """Listing responses are cached per version and dropped by writes."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.other = make_listing(title='Garden Cottage')
+        self.detail_url = f'/api/listings/{self.listing.pk}/'
+        self.other_url = f'/api/listings/{self.other.pk}/'
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def update(self, listing, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in fields.items():
+                setattr(listing, name, value)
+            listing.save()
+
+    def test_repeated_reads_hit(self):
+        for url in ('/api/listings/', self.detail_url):
+            self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+
+    def test_query_params_are_part_of_the_key(self):
+        self.get('/api/listings/')
+        self.assertEqual(self.get('/api/listings/', city='Mombasa')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/api/listings/', city='Mombasa')['X-Cache'], 'HIT')
+
+    def test_write_invalidates_its_detail_and_every_list(self):
+        for url in ('/api/listings/', self.detail_url, self.other_url):
+            self.get(url)
+
+        self.update(self.listing, title='Ocean View Apartment')
+
+        response = self.get(self.detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['title'], 'Ocean View Apartment')
+        response = self.get('/api/listings/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Ocean View Apartment', [item['title'] for item in response.json()['results']])
+        self.assertEqual(self.get(self.other_url)['X-Cache'], 'HIT')
+
+    def test_bump_all_invalidates_everything(self):
+        for url in ('/api/listings/', self.detail_url, self.other_url):
+            self.get(url)
+        response_cache.bump_all()
+        for url in ('/api/listings/', self.detail_url, self.other_url):
+            self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+
+    def test_errors_are_not_cached(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/listings/999999/').status_code, 404)
+        self.assertEqual(response_cache.stats()['hits'], 0)
+
+    def test_stats_count_hits_and_misses(self):
+        self.get(self.detail_url)
+        self.get(self.detail_url)
+        self.get(self.detail_url)
+        self.assertEqual(response_cache.stats(), {'hits': 2, 'misses': 1, 'hit_ratio': 2 / 3})
+        out = StringIO()
+        call_command('listing_cache_stats', reset=True, stdout=out)
+        self.assertIn('hits=2 misses=1', out.getvalue())
+        self.assertEqual(response_cache.stats()['hits'], 0)
+
+    @override_settings(LISTING_CACHE_ENABLED=False)
+    def test_disabled_cache_always_builds(self):
+        response = self.get(self.detail_url)
+        self.assertNotIn('X-Cache', response)
+
+
+class ConditionalGetTests(APITestCase):
+    """List and detail responses carry validators and answer 304 when unchanged."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.booking = make_booking(self.listing, day(10), day(12))
+        self.payment = Payment.objects.create(
+            booking=self.booking, amount=self.booking.total_price, transaction_id='tx_etag'
+        )
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response['ETag']
+
+    def assert_not_modified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def touch(self, obj):
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.save()
+
+    def test_unchanged_resources_return_304(self):
+        urls = [
+            '/api/listings/', f'/api/listings/{self.listing.pk}/',
+            '/api/bookings/', f'/api/bookings/{self.booking.pk}/',
+            '/api/payments/', f'/api/payments/{self.payment.pk}/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assert_not_modified(url, self.etag(url))
+
+    def test_if_modified_since_returns_304(self):
+        url = f'/api/bookings/{self.booking.pk}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_related_write_changes_etags(self):
+        urls = [
+            '/api/bookings/', f'/api/bookings/{self.booking.pk}/',
+            '/api/payments/', f'/api/payments/{self.payment.pk}/',
+        ]
+        before = {url: self.etag(url) for url in urls}
+        self.listing.title = 'Ocean View Apartment'
+        self.touch(self.listing)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=before[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], before[url])
+
+    def test_list_etag_changes_with_membership(self):
+        etag = self.etag('/api/bookings/')
+        make_booking(self.listing, day(20), day(22))
+        self.assertNotEqual(self.etag('/api/bookings/'), etag)
+
+    @override_settings(LISTING_CACHE_ENABLED=True)
+    def test_cached_listing_validators_need_no_query(self):
+        url = f'/api/listings/{self.listing.pk}/'
+        etag = self.etag(url)
+        with self.assertNumQueries(0):
+            self.assert_not_modified(url, etag)
+        self.listing.title = 'Ocean View Apartment'
+        self.touch(self.listing)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(LISTING_CACHE_ENABLED=True)
+    def test_no_listing_etag_while_replica_may_lag(self):
+        with mock.patch.object(response_cache, 'may_lag', return_value=True):
+            response = self.client.get(f'/api/listings/{self.listing.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_malformed_or_missing_ids_return_404(self):
+        for url in ('/api/bookings/abc/', '/api/payments/abc/', '/api/bookings/999999/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class FastJSONRendererTests(APITestCase):
+    """The orjson renderer produces the same bytes as DRF's JSONRenderer."""
+
+    def assert_same_output(self, data, media_type=None):
+        self.assertEqual(
+            renderers.FastJSONRenderer().render(data, media_type),
+            JSONRenderer().render(data, media_type),
+        )
+
+    def test_matches_stock_renderer_on_special_values(self):
+        self.assert_same_output({
+            'price': Decimal('150.00'),
+            'aware': datetime(2026, 3, 1, 12, 30, 5, 123456, tzinfo=dt_timezone.utc),
+            'naive': datetime(2026, 3, 1, 12, 0),
+            'date': date(2026, 3, 1),
+            'time': time(10, 5),
+            'duration': timedelta(hours=1),
+            'uuid': uuid.UUID(int=5),
+            'text': 'Café \u2028 \u2029 \U0001f3d6',
+            'float': 1.5,
+            'none': None,
+            'flag': True,
+            1: 'non-string key',
+            'nested': [1, {'a': 'b'}],
+        })
+
+    def test_matches_stock_renderer_on_api_responses(self):
+        listing = make_listing(amenities='WiFi, Pool')
+        booking = make_booking(listing, day(10), day(12))
+        for url in ('/api/listings/', f'/api/listings/{listing.pk}/', f'/api/bookings/{booking.pk}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIsInstance(response.accepted_renderer, renderers.FastJSONRenderer)
+                self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_indented_output_uses_stock_renderer(self):
+        self.assert_same_output({'a': [1, 2]}, 'application/json; indent=2')
+
+    def test_none_renders_empty_body(self):
+        self.assertEqual(renderers.FastJSONRenderer().render(None), b'')
+
+    def test_falls_back_without_orjson(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assert_same_output({'price': Decimal('1.10'), 'text': 'café'})
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTests(APITestCase):
+    """Bookings and payments stream as NDJSON or CSV with the export filters."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.bookings = [
+            make_booking(self.listing, day(10 + 3 * n), day(12 + 3 * n), status=status)
+            for n, status in enumerate(['pending', 'confirmed', 'confirmed', 'cancelled', 'completed'])
+        ]
+        # Created on 2026-03-01 .. 2026-03-05, one per day.
+        for n, booking in enumerate(self.bookings):
+            created = timezone.make_aware(datetime(2026, 3, 1 + n, 12))
+            Booking.objects.filter(pk=booking.pk).update(created_at=created)
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def ndjson_ids(self, **params):
+        body = self.export('/api/bookings/export/', **params)
+        return [json.loads(line)['id'] for line in body.splitlines()]
+
+    def test_ndjson_streams_every_row_across_batches(self):
+        response = self.client.get('/api/bookings/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('bookings.ndjson', response['Content-Disposition'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [b.pk for b in self.bookings])
+        first = rows[0]
+        self.assertEqual(first['listing_title'], self.listing.title)
+        self.assertEqual(first['total_price'], '200.00')
+        self.assertEqual(first['check_in'], day(10).isoformat())
+
+    def test_csv_has_header_and_rows(self):
+        body = self.export('/api/bookings/export/', output='csv')
+        rows = list(csv.reader(body.splitlines()))
+        self.assertEqual(rows[0][:3], ['id', 'listing_id', 'listing_title'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [b.pk for b in self.bookings])
+
+    def test_filters_by_created_date_and_status(self):
+        ids = [b.pk for b in self.bookings]
+        self.assertEqual(self.ndjson_ids(start='2026-03-02', end='2026-03-04'), ids[1:4])
+        self.assertEqual(self.ndjson_ids(start='2026-03-04'), ids[3:])
+        self.assertEqual(self.ndjson_ids(end='2026-03-01'), ids[:1])
+        self.assertEqual(self.ndjson_ids(status='confirmed'), ids[1:3])
+        self.assertEqual(self.ndjson_ids(status='confirmed', start='2026-03-03'), ids[2:3])
+
+    def test_rejects_invalid_parameters(self):
+        for params in ({'status': 'refunded'}, {'start': '2026-03-05', 'end': '2026-03-01'},
+                       {'output': 'xml'}, {'start': 'March'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/bookings/export/', params).status_code, 400)
+
+    def test_payment_export(self):
+        records = [
+            Payment.objects.create(
+                booking=booking, amount=booking.total_price, transaction_id=f'tx_{booking.pk}',
+                status='completed' if n % 2 else 'pending',
+            )
+            for n, booking in enumerate(self.bookings)
+        ]
+        body = self.export('/api/payments/export/', output='csv', status='completed')
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual([int(row['id']) for row in rows], [p.pk for p in records[1::2]])
+        self.assertEqual(rows[0]['amount'], '200.00')
+        self.assertEqual(rows[0]['listing_title'], self.listing.title)
+        response = self.client.get('/api/payments/export/', {'status': 'confirmed'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SeedCommandTests(TestCase):
+    """The seed command generates consistent synthetic data."""
+
+    def seed(self, *args):
+        call_command('seed', *args, stdout=StringIO())
+
+    def snapshot(self):
+        return (
+            list(Listing.objects.order_by('pk').values_list('title', 'price_per_night', 'amenities')),
+            list(Booking.objects.order_by('pk').values_list('check_in', 'check_out', 'status')),
+            list(Review.objects.order_by('pk').values_list('rating', flat=True)),
+        )
+
+    def test_generates_the_requested_rows(self):
+        self.seed('--listings', '7', '--bookings-per-listing', '4', '--reviews', '3', '--chunk-size', '3')
+        self.assertEqual(Listing.objects.count(), 7)
+        self.assertEqual(Booking.objects.count(), 28)
+        self.assertEqual(Payment.objects.count(), 28)
+        self.assertEqual(Review.objects.count(), 21)
+
+    def test_rows_are_consistent(self):
+        self.seed('--listings', '6', '--bookings-per-listing', '8', '--reviews', '4', '--chunk-size', '4')
+
+        ranges = dict(enumerate(Booking.objects.values_list('listing_id', 'check_in', 'check_out')))
+        self.assertEqual(availability.overlaps_within(ranges), {})
+        for payment in Payment.objects.select_related('booking'):
+            self.assertEqual(payment.amount, payment.booking.total_price)
+            self.assertEqual(payment.status, {
+                'pending': 'pending', 'confirmed': 'completed',
+                'completed': 'completed', 'cancelled': 'cancelled',
+            }[payment.booking.status])
+        for listing in Listing.objects.all():
+            self.assertEqual(listing.amenity_flags, amenities.parse_amenities(listing.amenities))
+            self.assertEqual(listing.geo_cell, geo.encode(listing.latitude, listing.longitude))
+
+        stored = list(Listing.objects.order_by('pk').values_list('rating_count', 'rating_sum', 'rating_average'))
+        ratings.rebuild_ratings()
+        rebuilt = list(Listing.objects.order_by('pk').values_list('rating_count', 'rating_sum', 'rating_average'))
+        self.assertEqual(stored, rebuilt)
+
+    def test_output_depends_only_on_seed_and_chunk_size(self):
+        self.seed('--listings', '5', '--bookings-per-listing', '3', '--reviews', '2', '--chunk-size', '2')
+        first = self.snapshot()
+        self.seed('--clear', '--listings', '5', '--bookings-per-listing', '3', '--reviews', '2', '--chunk-size', '2')
+        self.assertEqual(self.snapshot(), first)
+        self.seed('--clear', '--listings', '5', '--bookings-per-listing', '3', '--reviews', '2',
+                  '--chunk-size', '2', '--seed', '7')
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_appends_after_existing_rows(self):
+        existing = make_listing()
+        self.seed('--listings', '2', '--bookings-per-listing', '1', '--reviews', '0')
+        self.assertEqual(Listing.objects.count(), 3)
+        self.assertEqual(Listing.objects.filter(pk__gt=existing.pk).count(), 2)
+        # New rows can still be created after explicit primary keys.
+        make_listing(title='After Seeding')
+
+    def test_clear_removes_everything(self):
+        self.seed('--listings', '2', '--bookings-per-listing', '2', '--reviews', '1')
+        listing_id = Listing.objects.first().pk
+        availability.get_occupancy(listing_id)
+        self.seed('--clear', '--listings', '1', '--bookings-per-listing', '0', '--reviews', '0')
+        self.assertIsNone(cache.get(availability._cache_key(listing_id)))
+        self.assertEqual(Listing.objects.count(), 1)
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(Payment.objects.exists())
+        self.assertFalse(Review.objects.exists())
+
+    def test_default_creates_the_samples(self):
+        self.seed()
+        self.assertEqual(Listing.objects.count(), 5)
+        self.assertEqual(Booking.objects.count(), 3)
+        self.assertEqual(Review.objects.count(), 4)
+
+    def test_rejects_invalid_sizes(self):
+        for args in (['--listings', '0'], ['--listings', '1', '--chunk-size', '0'],
+                     ['--listings', '1', '--reviews', '-1']):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                self.seed(*args)
+
+
+class LoadTestHelperTests(SimpleTestCase):
+    """Statistics and client selection of the loadtest command."""
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 0.50), 50)
+        self.assertEqual(loadtest.percentile(values, 0.99), 99)
+        self.assertEqual(loadtest.percentile([7], 0.95), 7)
+        self.assertIsNone(loadtest.percentile([], 0.5))
+
+    def test_summary_excludes_failures_from_latency(self):
+        summary = loadtest.summarize(
+            [0.010, 0.030, 0.020, 0.040], Counter({'200': 4, '500': 1, 'ConnectionError': 1}), 2.0
+        )
+        self.assertEqual(summary['requests'], 6)
+        self.assertEqual(summary['errors'], 2)
+        self.assertEqual(summary['statuses'], {'200': 4, '500': 1, 'ConnectionError': 1})
+        self.assertEqual(summary['throughput'], 2.0)
+        self.assertEqual(summary['mean_ms'], 25.0)
+        self.assertEqual((summary['p50_ms'], summary['p99_ms'], summary['max_ms']), (20.0, 40.0, 40.0))
+
+    def test_summary_without_successes(self):
+        summary = loadtest.summarize([], Counter({'503': 3}), 1.0)
+        self.assertEqual((summary['errors'], summary['throughput']), (3, 0.0))
+        self.assertIsNone(summary['p50_ms'])
+
+    def scenario_clients(self, name, vendor='sqlite', options=None):
+        command = loadtest.Command(stdout=StringIO())
+        fake = mock.Mock(vendor=vendor, settings_dict={'OPTIONS': options or {}})
+        with mock.patch.object(loadtest, 'connection', fake):
+            return command.scenario_clients(name, {'clients': 8})
+
+    def test_sqlite_writes_use_one_client(self):
+        self.assertEqual(self.scenario_clients('booking_create'), 1)
+        self.assertEqual(self.scenario_clients('payment_verify'), 1)
+        self.assertEqual(self.scenario_clients('listing_list'), 8)
+        self.assertEqual(self.scenario_clients('booking_create', vendor='postgresql'), 8)
+        self.assertEqual(
+            self.scenario_clients('booking_create', options={'transaction_mode': 'IMMEDIATE'}), 8
+        )
+
+    def test_rejects_unknown_scenarios(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown scenarios: search'):
+            call_command('loadtest', scenarios='listing_list,search', stdout=StringIO())
+
+    def test_compare_reports_relative_change(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'commit': 'abc123', 'results': {
+                'listing_list': {'throughput': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 40.0},
+            }}, f)
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        loadtest.Command(stdout=out).compare(f.name, {'results': {
+            'listing_list': {'throughput': 150.0, 'p50_ms': 5.0, 'p95_ms': 20.0, 'p99_ms': None},
+            'booking_create': {'throughput': 10.0},
+        }})
+        self.assertIn('Compared with abc123', out.getvalue())
+        self.assertIn('throughput +50.0%  p50_ms -50.0%  p95_ms +0.0%', out.getvalue())
+        self.assertNotIn('booking_create', out.getvalue())
+
+
+def metric_samples():
+    """Return the current ``/metrics`` samples as ``{series: value}``."""
+    samples = {}
+    for line in metrics.render().splitlines():
+        if line and not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            samples[series] = float(value.replace('+Inf', 'inf'))
+    return samples
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='', LISTING_CACHE_ENABLED=False)
+class MetricsTests(APITestCase):
+    """Per-route request, SQL and Chapa metrics exposed on /metrics."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.before = metric_samples()
+
+    def delta(self, series):
+        return metric_samples().get(series, 0) - self.before.get(series, 0)
+
+    def test_request_is_recorded_under_its_route(self):
+        self.assertEqual(self.client.get('/api/listings/').status_code, 200)
+        self.assertEqual(self.client.get('/api/listings/999999/').status_code, 404)
+
+        labels = 'route="listing-list",method="GET"'
+        self.assertEqual(self.delta(f'http_request_duration_seconds_count{{{labels},status="200"}}'), 1)
+        self.assertEqual(self.delta(f'http_response_size_bytes_count{{{labels}}}'), 1)
+        self.assertEqual(self.delta(f'db_queries_per_request_count{{{labels}}}'), 1)
+        self.assertGreater(self.delta(f'db_queries_per_request_sum{{{labels}}}'), 0)
+        self.assertEqual(self.delta(
+            'http_request_duration_seconds_count{route="listing-detail",method="GET",status="404"}'
+        ), 1)
+
+    def test_streamed_queries_are_counted_when_the_stream_closes(self):
+        make_booking(self.listing, day(10), day(12))
+        labels = 'route="booking-export",method="GET"'
+        response = self.client.get('/api/bookings/export/')
+        self.assertEqual(self.delta(f'db_queries_per_request_count{{{labels}}}'), 0)
+
+        body = b''.join(response.streaming_content)
+        response.close()
+
+        self.assertEqual(self.delta(f'db_queries_per_request_count{{{labels}}}'), 1)
+        self.assertGreaterEqual(self.delta(f'db_queries_per_request_sum{{{labels}}}'), 2)
+        self.assertEqual(self.delta(f'http_response_size_bytes_sum{{{labels}}}'), len(body))
+        # Queries after the stream closed are not attributed to it.
+        Listing.objects.count()
+        response.close()
+        self.assertEqual(self.delta(f'db_queries_per_request_count{{{labels}}}'), 1)
+
+    def test_chapa_time_is_attributed_to_the_request(self):
+        booking = make_booking(self.listing, day(10), day(12))
+        Payment.objects.create(booking=booking, amount=booking.total_price, transaction_id='tx_metrics')
+
+        def verify(tx_ref):
+            metrics.observe_chapa('verify', 200, 0.25)
+            return {'status': 'success', 'data': {'status': 'pending'}}
+
+        with mock.patch('alx_travel_app.listings.views.verify_chapa_payment', side_effect=verify):
+            self.client.post('/api/payments/verify/', {'transaction_id': 'tx_metrics'}, format='json')
+
+        self.assertEqual(self.delta('chapa_request_duration_seconds_count{operation="verify",status="200"}'), 1)
+        self.assertEqual(self.delta('chapa_request_seconds_total{route="verify-payment",method="POST"}'), 0.25)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', ('name',), buckets=(1, 5))
+        for value in (0.5, 1, 3, 9):
+            histogram.observe(('a"b',), value)
+        self.assertEqual(list(histogram.samples()), [
+            'test_seconds_bucket{name="a\\"b",le="1"} 2',
+            'test_seconds_bucket{name="a\\"b",le="5"} 3',
+            'test_seconds_bucket{name="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{name="a\\"b"} 13.5',
+            'test_seconds_count{name="a\\"b"} 4',
+        ])
+
+    def test_metrics_endpoint(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE http_request_duration_seconds histogram', response.content)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_metrics_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_record_nothing(self):
+        self.client.get('/api/listings/')
+        self.assertEqual(self.delta(
+            'http_request_duration_seconds_count{route="listing-list",method="GET",status="200"}'
+        ), 0)
+
+
+class TaskRetryTests(EagerTasksMixin, TestCase):
+    """Tasks retry transient failures with backoff and are timed per outcome."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.booking = make_booking(make_listing(), day(10), day(12))
+
+    def test_tasks_are_routed_to_their_queues(self):
+        router = celery_app.amqp.router
+        for name, queue in [
+            ('send_booking_confirmation_email', 'email'),
+            ('flush_email_outbox', 'email'),
+            ('initiate_payment', 'payments'),
+            ('reconcile_pending_payments', 'payments'),
+        ]:
+            with self.subTest(task=name):
+                route = router.route({}, f'alx_travel_app.listings.tasks.{name}')
+                self.assertEqual(route['queue'].name, queue)
+
+    @override_settings(TASK_RETRY_BACKOFF=2, TASK_RETRY_BACKOFF_MAX=30)
+    def test_retry_countdown_is_capped_with_jitter(self):
+        for retries, ceiling in [(0, 2), (1, 4), (3, 16), (10, 30)]:
+            for _ in range(20):
+                self.assertTrue(0 <= tasks.retry_countdown(retries) <= ceiling)
+
+    def test_database_errors_are_retried(self):
+        with mock.patch.object(
+            tasks, 'queue_email', side_effect=[OperationalError('server closed the connection'), None]
+        ) as queue_email:
+            tasks.send_booking_confirmation_email.apply(args=[self.booking.pk], throw=False)
+        self.assertEqual(queue_email.call_count, 2)
+
+    def test_gives_up_after_max_retries(self):
+        # Retries run nested in eager mode; keep the final error in the result.
+        celery_app.conf.task_eager_propagates = False
+        task = tasks.send_booking_confirmation_email
+        with mock.patch.object(task, 'max_retries', 2), mock.patch.object(
+            tasks, 'queue_email', side_effect=OperationalError('server closed the connection')
+        ) as queue_email:
+            result = task.apply(args=[self.booking.pk], throw=False)
+        self.assertEqual(queue_email.call_count, 3)
+        self.assertIsInstance(result.result, OperationalError)
+
+    def test_other_errors_are_not_retried(self):
+        with mock.patch.object(tasks, 'queue_email', side_effect=KeyError('subject')) as queue_email:
+            result = tasks.send_booking_confirmation_email.apply(args=[self.booking.pk], throw=False)
+        self.assertEqual(queue_email.call_count, 1)
+        self.assertEqual(result.state, 'FAILURE')
+
+    def test_smtp_connection_errors_are_retried(self):
+        with mock.patch.object(
+            tasks, 'flush_outbox',
+            side_effect=[ConnectionRefusedError(), {'batches': 1, 'sent': 1, 'failed': 0}],
+        ) as flush:
+            result = tasks.flush_email_outbox.apply(throw=False)
+        self.assertEqual(flush.call_count, 2)
+        self.assertEqual(result.state, 'SUCCESS')
+
+    def test_finished_tasks_are_recorded(self):
+        series = (
+            'celery_task_duration_seconds_count{'
+            'task="alx_travel_app.listings.tasks.send_booking_confirmation_email",outcome="SUCCESS"}'
+        )
+        before = metric_samples().get(series, 0)
+        with self.assertLogs('alx_travel_app.listings.metrics', 'INFO') as logs:
+            tasks.send_booking_confirmation_email.apply(args=[self.booking.pk])
+        self.assertEqual(metric_samples()[series] - before, 1)
+        self.assertIn('outcome=SUCCESS queue=eager wait_ms=n/a', logs.output[-1])
+
+    def test_queue_wait_starts_at_publish_or_eta(self):
+        headers = {}
+        signals.stamp_published_at(headers=headers)
+        self.assertAlmostEqual(headers['published_at'], time_module.time(), delta=5)
+
+        now = time_module.time()
+        for published_at, eta, expected in [
+            (now - 10, None, 10),
+            (now - 10, datetime.fromtimestamp(now - 4).isoformat(), 4),
+            (now - 10, datetime.fromtimestamp(now + 60).isoformat(), 0),
+        ]:
+            task = mock.Mock()
+            task.request.get.return_value = published_at
+            task.request.eta = eta
+            signals.start_task_timer(task_id='task-1', task=task)
+            _, wait = signals._running_tasks.pop('task-1')
+            self.assertAlmostEqual(wait, expected, delta=1)
+
+
+class FakeReplicaConnections:
+    """Stands in for ``django.db.connections``; ``down`` aliases fail ``SELECT 1``."""
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.probes = []
+        self.closed = []
+
+    def __getitem__(self, alias):
+        connection = mock.MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+
+        def execute(sql):
+            self.probes.append(alias)
+            if alias in self.down:
+                raise DatabaseError('connection refused')
+        cursor.execute.side_effect = execute
+        connection.close.side_effect = lambda: self.closed.append(alias)
+        return connection
+
+
+class RecordingView:
+    """Base view recording the replica each dispatch reads from."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.replicas = []
+
+    def dispatch(self, request, *args, **kwargs):
+        self.replicas.append(replicas.current_replica())
+        if self.failures:
+            self.failures -= 1
+            raise DatabaseError('replica went away')
+        return 'response'
+
+
+class ReplicaView(replicas.ReplicaReadMixin, RecordingView):
+    pass
+
+
+@override_settings(
+    REPLICA_DATABASES=['replica1', 'replica2'], REPLICA_HEALTH_CHECK_INTERVAL=10, REPLICA_PIN_SECONDS=5
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Safe requests read from a healthy replica unless pinned to the primary."""
+
+    def setUp(self):
+        cache.clear()
+        for registry in (replicas._checked_at, replicas._down_until):
+            patcher = mock.patch.dict(registry, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.connections = FakeReplicaConnections()
+        patcher = mock.patch.object(replicas, 'connections', self.connections)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = replicas.ReplicaRouter()
+
+    def in_request(self, pinned=False):
+        state = replicas.ReadState(pinned=pinned)
+        token = replicas._state.set(state)
+        self.addCleanup(replicas._state.reset, token)
+        return state
+
+    def request(self, method='GET'):
+        return mock.Mock(method=method)
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertIsNone(self.router.db_for_read(Listing))
+        self.assertEqual(self.router.db_for_write(Listing), 'default')
+
+    def test_safe_request_reads_from_a_replica(self):
+        self.in_request()
+        view = ReplicaView()
+        self.assertEqual(view.dispatch(self.request()), 'response')
+        self.assertIn(view.replicas[0], {'replica1', 'replica2'})
+        self.assertIsNone(replicas.current_replica())
+
+    def test_unsafe_and_pinned_requests_use_the_primary(self):
+        self.in_request()
+        view = ReplicaView()
+        view.dispatch(self.request('POST'))
+        self.in_request(pinned=True)
+        view.dispatch(self.request())
+        self.assertEqual(view.replicas, [None, None])
+
+    def test_reads_follow_the_requests_own_writes(self):
+        state = self.in_request()
+        state.replica = 'replica1'
+        self.assertEqual(self.router.db_for_read(Listing), 'replica1')
+        self.router.db_for_write(Booking)
+        self.assertIsNone(self.router.db_for_read(Listing))
+        self.assertEqual(replicas.using_current(Listing.objects.all()).db, 'default')
+
+    def test_failed_replica_read_is_retried_on_the_primary(self):
+        self.in_request()
+        view = ReplicaView(failures=1)
+        with self.assertLogs('alx_travel_app.listings.replicas', 'WARNING'):
+            self.assertEqual(view.dispatch(self.request()), 'response')
+        self.assertEqual(view.replicas[1], None)
+        self.assertEqual(self.connections.closed, [view.replicas[0]])
+        self.assertNotEqual(replicas.choose_replica(), view.replicas[0])
+
+    def test_unhealthy_replicas_are_skipped_until_the_interval_passes(self):
+        self.connections.down = {'replica1'}
+        with self.assertLogs('alx_travel_app.listings.replicas', 'WARNING'):
+            for _ in range(5):
+                self.assertEqual(replicas.choose_replica(), 'replica2')
+        # Each replica was probed once; replica2 is not probed again within the interval.
+        self.assertEqual(sorted(self.connections.probes), ['replica1', 'replica2'])
+
+        self.connections.down = set()
+        later = time_module.monotonic() + 11
+        with mock.patch.object(replicas.time, 'monotonic', return_value=later):
+            self.assertEqual(
+                {replicas.choose_replica() for _ in range(20)}, {'replica1', 'replica2'}
+            )
+
+    def test_no_healthy_replica_falls_back_to_the_primary(self):
+        self.connections.down = {'replica1', 'replica2'}
+        self.in_request()
+        view = ReplicaView()
+        with self.assertLogs('alx_travel_app.listings.replicas', 'WARNING'):
+            view.dispatch(self.request())
+        self.assertEqual(view.replicas, [None])
+
+    def test_writing_request_pins_the_client(self):
+        def view(request):
+            replicas.ReplicaRouter().db_for_write(Booking)
+            return HttpResponse()
+
+        response = replicas.ReplicaPinMiddleware(view)(mock.Mock(COOKIES={}))
+        cookie = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+        self.assertTrue(cookie['httponly'])
+
+        def read_only(request):
+            self.assertTrue(replicas._state.get().pinned)
+            return HttpResponse()
+
+        response = replicas.ReplicaPinMiddleware(read_only)(mock.Mock(COOKIES={replicas.PIN_COOKIE: '1'}))
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_middleware_is_unused_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            replicas.ReplicaPinMiddleware(lambda request: HttpResponse())
+
+    def test_recent_writes_mark_replica_responses_as_lagging(self):
+        state = self.in_request()
+        state.replica = 'replica1'
+        self.assertFalse(response_cache.may_lag())
+        response_cache.bump_listing(1)
+        self.assertTrue(response_cache.may_lag())
+        state.replica = None
+        self.assertFalse(response_cache.may_lag())
+
+
+MONDAY = date(2026, 3, 2)
+
+
+def reference_quote(base, rules, check_in, check_out):
+    """Price a stay night by night; the last matching rule by (priority, id) wins."""
+    total = Decimal('0.00')
+    night = check_in
+    while night < check_out:
+        price = base
+        for rule in sorted(rules, key=lambda rule: (rule.priority, rule.pk)):
+            if (
+                (rule.start_date is None or rule.start_date <= night)
+                and (rule.end_date is None or night <= rule.end_date)
+                and rule.weekdays & (1 << night.weekday())
+            ):
+                price = rule.price_per_night
+        total += price
+        night += timedelta(days=1)
+    return total
+
+
+class RateCalendarTests(APITestCase):
+    """Stays are priced from the listing's rate rules."""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing(price_per_night=Decimal('100.00'))
+
+    def rule(self, price, listing=None, **fields):
+        return RateRule.objects.create(
+            listing=listing or self.listing, price_per_night=Decimal(price), **fields
+        )
+
+    def quote(self, check_in, check_out):
+        return pricing.quote(self.listing, check_in, check_out)
+
+    def test_base_price_without_rules(self):
+        self.assertEqual(self.quote(MONDAY, MONDAY + timedelta(days=3)), Decimal('300.00'))
+
+    def test_weekday_rule_prices_only_its_nights(self):
+        self.rule('150.00', weekdays=RateRule.WEEKEND)
+        # Thursday to Monday: Thu, Fri at base, Sat and Sun at the weekend rate.
+        self.assertEqual(self.quote(MONDAY + timedelta(days=3), MONDAY + timedelta(days=7)), Decimal('500.00'))
+        # Two full weeks: ten weekday nights and four weekend nights.
+        self.assertEqual(self.quote(MONDAY, MONDAY + timedelta(days=14)), Decimal('1600.00'))
+
+    def test_date_range_includes_its_end_date(self):
+        self.rule('80.50', start_date=MONDAY + timedelta(days=2), end_date=MONDAY + timedelta(days=3))
+        self.assertEqual(self.quote(MONDAY, MONDAY + timedelta(days=5)), Decimal('461.00'))
+
+    def test_open_bounds(self):
+        self.rule('90.00', end_date=MONDAY)
+        self.rule('120.00', start_date=MONDAY + timedelta(days=3))
+        self.assertEqual(
+            self.quote(MONDAY - timedelta(days=1), MONDAY + timedelta(days=5)),
+            Decimal('90.00') * 2 + Decimal('100.00') * 2 + Decimal('120.00') * 2,
+        )
+
+    def test_highest_priority_wins(self):
+        self.rule('200.00', start_date=MONDAY, end_date=MONDAY + timedelta(days=30), priority=1)
+        self.rule('50.00', weekdays=RateRule.WEEKEND, priority=0)
+        self.rule('300.00', start_date=MONDAY + timedelta(days=5), end_date=MONDAY + timedelta(days=5), priority=2)
+        # Mon..Sun: five nights at 200, Saturday at 300, Sunday at 200.
+        self.assertEqual(self.quote(MONDAY, MONDAY + timedelta(days=7)), Decimal('1500.00'))
+
+    def test_matches_night_by_night_pricing(self):
+        rng = random.Random(7)
+        rules = []
+        for priority in range(8):
+            start = MONDAY + timedelta(days=rng.randint(-20, 40)) if rng.random() < 0.8 else None
+            end = None if rng.random() < 0.2 else (start or MONDAY) + timedelta(days=rng.randint(0, 30))
+            rules.append(self.rule(
+                f'{rng.randint(40, 400)}.{rng.randint(0, 99):02d}',
+                start_date=start, end_date=end, weekdays=rng.randint(1, RateRule.ALL_WEEKDAYS),
+                priority=rng.randint(0, 3),
+            ))
+        stays = {}
+        for index in range(40):
+            check_in = MONDAY + timedelta(days=rng.randint(-30, 60))
+            stays[index] = (self.listing, check_in, check_in + timedelta(days=rng.randint(1, 21)))
+
+        with self.assertNumQueries(1):
+            totals = pricing.quote_totals(stays)
+
+        for index, (_, check_in, check_out) in stays.items():
+            self.assertEqual(
+                totals[index], reference_quote(Decimal('100.00'), rules, check_in, check_out),
+                (check_in, check_out),
+            )
+
+    def test_quotes_several_listings_and_distant_stays(self):
+        other = make_listing(title='Garden Cottage', price_per_night=Decimal('60.00'))
+        self.rule('75.00', listing=other, start_date=date(2030, 1, 1))
+        stays = {
+            'near': (self.listing, MONDAY, MONDAY + timedelta(days=2)),
+            'far': (other, date(2030, 1, 1), date(2030, 1, 3)),
+            'before': (other, MONDAY, MONDAY + timedelta(days=1)),
+        }
+        with self.assertNumQueries(1):
+            totals = pricing.quote_totals(stays)
+        self.assertEqual(totals, {
+            'near': Decimal('200.00'), 'far': Decimal('150.00'), 'before': Decimal('60.00'),
+        })
+
+    def test_quote_endpoint(self):
+        self.rule('150.00', weekdays=RateRule.WEEKEND)
+        url = f'/api/listings/{self.listing.pk}/quote/'
+
+        response = self.client.get(url, {
+            'check_in': (MONDAY + timedelta(days=4)).isoformat(),
+            'check_out': (MONDAY + timedelta(days=7)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['quotes'][0]['total_price'], '400.00')
+        self.assertEqual(response.json()['quotes'][0]['average_nightly_price'], '133.33')
+
+        response = self.client.post(url, {'ranges': [
+            {'check_in': MONDAY.isoformat(), 'check_out': (MONDAY + timedelta(days=1)).isoformat()},
+            {'check_in': (MONDAY + timedelta(days=5)).isoformat(), 'check_out': (MONDAY + timedelta(days=6)).isoformat()},
+        ]}, format='json')
+        self.assertEqual([q['total_price'] for q in response.json()['quotes']], ['100.00', '150.00'])
+
+        response = self.client.get(url, {'check_in': MONDAY.isoformat(), 'check_out': MONDAY.isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(url, {'ranges': []}, format='json').status_code, 400)
+
+    def test_bookings_are_priced_from_the_rates(self):
+        self.rule('150.00', start_date=day(10), end_date=day(10))
+        data = {
+            'listing_id': self.listing.pk,
+            'guest_name': 'Amina Otieno',
+            'guest_email': 'amina@example.com',
+            'check_in': day(10).isoformat(),
+            'check_out': day(12).isoformat(),
+            'number_of_guests': 2,
+        }
+        serializer = BookingSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['total_price'], Decimal('250.00'))
+
+        serializer = BookingSerializer(data=dict(data, total_price='200.00'))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('The price for these dates is 250.00.', str(serializer.errors))
+
+
+class CalendarTests(APITestCase):
+    """Month blocks are served from the cache and dropped by booking changes."""
+
+    MARCH, APRIL = date(2026, 3, 1), date(2026, 4, 1)
+
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+
+    def book(self, check_in, check_out, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_booking(self.listing, check_in, check_out, **fields)
+
+    def save(self, booking):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+
+    def blocks(self, first=MARCH, count=2):
+        return [block for _, block in calendars.get_blocks(self.listing.pk, first, count)]
+
+    def test_blocks_paint_each_night_by_status(self):
+        self.book(date(2026, 3, 2), date(2026, 3, 4))
+        self.book(date(2026, 3, 30), date(2026, 4, 2), status='confirmed')
+        self.book(date(2026, 3, 10), date(2026, 3, 12), status='cancelled')
+
+        march, april = self.blocks()
+
+        self.assertEqual(len(march), 31)
+        self.assertEqual(len(april), 30)
+        self.assertEqual(march[:5], '01100')
+        self.assertEqual(march[9:12], '000')
+        self.assertEqual(march[28:], '022')
+        self.assertEqual(april[:3], '200')
+
+    def test_cached_blocks_need_no_query(self):
+        self.book(date(2026, 3, 2), date(2026, 3, 4))
+        first = self.blocks()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.blocks(), first)
+        # Only the months not cached yet are built, in one query.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.blocks(count=3)[:2], first)
+
+    def test_booking_changes_invalidate_blocks(self):
+        booking = self.book(date(2026, 3, 2), date(2026, 3, 4))
+        self.assertEqual(self.blocks()[0][1], calendars.PENDING)
+
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.status = 'confirmed'
+        self.save(booking)
+        self.assertEqual(self.blocks()[0][1], calendars.BOOKED)
+
+        booking.check_in, booking.check_out = date(2026, 4, 5), date(2026, 4, 6)
+        self.save(booking)
+        march, april = self.blocks()
+        self.assertNotIn(calendars.BOOKED, march)
+        self.assertEqual(april[4], calendars.BOOKED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertEqual(self.blocks()[1], calendars.AVAILABLE * 30)
+
+    def test_moving_a_booking_invalidates_both_listings(self):
+        other = make_listing(title='Garden Cottage')
+        booking = self.book(date(2026, 3, 2), date(2026, 3, 4))
+        self.blocks()
+        calendars.get_blocks(other.pk, self.MARCH, 1)
+
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.listing = other
+        self.save(booking)
+
+        self.assertEqual(self.blocks()[0], calendars.AVAILABLE * 31)
+        [(_, block)] = calendars.get_blocks(other.pk, self.MARCH, 1)
+        self.assertEqual(block[1], calendars.PENDING)
+
+    def test_changes_outside_the_calendar_keep_blocks(self):
+        booking = Booking.objects.get(pk=self.book(date(2026, 3, 2), date(2026, 3, 4), status='cancelled').pk)
+        self.blocks()
+        booking.guest_name = 'Amina O.'
+        self.save(booking)
+        with self.assertNumQueries(0):
+            self.blocks()
+
+    def test_add_months_crosses_years(self):
+        self.assertEqual(calendars.add_months(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(calendars.add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+
+    def test_calendar_endpoint(self):
+        self.book(date(2026, 4, 1), date(2026, 4, 3), status='confirmed')
+        url = f'/api/listings/{self.listing.pk}/calendar/'
+
+        response = self.client.get(url, {'from': '2026-03', 'months': 2})
+
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual(data['legend'], {'0': 'available', '1': 'pending', '2': 'booked'})
+        self.assertEqual([month['month'] for month in data['months']], ['2026-03', '2026-04'])
+        self.assertTrue(data['months'][1]['days'].startswith('220'))
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()['months'][0]['month'], f'{timezone.localdate():%Y-%m}')
+        self.assertEqual(self.client.get(url, {'months': 13}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': 'March'}).status_code, 400)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km, computed in Python."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    half_chord = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * geo.EARTH_RADIUS_KM * math.asin(math.sqrt(half_chord))
+
+
+class GeoCellTests(SimpleTestCase):
+    """Bounding boxes and cell covers, including across the antimeridian and poles."""
+
+    def assert_covers(self, south, north, intervals, ranges, rng, samples=300):
+        for first, last in ranges:
+            self.assertLessEqual(first, last)
+        for (_, last), (first, _) in zip(ranges, ranges[1:]):
+            self.assertLess(last + 1, first, 'ranges must be sorted, disjoint and merged')
+        for _ in range(samples):
+            west, east = rng.choice(intervals)
+            code = geo.encode(rng.uniform(south, north), rng.uniform(west, east))
+            self.assertTrue(any(first <= code <= last for first, last in ranges), code)
+
+    def test_encode(self):
+        self.assertIsNone(geo.encode(None, 10))
+        self.assertEqual(geo.encode(-90, -180), 0)
+        self.assertEqual(geo.encode(90, 180), (1 << 2 * geo.GRID_BITS) - 1)
+        # Nearby points share a long code prefix.
+        near = geo.encode(-1.2921, 36.8219) ^ geo.encode(-1.2922, 36.8220)
+        self.assertLess(near.bit_length(), 20)
+
+    def test_box_of_an_ordinary_circle(self):
+        south, north, intervals = geo.bounding_box(0, 0, 111.2)
+        self.assertAlmostEqual(south, -1, places=2)
+        self.assertAlmostEqual(north, 1, places=2)
+        [(west, east)] = intervals
+        self.assertAlmostEqual(west, -1, places=2)
+        self.assertAlmostEqual(east, 1, places=2)
+
+    def test_box_crossing_the_antimeridian_is_split(self):
+        _, _, east_side = geo.bounding_box(-17.8, 179.9, 50)
+        self.assertEqual(len(east_side), 2)
+        (west, upper), (lower, east) = east_side
+        self.assertEqual((upper, lower), (180, -180))
+        self.assertGreater(west, 179)
+        self.assertLess(east, -179)
+
+        _, _, west_side = geo.bounding_box(-17.8, -179.9, 50)
+        (west, upper), (lower, east) = west_side
+        self.assertEqual((upper, lower), (180, -180))
+        self.assertGreater(west, 179)
+        self.assertLess(east, -179)
+
+    def test_box_containing_a_pole_spans_every_longitude(self):
+        south, north, intervals = geo.bounding_box(89.9, 10, 50)
+        self.assertEqual((north, intervals), (90, [(-180, 180)]))
+        south, north, intervals = geo.bounding_box(-89.9, 10, 50)
+        self.assertEqual((south, intervals), (-90, [(-180, 180)]))
+
+    def test_box_encloses_the_circle(self):
+        for latitude, longitude, radius_km in [
+            (0, 0, 200), (60, 30, 150), (89.0, 10, 100), (-17.8, 179.9, 50), (-70, -179.5, 200),
+        ]:
+            south, north, intervals = geo.bounding_box(latitude, longitude, radius_km)
+            angle = radius_km * 0.999 / geo.EARTH_RADIUS_KM
+            lat1, lng1 = math.radians(latitude), math.radians(longitude)
+            for bearing in range(0, 360, 5):
+                # Point radius_km away from the centre along the bearing.
+                bearing = math.radians(bearing)
+                lat2 = math.asin(
+                    math.sin(lat1) * math.cos(angle)
+                    + math.cos(lat1) * math.sin(angle) * math.cos(bearing)
+                )
+                lng2 = lng1 + math.atan2(
+                    math.sin(bearing) * math.sin(angle) * math.cos(lat1),
+                    math.cos(angle) - math.sin(lat1) * math.sin(lat2),
+                )
+                lat2 = math.degrees(lat2)
+                lng2 = (math.degrees(lng2) + 540) % 360 - 180
+                with self.subTest(centre=(latitude, longitude), point=(lat2, lng2)):
+                    self.assertTrue(south <= lat2 <= north)
+                    self.assertTrue(any(west <= lng2 <= east for west, east in intervals))
+
+    def test_cell_ranges_cover_the_box(self):
+        rng = random.Random(25)
+        for latitude, longitude, radius_km in [
+            (-1.29, 36.82, 5), (40.71, -74.0, 250), (-17.8, 179.95, 40), (-17.8, -179.95, 40),
+            (89.95, 0, 20), (-89.95, 120, 300), (0, 0, 2000), (64.0, 179.0, 500),
+        ]:
+            with self.subTest(point=(latitude, longitude, radius_km)):
+                south, north, intervals = geo.bounding_box(latitude, longitude, radius_km)
+                ranges = geo.cell_ranges(south, north, intervals)
+                self.assertLessEqual(len(ranges), geo.MAX_CELLS)
+                self.assert_covers(south, north, intervals, ranges, rng)
+
+    def test_whole_world_is_one_range(self):
+        self.assertEqual(
+            geo.cell_ranges(-90, 90, [(-180, 180)]), [(0, (1 << 2 * geo.GRID_BITS) - 1)]
+        )
+
+
+class RadiusSearchTests(APITestCase):
+    """lat/lng/radius_km search matches by exact distance, nearest first."""
+
+    def setUp(self):
+        cache.clear()
+
+    def place(self, title, latitude, longitude):
+        return make_listing(title=title, latitude=latitude, longitude=longitude)
+
+    def search(self, lat, lng, radius_km, **params):
+        response = self.client.get('/api/listings/search/', dict(params, lat=lat, lng=lng, radius_km=radius_km))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_matches_by_distance_nearest_first(self):
+        centre = self.place('Centre', -1.2921, 36.8219)
+        near = self.place('Near', -1.30, 36.83)
+        edge = self.place('Edge', -1.2921, 36.90)
+        self.place('Far', -1.2921, 37.2)
+        make_listing(title='Unlocated')
+
+        results = self.search(-1.2921, 36.8219, 10)
+
+        self.assertEqual([item['id'] for item in results], [centre.pk, near.pk, edge.pk])
+        for item, listing in zip(results, (centre, near, edge)):
+            expected = haversine_km(-1.2921, 36.8219, listing.latitude, listing.longitude)
+            self.assertAlmostEqual(item['distance_km'], expected, places=2)
+
+    def test_search_across_the_antimeridian(self):
+        east = self.place('Taveuni East', -16.8, 179.98)
+        west = self.place('Taveuni West', -16.8, -179.97)
+        self.place('Far West', -16.8, -179.5)
+
+        results = self.search(-16.8, 179.99, 10)
+        self.assertEqual([item['id'] for item in results], [east.pk, west.pk])
+        results = self.search(-16.8, -179.99, 10)
+        self.assertEqual({item['id'] for item in results}, {east.pk, west.pk})
+
+    def test_search_around_a_pole(self):
+        station = self.place('Station', 89.95, -120)
+        opposite = self.place('Opposite', 89.95, 60)
+        self.place('Lower', 88.5, 60)
+
+        results = self.search(89.99, 10, 20)
+
+        self.assertEqual({item['id'] for item in results}, {station.pk, opposite.pk})
+
+    def test_other_orderings_and_filters_still_apply(self):
+        cheap = make_listing(title='Cheap', latitude=-1.30, longitude=36.83, price_per_night=Decimal('50.00'))
+        dear = make_listing(title='Dear', latitude=-1.2921, longitude=36.8219, price_per_night=Decimal('300.00'))
+        results = self.search(-1.2921, 36.8219, 10, ordering='price_per_night')
+        self.assertEqual([item['id'] for item in results], [cheap.pk, dear.pk])
+        results = self.search(-1.2921, 36.8219, 10, max_price=100)
+        self.assertEqual([item['id'] for item in results], [cheap.pk])
+
+    def test_incomplete_circle_is_rejected(self):
+        response = self.client.get('/api/listings/search/', {'lat': 1, 'lng': 2})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/listings/search/', {'lat': 91, 'lng': 2, 'radius_km': 5})
+        self.assertEqual(response.status_code, 400)
+
+    def test_moving_a_listing_updates_its_cell(self):
+        listing = self.place('Mover', -1.2921, 36.8219)
+        listing.latitude, listing.longitude = 40.7128, -74.0060
+        listing.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(self.search(-1.2921, 36.8219, 10), [])
+        self.assertEqual([item['id'] for item in self.search(40.7128, -74.0060, 1)], [listing.pk])
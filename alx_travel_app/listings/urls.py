@@ -3,21 +3,27 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ListingViewSet, 
     BookingViewSet, 
+    ReviewViewSet,
     PaymentViewSet, 
     verify_payment_by_reference,
-    payment_success
+    payment_success,
+    chapa_webhook
 )
 
 # Create a router and register our viewsets with it
 router = DefaultRouter()
 router.register(r'listings', ListingViewSet, basename='listing')
 router.register(r'bookings', BookingViewSet, basename='booking')
+router.register(r'reviews', ReviewViewSet, basename='review')
 router.register(r'payments', PaymentViewSet, basename='payment')
 
 # The API URLs are now determined automatically by the router
+# Explicit payment routes come first so the router's payments/{pk}/ route
+# does not capture them.
 urlpatterns = [
-    path('', include(router.urls)),
     path('payments/verify/', verify_payment_by_reference, name='verify-payment'),
     path('payments/success/', payment_success, name='payment-success'),
+    path('payments/webhook/', chapa_webhook, name='chapa-webhook'),
+    path('', include(router.urls)),
 ]
 
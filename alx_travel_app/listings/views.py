@@ -1,16 +1,114 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view
+from rest_framework import filters, viewsets, status
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-import requests
+from django.urls import reverse
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+import json
 import uuid
-from .models import Listing, Booking, Payment
-from .serializers import ListingSerializer, BookingSerializer, PaymentSerializer
+from . import amenities, availability, calendars, chapa, exports, geo, payments, pricing, ratings, response_cache
+from .models import Listing, Booking, Review, Payment
+from .conditional import ConditionalGetMixin
+from .query_budget import QueryBudgetMixin
+from .replicas import ReplicaReadMixin, using_current
+from .response_cache import CachedListingResponseMixin
+from .serializers import (
+    ListingSerializer,
+    ListingDistanceSerializer,
+    ListingSearchSerializer,
+    AmenitiesFilterField,
+    ExportParamsSerializer,
+    CalendarParamsSerializer,
+    QuoteRangeSerializer,
+    QuoteRequestSerializer,
+    BookingSerializer,
+    ReviewSerializer,
+    PaymentSerializer,
+)
 
 
-class ListingViewSet(viewsets.ModelViewSet):
+def _start_of_day(day):
+    """Return midnight of ``day`` in the current time zone as an aware datetime."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_for_export(request, queryset, statuses):
+    """
+    Apply the export query parameters to a queryset.
+    
+    Query params: output (ndjson or csv), start and end (created_at dates,
+    inclusive), status
+    
+    Returns:
+        tuple: (filtered queryset, output format)
+    """
+    params = ExportParamsSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    criteria = params.validated_data
+    
+    # Bounds as datetimes at local midnight, so the created_at index serves
+    # the range (a __date lookup would cast every row's column).
+    if 'start' in criteria:
+        queryset = queryset.filter(created_at__gte=_start_of_day(criteria['start']))
+    if 'end' in criteria:
+        queryset = queryset.filter(created_at__lt=_start_of_day(criteria['end'] + timedelta(days=1)))
+    if 'status' in criteria:
+        if criteria['status'] not in statuses:
+            raise ValidationError({'status': [f"Must be one of: {', '.join(statuses)}."]})
+        queryset = queryset.filter(status=criteria['status'])
+    return queryset, criteria['output']
+
+
+def _item_errors(detail):
+    """Key bulk validation errors by item index, dropping items without errors."""
+    if isinstance(detail, list):
+        detail = dict(enumerate(detail))
+    return {str(index): errors for index, errors in detail.items() if errors}
+
+
+def bulk_write(viewset, request):
+    """
+    Create (POST) or update (PATCH) many objects of a viewset in one request.
+    
+    The body is a JSON array; for PATCH every item carries the ``id`` of the
+    object it changes. Items are validated with the viewset's serializer
+    (``many=True``) and written in one transaction. If any item is invalid
+    nothing is written and the response is 400 with the errors keyed by item
+    index. Otherwise the objects are returned in request order, each with
+    its ``id`` (read back after the insert on backends such as MySQL that
+    cannot return rows from a multi-row INSERT).
+    """
+    if request.method == 'POST':
+        serializer = viewset.get_serializer(data=request.data, many=True)
+    else:
+        serializer = viewset.get_serializer(
+            viewset.get_queryset(), data=request.data, many=True, partial=True
+        )
+    if not serializer.is_valid():
+        return Response({'errors': _item_errors(serializer.errors)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        serializer.save()
+    except ValidationError as e:
+        # Conflicts found against stored bookings while the write was locked
+        return Response({'errors': _item_errors(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response_status = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK
+    return Response({'results': serializer.data}, status=response_status)
+
+
+class ListingViewSet(
+    ReplicaReadMixin,
+    QueryBudgetMixin,
+    ConditionalGetMixin,
+    CachedListingResponseMixin,
+    viewsets.ModelViewSet
+):
     """
     ViewSet for managing Listing resources.
     
@@ -21,11 +119,122 @@ class ListingViewSet(viewsets.ModelViewSet):
     - PUT /api/listings/{id}/ - Update a listing (full update)
     - PATCH /api/listings/{id}/ - Update a listing (partial update)
     - DELETE /api/listings/{id}/ - Delete a listing
+    - GET /api/listings/search/ - Search available listings
+    - GET /api/listings/{id}/reviews/ - Reviews and rating histogram
+    - GET/POST /api/listings/{id}/quote/ - Price one or many stays
+    - GET /api/listings/{id}/calendar/ - Day-by-day availability per month
+    - POST /api/listings/bulk/ - Create many listings
+    - PATCH /api/listings/bulk/ - Update many listings
     """
     queryset = Listing.objects.all()
     serializer_class = ListingSerializer
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['created_at', 'price_per_night', 'rating_average']
+    ordering = ('-created_at', '-id')
+    query_budgets = {'list': 3, 'search': 3, 'bookings': 4, 'reviews': 4, 'quote': 2, 'calendar': 2}
     
-    @action(detail=True, methods=['get'])
+    def get_queryset(self):
+        """
+        Optionally filter the listing list by amenities.
+        Example: /api/listings/?amenities=wifi,parking
+        """
+        queryset = Listing.objects.all()
+        amenities_param = self.request.query_params.get('amenities')
+        if self.action == 'list' and amenities_param:
+            try:
+                mask = AmenitiesFilterField().run_validation(amenities_param)
+            except ValidationError as e:
+                raise ValidationError({'amenities': e.detail})
+            queryset = amenities.with_amenities(queryset, mask)
+        return queryset
+    
+    def list_validators(self, request):
+        # The response cache's version counters move with every listing
+        # write, so they validate list pages without counting rows.
+        if not settings.LISTING_CACHE_ENABLED:
+            return super().list_validators(request)
+        if response_cache.may_lag():
+            # A lagging replica may serve the body the counters already
+            # moved past; an ETag would tie that body to the new version.
+            return None
+        return self._validators(request, response_cache.list_key(request), [])
+    
+    def detail_validators(self, request, lookup_value):
+        if not settings.LISTING_CACHE_ENABLED:
+            return super().detail_validators(request, lookup_value)
+        if response_cache.may_lag():
+            return None
+        return self._validators(request, response_cache.detail_key(request, lookup_value), [])
+    
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """
+        Create or update many listings in one transaction.
+        POST/PATCH /api/listings/bulk/ with a JSON array
+        """
+        return bulk_write(self, request)
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Search available listings.
+        GET /api/listings/search/
+        Query params: city, country, property_type, min_price, max_price,
+        guests, bedrooms, min_rating, amenities, check_in, check_out,
+        lat, lng, radius_km, ordering
+        
+        With lat, lng and radius_km only listings within radius_km of the
+        point match; each result gets its distance_km and results come
+        nearest first unless ordering says otherwise (ordering=distance
+        is accepted too).
+        """
+        params = ListingSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        criteria = params.validated_data
+        
+        queryset = Listing.objects.filter(is_available=True)
+        if 'city' in criteria:
+            queryset = queryset.filter(city__iexact=criteria['city'])
+        if 'country' in criteria:
+            queryset = queryset.filter(country__iexact=criteria['country'])
+        if 'property_type' in criteria:
+            queryset = queryset.filter(property_type=criteria['property_type'])
+        if 'min_price' in criteria:
+            queryset = queryset.filter(price_per_night__gte=criteria['min_price'])
+        if 'max_price' in criteria:
+            queryset = queryset.filter(price_per_night__lte=criteria['max_price'])
+        if 'guests' in criteria:
+            queryset = queryset.filter(max_guests__gte=criteria['guests'])
+        if 'bedrooms' in criteria:
+            queryset = queryset.filter(bedrooms__gte=criteria['bedrooms'])
+        if 'min_rating' in criteria:
+            queryset = queryset.filter(rating_average__gte=criteria['min_rating'])
+        if 'amenities' in criteria:
+            queryset = amenities.with_amenities(queryset, criteria['amenities'])
+        if 'check_in' in criteria:
+            queryset = availability.free_listings(
+                queryset, criteria['check_in'], criteria['check_out']
+            )
+        if 'radius_km' in criteria:
+            queryset = geo.within(
+                queryset, criteria['lat'], criteria['lng'], criteria['radius_km']
+            )
+            # Per-request overrides read by OrderingFilter and the paginator.
+            self.ordering = ('distance', 'id')
+            self.ordering_fields = [*self.ordering_fields, 'distance']
+            self.serializer_class = ListingDistanceSerializer
+        
+        queryset = self.filter_queryset(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+    
+    # No OrderingFilter: its fields are the listing's, and the paginator
+    # would apply ?ordering= to bookings. Pages stay newest first.
+    @action(detail=True, methods=['get'], filter_backends=[])
     def bookings(self, request, pk=None):
         """
         Retrieve all bookings for a specific listing.
@@ -33,11 +242,101 @@ class ListingViewSet(viewsets.ModelViewSet):
         """
         listing = self.get_object()
         bookings = listing.bookings.all()
+        page = self.paginate_queryset(bookings)
+        if page is not None:
+            serializer = BookingSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         serializer = BookingSerializer(bookings, many=True)
         return Response(serializer.data)
+    
+    # No OrderingFilter: its fields are the listing's, and the paginator
+    # would apply ?ordering= to reviews. Pages stay newest first.
+    @action(detail=True, methods=['get'], filter_backends=[])
+    def reviews(self, request, pk=None):
+        """
+        Retrieve the reviews of a listing with its rating histogram.
+        GET /api/listings/{id}/reviews/
+        """
+        listing = self.get_object()
+        reviews = listing.reviews.all()
+        histogram = ratings.rating_histogram(listing.pk)
+        page = self.paginate_queryset(reviews)
+        if page is not None:
+            response = self.get_paginated_response(ReviewSerializer(page, many=True).data)
+        else:
+            response = Response({'results': ReviewSerializer(reviews, many=True).data})
+        listing_data = self.get_serializer(listing).data
+        response.data['rating_count'] = listing_data['rating_count']
+        response.data['rating_average'] = listing_data['rating_average']
+        response.data['rating_histogram'] = histogram
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        """
+        Day-by-day availability of a listing, one string per month.
+        GET /api/listings/{id}/calendar/?from=2026-03&months=3
+        
+        Each character of ``days`` describes the night starting on that
+        day (see ``legend``). Served from cached month blocks, so repeated
+        views do not query bookings.
+        """
+        params = CalendarParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        listing = self.get_object()
+        blocks = calendars.get_blocks(
+            listing.pk,
+            params.validated_data['from'],
+            params.validated_data['months'],
+        )
+        return Response({
+            'listing_id': listing.pk,
+            'legend': calendars.LEGEND,
+            'months': [{'month': f'{month:%Y-%m}', 'days': days} for month, days in blocks],
+        })
+    
+    @action(detail=True, methods=['get', 'post'])
+    def quote(self, request, pk=None):
+        """
+        Price stays at a listing from its rate calendar.
+        GET /api/listings/{id}/quote/?check_in=2026-03-01&check_out=2026-03-05
+        POST /api/listings/{id}/quote/ {"ranges": [{"check_in": ..., "check_out": ...}, ...]}
+        
+        The quoted ``total_price`` is what a booking of the same dates
+        must carry (or gets when it omits one).
+        """
+        listing = self.get_object()
+        if request.method == 'GET':
+            params = QuoteRangeSerializer(data=request.query_params)
+            params.is_valid(raise_exception=True)
+            ranges = [params.validated_data]
+        else:
+            params = QuoteRequestSerializer(data=request.data)
+            params.is_valid(raise_exception=True)
+            ranges = params.validated_data['ranges']
+        
+        totals = pricing.quote_totals({
+            index: (listing, stay['check_in'], stay['check_out'])
+            for index, stay in enumerate(ranges)
+        })
+        quotes = []
+        for index, stay in enumerate(ranges):
+            nights = (stay['check_out'] - stay['check_in']).days
+            quotes.append({
+                'check_in': stay['check_in'],
+                'check_out': stay['check_out'],
+                'nights': nights,
+                'total_price': str(totals[index]),
+                'average_nightly_price': str((totals[index] / nights).quantize(pricing.CENT)),
+            })
+        return Response({
+            'listing_id': listing.pk,
+            'currency': pricing.CURRENCY,
+            'quotes': quotes,
+        })
 
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(ReplicaReadMixin, QueryBudgetMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Booking resources.
     
@@ -48,16 +347,20 @@ class BookingViewSet(viewsets.ModelViewSet):
     - PUT /api/bookings/{id}/ - Update a booking (full update)
     - PATCH /api/bookings/{id}/ - Update a booking (partial update)
     - DELETE /api/bookings/{id}/ - Delete a booking
+    - GET /api/bookings/export/ - Stream bookings as NDJSON or CSV
+    - POST /api/bookings/bulk/ - Create many bookings
+    - PATCH /api/bookings/bulk/ - Update many bookings
     """
-    queryset = Booking.objects.all()
+    queryset = Booking.objects.select_related('listing')
     serializer_class = BookingSerializer
+    validator_fields = ('updated_at', 'listing__updated_at')
     
     def get_queryset(self):
         """
         Optionally filter bookings by listing_id query parameter.
         Example: /api/bookings/?listing_id=1
         """
-        queryset = Booking.objects.all()
+        queryset = Booking.objects.select_related('listing')
         listing_id = self.request.query_params.get('listing_id', None)
         if listing_id is not None:
             queryset = queryset.filter(listing_id=listing_id)
@@ -66,31 +369,50 @@ class BookingViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         """
         Create a booking and initiate payment process.
+        
+        With ``CHAPA_ASYNC_INITIATION`` enabled, or when the client sends
+        ``Prefer: respond-async``, the booking and a pending payment are
+        committed and the call to Chapa is left to a Celery task. The
+        response is then 202 with a ``status_url`` to poll until the
+        payment's ``payment_url`` is set.
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        booking = serializer.save()
         
-        # Send booking confirmation email asynchronously
-        from .tasks import send_booking_confirmation_email
-        send_booking_confirmation_email.delay(booking.id)
+        from .tasks import send_booking_confirmation_email, initiate_payment
         
-        # Initiate payment for the booking
-        payment = Payment.objects.create(
-            booking=booking,
-            amount=booking.total_price,
-            status='pending'
-        )
+        respond_async = self._respond_async(request)
+        with transaction.atomic():
+            booking = serializer.save()
+            
+            # Initiate payment for the booking
+            payment = Payment.objects.create(
+                booking=booking,
+                amount=booking.total_price,
+                status='pending'
+            )
+            
+            # Send booking confirmation email asynchronously
+            transaction.on_commit(lambda: send_booking_confirmation_email.delay(booking.id))
+            
+            if respond_async:
+                base_url = request.build_absolute_uri('/').rstrip('/')
+                transaction.on_commit(lambda: initiate_payment.delay(payment.id, base_url))
+        
+        if respond_async:
+            status_url = request.build_absolute_uri(
+                reverse('payment-detail', kwargs={'pk': payment.pk})
+            )
+            return Response({
+                'booking': self.get_serializer(booking).data,
+                'payment': PaymentSerializer(payment).data,
+                'status_url': status_url
+            }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
         
         # Initiate payment with Chapa
         try:
             chapa_response = initiate_chapa_payment(booking, payment, request)
-            if chapa_response.get('status') == 'success':
-                payment.transaction_id = chapa_response.get('data', {}).get('tx_ref', '')
-                payment.chapa_reference = chapa_response.get('data', {}).get('reference', '')
-                payment.payment_url = chapa_response.get('data', {}).get('checkout_url', '')
-                payment.save()
-                
+            if apply_chapa_initiation(payment, chapa_response):
                 payment_serializer = PaymentSerializer(payment)
                 booking_serializer = self.get_serializer(booking)
                 
@@ -100,8 +422,6 @@ class BookingViewSet(viewsets.ModelViewSet):
                     'payment_url': payment.payment_url
                 }, status=status.HTTP_201_CREATED)
             else:
-                payment.status = 'failed'
-                payment.save()
                 return Response({
                     'error': 'Failed to initiate payment',
                     'details': chapa_response.get('message', 'Unknown error')
@@ -113,18 +433,91 @@ class BookingViewSet(viewsets.ModelViewSet):
                 'error': 'Payment initiation failed',
                 'details': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def _respond_async(self, request):
+        """Return True if payment initiation should run in the background."""
+        prefer = request.headers.get('Prefer', '')
+        if 'respond-async' in [token.strip() for token in prefer.split(',')]:
+            return True
+        return settings.CHAPA_ASYNC_INITIATION
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream all bookings as NDJSON or CSV.
+        GET /api/bookings/export/?output=csv&start=2026-01-01&end=2026-01-31&status=confirmed
+        """
+        queryset, output = filter_for_export(
+            request,
+            using_current(Booking.objects.select_related('listing')),
+            [choice for choice, _ in Booking.STATUS_CHOICES],
+        )
+        return exports.export_response(queryset, exports.BOOKING_COLUMNS, output, 'bookings')
+    
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """
+        Create or update many bookings in one transaction.
+        POST/PATCH /api/bookings/bulk/ with a JSON array
+        
+        Unlike POST /api/bookings/, no payment is initiated and no
+        confirmation email is sent.
+        """
+        return bulk_write(self, request)
 
 
-class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
+class ReviewViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for managing Review resources.
+    
+    Provides CRUD operations:
+    - GET /api/reviews/ - List all reviews
+    - GET /api/reviews/{id}/ - Retrieve a specific review
+    - POST /api/reviews/ - Create a new review
+    - PUT /api/reviews/{id}/ - Update a review (full update)
+    - PATCH /api/reviews/{id}/ - Update a review (partial update)
+    - DELETE /api/reviews/{id}/ - Delete a review
+    """
+    queryset = Review.objects.select_related('listing')
+    serializer_class = ReviewSerializer
+    
+    def get_queryset(self):
+        """
+        Optionally filter reviews by listing_id query parameter.
+        Example: /api/reviews/?listing_id=1
+        """
+        queryset = Review.objects.select_related('listing')
+        listing_id = self.request.query_params.get('listing_id', None)
+        if listing_id is not None:
+            queryset = queryset.filter(listing_id=listing_id)
+        return queryset
+
+
+class PaymentViewSet(QueryBudgetMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for managing Payment resources.
     
     Provides read-only operations:
     - GET /api/payments/ - List all payments
     - GET /api/payments/{id}/ - Retrieve a specific payment
+    - GET /api/payments/export/ - Stream payments as NDJSON or CSV
     """
-    queryset = Payment.objects.all()
+    queryset = Payment.objects.select_related('booking__listing')
     serializer_class = PaymentSerializer
+    validator_fields = ('updated_at', 'booking__updated_at', 'booking__listing__updated_at')
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream all payments as NDJSON or CSV.
+        GET /api/payments/export/?output=csv&start=2026-01-01&end=2026-01-31&status=completed
+        """
+        queryset, output = filter_for_export(
+            request,
+            Payment.objects.select_related('booking__listing'),
+            [choice for choice, _ in Payment.STATUS_CHOICES],
+        )
+        return exports.export_response(queryset, exports.PAYMENT_COLUMNS, output, 'payments')
     
     @action(detail=True, methods=['post'])
     def verify(self, request, pk=None):
@@ -139,45 +532,7 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
                 'error': 'No transaction ID found for this payment'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            chapa_response = verify_chapa_payment(payment.transaction_id)
-            
-            if chapa_response.get('status') == 'success':
-                payment_data = chapa_response.get('data', {})
-                payment_status = payment_data.get('status', '').lower()
-                
-                if payment_status == 'success':
-                    payment.status = 'completed'
-                    payment.booking.status = 'confirmed'
-                    payment.booking.save()
-                    payment.save()
-                    
-                    # Send confirmation email asynchronously
-                    from .tasks import send_payment_confirmation_email
-                    send_payment_confirmation_email.delay(payment.id)
-                    
-                    return Response({
-                        'message': 'Payment verified successfully',
-                        'payment': PaymentSerializer(payment).data
-                    }, status=status.HTTP_200_OK)
-                else:
-                    payment.status = 'failed'
-                    payment.save()
-                    return Response({
-                        'message': 'Payment verification failed',
-                        'status': payment_status,
-                        'payment': PaymentSerializer(payment).data
-                    }, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                return Response({
-                    'error': 'Failed to verify payment',
-                    'details': chapa_response.get('message', 'Unknown error')
-                }, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            return Response({
-                'error': 'Payment verification failed',
-                'details': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return verify_and_apply(payment)
 
 
 @api_view(['GET'])
@@ -196,7 +551,7 @@ def payment_success(request):
         }, status=status.HTTP_200_OK)
     
     try:
-        payment = Payment.objects.get(transaction_id=tx_ref)
+        payment = Payment.objects.select_related('booking__listing').get(transaction_id=tx_ref)
         return Response({
             'message': 'Payment completed successfully',
             'payment': PaymentSerializer(payment).data,
@@ -224,85 +579,95 @@ def verify_payment_by_reference(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        payment = Payment.objects.get(transaction_id=transaction_id)
+        payment = Payment.objects.select_related('booking__listing').get(
+            transaction_id=transaction_id
+        )
     except Payment.DoesNotExist:
         return Response({
             'error': 'Payment not found'
         }, status=status.HTTP_404_NOT_FOUND)
     
+    return verify_and_apply(payment)
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def chapa_webhook(request):
+    """
+    Receive Chapa transaction events.
+    POST /api/payments/webhook/
+    Headers: x-chapa-signature (HMAC-SHA256 of the body with CHAPA_WEBHOOK_SECRET)
+    
+    Applies the reported status to the matching payment without calling
+    Chapa back. Repeated deliveries of an event are acknowledged and ignored.
+    """
+    if not settings.CHAPA_WEBHOOK_SECRET:
+        return Response({
+            'error': 'Webhook secret is not configured'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    body = request.body
+    signature = request.headers.get('x-chapa-signature', '')
+    if not payments.verify_signature(body, signature, settings.CHAPA_WEBHOOK_SECRET):
+        return Response({
+            'error': 'Invalid signature'
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    
     try:
-        chapa_response = verify_chapa_payment(transaction_id)
-        
-        if chapa_response.get('status') == 'success':
-            payment_data = chapa_response.get('data', {})
-            payment_status = payment_data.get('status', '').lower()
-            
-            if payment_status == 'success':
-                payment.status = 'completed'
-                payment.booking.status = 'confirmed'
-                payment.booking.save()
-                payment.save()
-                
-                # Send confirmation email asynchronously
-                from .tasks import send_payment_confirmation_email
-                send_payment_confirmation_email.delay(payment.id)
-                
-                return Response({
-                    'message': 'Payment verified successfully',
-                    'payment': PaymentSerializer(payment).data
-                }, status=status.HTTP_200_OK)
-            else:
-                payment.status = 'failed'
-                payment.save()
-                return Response({
-                    'message': 'Payment verification failed',
-                    'status': payment_status,
-                    'payment': PaymentSerializer(payment).data
-                }, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            return Response({
-                'error': 'Failed to verify payment',
-                'details': chapa_response.get('message', 'Unknown error')
-            }, status=status.HTTP_400_BAD_REQUEST)
-    except Exception as e:
+        event = json.loads(body)
+        transaction_id = event['tx_ref']
+    except (ValueError, TypeError, KeyError):
         return Response({
-            'error': 'Payment verification failed',
-            'details': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            'error': 'Malformed event payload'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        payment, changed = payments.apply_payment_status(transaction_id, event.get('status'))
+    except Payment.DoesNotExist:
+        return Response({
+            'error': 'Payment not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'message': 'Payment updated' if changed else 'Event already processed',
+        'status': payment.status
+    }, status=status.HTTP_200_OK)
 
 
-def initiate_chapa_payment(booking, payment, request=None):
+def initiate_chapa_payment(booking, payment, request=None, base_url=None):
     """
     Initiate payment with Chapa API.
     
+    The payment's ``transaction_id`` is set to the generated ``tx_ref``
+    first, so webhooks and verification can find it.
+    
     Args:
         booking: Booking instance
         payment: Payment instance
         request: Django request object (optional)
+        base_url: Site URL for the callbacks when there is no request
+            (optional)
     
     Returns:
         dict: Chapa API response
     """
-    if not settings.CHAPA_SECRET_KEY:
-        raise ValueError("CHAPA_SECRET_KEY is not configured")
-    
-    # Generate unique transaction reference
-    tx_ref = f"tx_ref_{payment.id}_{uuid.uuid4().hex[:10]}"
-    
-    headers = {
-        'Authorization': f'Bearer {settings.CHAPA_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
+    # Chapa's initialize response does not echo the reference, so it is
+    # stored before the call; a retried initiation reuses it.
+    if not payment.transaction_id:
+        payment.transaction_id = f"tx_ref_{payment.id}_{uuid.uuid4().hex[:10]}"
+        payment.save(update_fields=['transaction_id', 'updated_at'])
+    tx_ref = payment.transaction_id
     
     # Build callback URLs
     if request:
         base_url = request.build_absolute_uri('/').rstrip('/')
-    else:
+    elif not base_url:
         base_url = 'http://localhost:8000'  # Default for development
     
     payload = {
         'amount': str(float(booking.total_price)),
-        'currency': 'ETB',
+        'currency': pricing.CURRENCY,
         'email': booking.guest_email,
         'first_name': booking.guest_name.split()[0] if booking.guest_name.split() else 'Guest',
         'last_name': ' '.join(booking.guest_name.split()[1:]) if len(booking.guest_name.split()) > 1 else 'User',
@@ -316,20 +681,73 @@ def initiate_chapa_payment(booking, payment, request=None):
         }
     }
     
+    return chapa.get_client().initialize(payload)
+
+
+def apply_chapa_initiation(payment, chapa_response):
+    """
+    Store the outcome of a Chapa initialize call on the payment.
+    
+    Args:
+        payment: Payment instance
+        chapa_response: dict returned by initiate_chapa_payment
+    
+    Returns:
+        bool: True if Chapa accepted the transaction
+    """
+    if chapa_response.get('status') == 'success':
+        data = chapa_response.get('data', {})
+        payment.chapa_reference = data.get('reference', '')
+        payment.payment_url = data.get('checkout_url', '')
+        payment.save()
+        return True
+    payment.status = 'failed'
+    payment.save()
+    return False
+
+
+def verify_and_apply(payment):
+    """
+    Verify a payment with Chapa and apply the reported status.
+    
+    The transition goes through ``payments.apply_payment_status``, like the
+    webhook: it is applied once, under a row lock, and only to a pending
+    payment, so repeating a verification neither re-sends the confirmation
+    email nor moves a settled payment to another state.
+    
+    Args:
+        payment: Payment instance with a ``transaction_id``
+    
+    Returns:
+        Response: 200 with the payment if it is completed, 400 otherwise
+    """
     try:
-        response = requests.post(
-            settings.CHAPA_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        return {
-            'status': 'error',
-            'message': str(e)
-        }
+        chapa_response = verify_chapa_payment(payment.transaction_id)
+        
+        if chapa_response.get('status') != 'success':
+            return Response({
+                'error': 'Failed to verify payment',
+                'details': chapa_response.get('message', 'Unknown error')
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        payment_status = chapa_response.get('data', {}).get('status', '').lower()
+        payment, _ = payments.apply_payment_status(payment.transaction_id, payment_status)
+    except Exception as e:
+        return Response({
+            'error': 'Payment verification failed',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    if payment.status == 'completed':
+        return Response({
+            'message': 'Payment verified successfully',
+            'payment': PaymentSerializer(payment).data
+        }, status=status.HTTP_200_OK)
+    return Response({
+        'message': 'Payment verification failed',
+        'status': payment_status,
+        'payment': PaymentSerializer(payment).data
+    }, status=status.HTTP_400_BAD_REQUEST)
 
 
 def verify_chapa_payment(transaction_id):
@@ -342,26 +760,4 @@ def verify_chapa_payment(transaction_id):
     Returns:
         dict: Chapa API response
     """
-    if not settings.CHAPA_SECRET_KEY:
-        raise ValueError("CHAPA_SECRET_KEY is not configured")
-    
-    headers = {
-        'Authorization': f'Bearer {settings.CHAPA_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    verify_url = f"{settings.CHAPA_VERIFY_URL}{transaction_id}"
-    
-    try:
-        response = requests.get(
-            verify_url,
-            headers=headers,
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        return {
-            'status': 'error',
-            'message': str(e)
-        }
+    return chapa.get_client().verify(transaction_id)
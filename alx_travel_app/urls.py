@@ -19,6 +19,7 @@ from django.urls import path, re_path, include
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
+from alx_travel_app.listings.metrics import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -34,6 +35,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     # API routes
     path('api/', include('alx_travel_app.listings.urls')),
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
     # Swagger documentation
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),